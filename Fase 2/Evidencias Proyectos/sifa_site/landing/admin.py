@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Residente, Producto, Receta, OrdenMedicamento, HoraProgramada, Administracion
+from .models import Residente, Producto, Receta, OrdenMedicamento, HoraProgramada, Administracion, MovimientoStock, MensajeSaliente, TrabajoPDF, ExportacionRegistros, SugerenciaExterna, MedicamentoCatalogo, ContadorAdministracion, CambioAdministracion, CambioSync, TokenApi
 
 @admin.register(Residente)
 class ResidenteAdmin(admin.ModelAdmin):
@@ -36,3 +36,62 @@ class AdministracionAdmin(admin.ModelAdmin):
     list_display = ("residente", "orden", "programada_para", "estado", "realizada_por")
     list_filter = ("estado", "programada_para")
     search_fields = ("residente__nombre_completo",)
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ("creado_en", "orden", "tipo", "cantidad", "usuario")
+    list_filter = ("tipo",)
+    raw_id_fields = ("orden", "administracion")
+
+@admin.register(MensajeSaliente)
+class MensajeSalienteAdmin(admin.ModelAdmin):
+    list_display = ("creado_en", "estado", "intentos", "proximo_intento", "enviado_en")
+    list_filter = ("estado",)
+    search_fields = ("texto", "ultimo_error")
+
+@admin.register(TrabajoPDF)
+class TrabajoPDFAdmin(admin.ModelAdmin):
+    list_display = ("creado_en", "residente", "year", "month", "estado", "intentos", "terminado_en")
+    list_filter = ("estado",)
+    raw_id_fields = ("residente", "solicitado_por")
+
+@admin.register(ExportacionRegistros)
+class ExportacionRegistrosAdmin(admin.ModelAdmin):
+    list_display = ("creado_en", "year", "month", "estado", "hechos", "total", "desde_cache", "terminado_en")
+    list_filter = ("estado",)
+
+@admin.register(SugerenciaExterna)
+class SugerenciaExternaAdmin(admin.ModelAdmin):
+    list_display = ("proveedor", "clave", "creado_en", "expira_en")
+    list_filter = ("proveedor",)
+    search_fields = ("clave",)
+
+@admin.register(MedicamentoCatalogo)
+class MedicamentoCatalogoAdmin(admin.ModelAdmin):
+    list_display = ("nombre", "potencia", "forma", "fuente", "registro", "activo", "actualizado_en")
+    list_filter = ("fuente", "activo")
+    search_fields = ("registro", "nombre")
+
+@admin.register(ContadorAdministracion)
+class ContadorAdministracionAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "hora", "residente", "estado", "n")
+    list_filter = ("estado", "fecha")
+    raw_id_fields = ("residente",)
+
+@admin.register(CambioAdministracion)
+class CambioAdministracionAdmin(admin.ModelAdmin):
+    list_display = ("creado_en", "administracion", "estado", "realizada_por")
+    list_filter = ("estado",)
+    raw_id_fields = ("administracion", "residente", "realizada_por")
+
+@admin.register(CambioSync)
+class CambioSyncAdmin(admin.ModelAdmin):
+    list_display = ("id", "creado_en", "tipo", "objeto_id", "fecha")
+    list_filter = ("tipo",)
+
+@admin.register(TokenApi)
+class TokenApiAdmin(admin.ModelAdmin):
+    list_display = ("usuario", "nombre", "activo", "creado_en", "usado_en")
+    list_filter = ("activo",)
+    raw_id_fields = ("usuario",)
+    readonly_fields = ("clave",)
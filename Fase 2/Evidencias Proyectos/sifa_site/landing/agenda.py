@@ -0,0 +1,259 @@
+# landing/agenda.py
+"""
+Materialización de la agenda de administraciones.
+
+Genera los registros PENDIENTE de Administracion a partir de las órdenes
+vigentes para un rango de días (hoy + N días) y rellena los días pasados que
+nunca se generaron. Se ejecuta fuera del request (comando
+`manage.py materializar_agenda` o tarea programada); las vistas de lectura ya
+no escriben. La restricción única (orden, programada_para) hace que insertar
+dos veces lo mismo sea inofensivo.
+
+Los cambios de recetas, órdenes, horas o residentes (ver landing/signals.py)
+regeneran solo las órdenes afectadas con regenerar_ordenes().
+
+Las inserciones en bloque recalculan en la misma transacción los contadores
+por hora y estado (landing.contadores); los borrados pasan por las señales.
+"""
+import threading
+import weakref
+from datetime import datetime, time as dtime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import contadores, sincronizacion
+from .models import Administracion, DiaMaterializado, OrdenMedicamento
+from .registro import invalidar_snapshots, mes_cerrado
+
+
+def horizonte_dias():
+    """Días hacia adelante (además de hoy) que se dejan generados."""
+    return int(getattr(settings, "SIFA_AGENDA_HORIZONTE_DIAS", 2))
+
+
+def backfill_dias():
+    """Máximo de días hacia atrás que se revisan buscando huecos."""
+    return int(getattr(settings, "SIFA_AGENDA_BACKFILL_DIAS", 7))
+
+
+def _dias(desde, hasta):
+    d = desde
+    while d <= hasta:
+        yield d
+        d += timedelta(days=1)
+
+
+def _tramos(fechas):
+    """Agrupa fechas ordenadas en tramos consecutivos [(desde, hasta), ...]."""
+    out = []
+    for d in sorted(fechas):
+        if out and out[-1][1] + timedelta(days=1) == d:
+            out[-1] = (out[-1][0], d)
+        else:
+            out.append((d, d))
+    return out
+
+
+def ordenes_vigentes(desde, hasta, ordenes=None):
+    """Órdenes activas de recetas activas cuyo periodo toca [desde, hasta]."""
+    qs = (
+        OrdenMedicamento.objects
+        .filter(activo=True, receta__activa=True, receta__residente__activo=True,
+                receta__inicio__lte=hasta)
+        .filter(Q(receta__fin__isnull=True) | Q(receta__fin__gte=desde))
+        .select_related('receta')
+        .prefetch_related('horas')
+    )
+    if ordenes is not None:
+        qs = qs.filter(pk__in=[getattr(o, 'pk', o) for o in ordenes])
+    return qs
+
+
+def eventos_de_orden(orden, desde, hasta, tz=None):
+    """Instancias Administracion (sin guardar) que tocan a la orden en [desde, hasta]."""
+    tz = tz or timezone.get_current_timezone()
+    receta = orden.receta
+    ini = max(desde, receta.inicio)
+    fin = min(hasta, receta.fin) if receta.fin else hasta
+    horas = list(orden.horas.all())
+
+    out = []
+    for d in _dias(ini, fin):
+        dia_sem = d.weekday()  # L=0..D=6, mismo mapping que HoraProgramada.Dia
+        for h in horas:
+            if h.dia_semana is not None and h.dia_semana != dia_sem:
+                continue
+            out.append(Administracion(
+                orden_id=orden.id,
+                residente_id=receta.residente_id,
+                programada_para=timezone.make_aware(datetime.combine(d, h.hora), tz),
+                estado=Administracion.Estado.PENDIENTE,
+            ))
+    return out
+
+
+def materializar_eventos(desde, hasta, ordenes=None, batch_size=500):
+    """
+    Inserta en bloque los eventos PENDIENTE de [desde, hasta].
+    Los que ya existen se ignoran (ON CONFLICT DO NOTHING sobre orden+programada_para).
+    Si se pasa `ordenes`, solo se generan esas. Devuelve la cantidad de candidatos.
+    """
+    tz = timezone.get_current_timezone()
+    nuevos = []
+    for orden in ordenes_vigentes(desde, hasta, ordenes):
+        nuevos.extend(eventos_de_orden(orden, desde, hasta, tz))
+    if nuevos:
+        with transaction.atomic():
+            # Casi siempre la mayoría ya existe: a la API solo se anuncia lo que falta
+            inicio = timezone.make_aware(datetime.combine(desde, dtime.min), tz)
+            fin = timezone.make_aware(datetime.combine(hasta, dtime.max), tz)
+            existentes = set(
+                Administracion.objects
+                .filter(programada_para__range=(inicio, fin), orden_id__in={e.orden_id for e in nuevos})
+                .values_list('orden_id', 'programada_para')
+            )
+            faltan = [e for e in nuevos if (e.orden_id, e.programada_para) not in existentes]
+            Administracion.objects.bulk_create(nuevos, batch_size=batch_size, ignore_conflicts=True)
+            # bulk_create no dispara señales: contadores, snapshots y la API se ponen al día aquí
+            contadores.recalcular(desde, hasta, None if ordenes is None else {e.residente_id for e in nuevos})
+            sincronizacion.registrar_dias(faltan)
+        if mes_cerrado(desde.year, desde.month):
+            invalidar_snapshots(fechas=[d for d in _dias(desde, hasta) if d.day == 1 or d == desde])
+    return len(nuevos)
+
+
+def materializar_agenda(hoy=None, horizonte=None, backfill=None):
+    """
+    Deja generada la agenda de hoy..hoy+horizonte y rellena los días de los
+    últimos `backfill` días que no quedaron registrados en DiaMaterializado.
+    Devuelve la lista de días procesados.
+    """
+    hoy = hoy or timezone.localdate()
+    horizonte = horizonte_dias() if horizonte is None else horizonte
+    backfill = backfill_dias() if backfill is None else backfill
+
+    desde_backfill = hoy - timedelta(days=backfill)
+    hechos = set(
+        DiaMaterializado.objects
+        .filter(fecha__gte=desde_backfill, fecha__lt=hoy)
+        .values_list('fecha', flat=True)
+    )
+    dias = [d for d in _dias(desde_backfill, hoy - timedelta(days=1)) if d not in hechos]
+    dias += list(_dias(hoy, hoy + timedelta(days=horizonte)))
+
+    with transaction.atomic():
+        for ini, fin in _tramos(dias):
+            materializar_eventos(ini, fin)
+        DiaMaterializado.objects.bulk_create(
+            [DiaMaterializado(fecha=d) for d in dias], ignore_conflicts=True
+        )
+    return dias
+
+
+def regenerar_ordenes(orden_ids, hoy=None):
+    """
+    Recalcula la agenda de hoy..hoy+horizonte solo para esas órdenes.
+    Compara las horas esperadas con los eventos que ya existen: inserta los que
+    faltan y borra los PENDIENTE que ya no corresponden (hora quitada, orden o
+    receta inactiva, residente dado de baja). Los eventos ya marcados no se tocan.
+    Devuelve (insertados, borrados).
+    """
+    ids = {getattr(o, 'pk', o) for o in orden_ids}
+    ids.discard(None)
+    if not ids:
+        return 0, 0
+
+    hoy = hoy or timezone.localdate()
+    hasta = hoy + timedelta(days=horizonte_dias())
+    tz = timezone.get_current_timezone()
+    inicio = timezone.make_aware(datetime.combine(hoy, dtime.min), tz)
+    fin = timezone.make_aware(datetime.combine(hasta, dtime.max), tz)
+
+    esperados = {}
+    for orden in ordenes_vigentes(hoy, hasta, ids):
+        for ev in eventos_de_orden(orden, hoy, hasta, tz):
+            esperados[(ev.orden_id, ev.programada_para)] = ev
+
+    existentes = (
+        Administracion.objects
+        .filter(orden_id__in=ids, programada_para__range=(inicio, fin))
+        .values_list('id', 'orden_id', 'programada_para', 'estado')
+    )
+    presentes, sobran = set(), []
+    for pk, orden_id, programada, estado in existentes:
+        key = (orden_id, programada)
+        if key in esperados:
+            presentes.add(key)
+        elif estado == Administracion.Estado.PENDIENTE:
+            sobran.append(pk)
+    faltan = [ev for key, ev in esperados.items() if key not in presentes]
+
+    with transaction.atomic():
+        if sobran:
+            Administracion.objects.filter(pk__in=sobran).delete()
+        if faltan:
+            Administracion.objects.bulk_create(faltan, ignore_conflicts=True)
+            # Los borrados descuentan por señal; lo insertado en bloque se recuenta
+            contadores.recalcular(hoy, hasta, {ev.residente_id for ev in faltan})
+            sincronizacion.registrar_dias(faltan)
+    return len(faltan), len(sobran)
+
+
+def podar_pendientes(orden_ids, hoy=None):
+    """Borra los eventos PENDIENTE desde hoy de esas órdenes (antes de eliminarlas)."""
+    hoy = hoy or timezone.localdate()
+    inicio = timezone.make_aware(datetime.combine(hoy, dtime.min), timezone.get_current_timezone())
+    deleted, _ = (
+        Administracion.objects
+        .filter(orden_id__in=list(orden_ids), programada_para__gte=inicio,
+                estado=Administracion.Estado.PENDIENTE)
+        .delete()
+    )
+    return deleted
+
+
+# --- Regeneración diferida (una sola vez por transacción) ---
+# El hilo guarda solo una referencia débil al lote: la única fuerte es la de
+# on_commit. Si la transacción (o el savepoint donde se registró) se revierte,
+# Django suelta el callback, el lote desaparece y la próxima señal empieza uno
+# nuevo; al confirmar, el propio callback lo olvida.
+_pendientes = threading.local()
+
+
+class _Lote:
+    """Órdenes por regenerar al confirmar una transacción (el callback de on_commit)."""
+
+    def __init__(self):
+        self.ids = set()
+
+    def __call__(self):
+        if _lote_vigente() is self:
+            _pendientes.lote = None
+        regenerar_ordenes(self.ids)
+
+
+def _lote_vigente():
+    ref = getattr(_pendientes, 'lote', None)
+    return ref() if ref is not None else None
+
+
+def programar_regeneracion(orden_ids):
+    """
+    Marca órdenes para regenerar al confirmar la transacción en curso.
+    Varias señales dentro del mismo atomic (orden + N horas) se resuelven en una
+    sola pasada de regenerar_ordenes; si la transacción se revierte, se olvidan.
+    """
+    ids = {i for i in orden_ids if i is not None}
+    if not ids:
+        return
+    lote = _lote_vigente()
+    if lote is not None:
+        lote.ids |= ids
+        return
+    lote = _Lote()
+    lote.ids |= ids
+    _pendientes.lote = weakref.ref(lote)
+    transaction.on_commit(lote)   # fuera de un atomic corre en el acto
@@ -0,0 +1,206 @@
+# landing/busqueda.py
+"""
+Búsqueda del catálogo de Producto (igual en SQLite y PostgreSQL).
+
+- Producto.busqueda guarda "nombre potencia forma" normalizado (sin tildes,
+  minúsculas; lo calcula Producto.save).
+- ProductoPalabra (una fila por palabra de busqueda) y ProductoTrigrama (los
+  trigramas de cada palabra del nombre, "  a", " am", "amo"...; la forma y la
+  potencia repiten los mismos en todo el catálogo) se mantienen desde la
+  señal post_save de Producto, o con indexar_productos tras un bulk_create.
+
+Primero se busca por prefijo: los productos que empiezan con toda la
+búsqueda (rango sobre Producto.busqueda) y luego aquellos en que cada palabra
+escrita es el comienzo de alguna palabra del producto (rango sobre el índice
+de ProductoPalabra). Ambas pasadas ordenan en SQL, los más cortos primero,
+antes de cortar: con un prefijo común ("para") la coincidencia exacta no queda
+fuera de los candidatos. Si eso no llena el límite, se completa con
+coincidencias aproximadas por trigramas, que toleran errores de tipeo
+("amoxicilna").
+
+El catálogo de referencia importado (MedicamentoCatalogo) se busca solo por
+prefijo de la búsqueda completa, con un rango sobre su columna busqueda.
+
+El directorio de residentes usa el mismo índice por palabra
+(ResidentePalabra, desde la señal post_save de Residente): cada palabra
+escrita es un rango sobre el índice, nunca un LIKE '%...%' sobre la tabla.
+"""
+from math import ceil
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import Length
+
+from .models import MedicamentoCatalogo, Producto, ProductoPalabra, ProductoTrigrama, ResidentePalabra
+from .texto import normalizar, rango_prefijo
+
+UMBRAL = 0.5          # fracción mínima de trigramas de la búsqueda que deben coincidir
+CANDIDATOS = 4        # se piden limit * CANDIDATOS al índice antes de reordenar
+MIN_APROXIMADO = 4    # con menos letras un error de tipeo no se distingue de otra palabra
+
+
+def trigramas(texto, prefijo=False):
+    """
+    Trigramas de cada palabra de `texto` (ya normalizado), con dos espacios a
+    la izquierda y uno a la derecha, como pg_trgm. Con prefijo=True no se
+    cierra la palabra por la derecha (lo que se está escribiendo).
+    """
+    out = set()
+    for palabra in texto.split():
+        p = "  " + palabra + ("" if prefijo else " ")
+        out.update(p[i:i + 3] for i in range(len(p) - 2))
+    return out
+
+
+def _insertar_indice(productos):
+    """
+    Inserta palabras y trigramas de `productos` con executemany: con miles de
+    productos, crear cientos de miles de instancias para bulk_create es lo
+    que más tarda.
+    """
+    palabras, tris = [], []
+    for p in productos:
+        palabras.extend((p.pk, w[:60]) for w in set(p.busqueda.split()))
+        tris.extend((p.pk, t) for t in trigramas(normalizar(p.nombre)))
+    qn = connection.ops.quote_name
+    with connection.cursor() as cur:
+        for modelo, campo, filas in ((ProductoPalabra, "palabra", palabras),
+                                     (ProductoTrigrama, "trigrama", tris)):
+            meta = modelo._meta
+            cur.executemany(
+                f"INSERT INTO {qn(meta.db_table)} ({qn(meta.get_field('producto').column)}, "
+                f"{qn(meta.get_field(campo).column)}) VALUES (%s, %s)",
+                filas,
+            )
+
+
+def indexar_productos(productos):
+    """Regenera el índice de `productos` (instancias con busqueda al día)."""
+    productos = list(productos)
+    if not productos:
+        return
+    ids = [p.pk for p in productos]
+    with transaction.atomic():
+        ProductoPalabra.objects.filter(producto__in=ids).delete()
+        ProductoTrigrama.objects.filter(producto__in=ids).delete()
+        _insertar_indice(productos)
+
+
+def reindexar_todos(lote=2000):
+    """Recalcula busqueda y el índice de todo el catálogo. Devuelve cuántos productos."""
+    n = 0
+    with transaction.atomic():
+        ProductoPalabra.objects.all().delete()
+        ProductoTrigrama.objects.all().delete()
+        ids = list(Producto.objects.order_by("pk").values_list("pk", flat=True))
+        for i in range(0, len(ids), lote):
+            productos = list(
+                Producto.objects.filter(pk__in=ids[i:i + lote]).only("nombre", "potencia", "forma", "busqueda")
+            )
+            cambiados = []
+            for p in productos:
+                clave = Producto.clave_busqueda(p.nombre, p.potencia, p.forma)
+                if p.busqueda != clave:
+                    p.busqueda = clave
+                    cambiados.append(p)
+            Producto.objects.bulk_update(cambiados, ["busqueda"], batch_size=200)
+            _insertar_indice(productos)
+            n += len(productos)
+    return n
+
+
+def _por_prefijo(nq, palabras, cuantos):
+    orden = (Length("busqueda"), "busqueda", "pk")
+    # Empiezan con toda la búsqueda: rango sobre el índice de busqueda
+    completos = list(
+        Producto.objects.filter(**rango_prefijo("busqueda", nq))
+        .order_by(*orden).values_list("pk", flat=True)[:cuantos]
+    )
+    if len(completos) >= cuantos:
+        return completos
+    qs = Producto.objects.exclude(pk__in=completos)
+    for w in palabras:
+        # un filter() por palabra: un JOIN por palabra (AND)
+        qs = qs.filter(**rango_prefijo("palabras__palabra", w))
+    return completos + list(qs.distinct().order_by(*orden).values_list("pk", flat=True)[:cuantos - len(completos)])
+
+
+def _aproximados(texto, cuantos, excluir):
+    buscados = trigramas(texto, prefijo=True)
+    minimo = max(1, ceil(len(buscados) * UMBRAL))
+    return list(
+        ProductoTrigrama.objects
+        .filter(trigrama__in=buscados)
+        .exclude(producto__in=excluir)
+        .values("producto_id")
+        .annotate(n=Count("producto_id"))
+        .filter(n__gte=minimo)
+        .order_by("-n", "producto_id")
+        .values_list("producto_id", flat=True)[:cuantos]
+    )
+
+
+def buscar_productos(q, limit=10):
+    """Productos que coinciden con `q`, del más al menos relevante."""
+    nq = normalizar(q)
+    if not nq:
+        return []
+    palabras = nq.split()
+    cuantos = limit * CANDIDATOS
+
+    exactos = _por_prefijo(nq, palabras, cuantos)
+    aproximados = []
+    if len(exactos) < limit and len(max(palabras, key=len)) >= MIN_APROXIMADO:
+        # La palabra más larga es la más selectiva ("500" o "mg" están en medio catálogo)
+        aproximados = _aproximados(max(palabras, key=len), cuantos, exactos)
+
+    productos = Producto.objects.in_bulk(exactos + aproximados)
+    todos = trigramas(nq, prefijo=True)
+
+    def por_prefijo(p):
+        return (not p.busqueda.startswith(nq), len(p.busqueda), p.busqueda)
+
+    def por_parecido(p):
+        return (-len(todos & trigramas(p.busqueda)), len(p.busqueda), p.busqueda)
+
+    out = sorted((productos[pk] for pk in exactos if pk in productos), key=por_prefijo)
+    out += sorted((productos[pk] for pk in aproximados if pk in productos), key=por_parecido)
+    return out[:limit]
+
+
+def buscar_catalogo(q, limit=10):
+    """Entradas activas del catálogo cuyo nombre normalizado empieza con `q`."""
+    nq = normalizar(q)
+    if not nq:
+        return []
+    qs = (MedicamentoCatalogo.objects.filter(activo=True, **rango_prefijo("busqueda", nq))
+          .order_by("busqueda", "pk")[:limit * CANDIDATOS])
+    # Con collation de idioma (PostgreSQL) el rango puede traer de más: se confirma el prefijo
+    return [m for m in qs if m.busqueda.startswith(nq)][:limit]
+
+
+# --- Directorio de residentes ---
+def indexar_residentes(residentes):
+    """Regenera las palabras de nombre_clave de `residentes` (instancias al día)."""
+    residentes = list(residentes)
+    if not residentes:
+        return
+    with transaction.atomic():
+        ResidentePalabra.objects.filter(residente__in=[r.pk for r in residentes]).delete()
+        ResidentePalabra.objects.bulk_create(
+            [ResidentePalabra(residente_id=r.pk, palabra=w) for r in residentes
+             for w in {w[:60] for w in r.nombre_clave.split()}],
+            batch_size=2000,
+        )
+
+
+def filtrar_por_nombre(qs, nq):
+    """
+    Residentes de `qs` en que cada palabra de `nq` (normalizado) es el comienzo
+    de una palabra del nombre. Subconsulta por palabra (no JOIN): no duplica
+    filas y el orden de la paginación sigue siendo el de `qs`.
+    """
+    for w in nq.split():
+        qs = qs.filter(pk__in=ResidentePalabra.objects.filter(**rango_prefijo("palabra", w[:60]))
+                       .values("residente_id"))
+    return qs
@@ -0,0 +1,171 @@
+# landing/catalogo.py
+"""
+Importación del catálogo nacional de medicamentos (archivo descargado de
+CIMA o RxNorm) a MedicamentoCatalogo, para sugerir sin salir a internet.
+
+- Lee CSV o JSON: la lista de /medicamentos de CIMA ({"resultados": [...]}
+  o lista), el drugs.json/allconcepts de RxNorm, o un CSV con cabecera
+  (registro/nregistro/rxcui, nombre/name, potencia/dosis, forma, laboratorio).
+- Upsert por (fuente, registro). Se compara una huella (sha1) de los campos:
+  solo se insertan los nuevos y se actualizan los que cambiaron; el resto no
+  se toca. Con desactivar_faltantes, los que ya no vienen quedan inactivos.
+- Todo en una transacción, con bulk_create/bulk_update por lotes: 50k filas
+  son segundos.
+"""
+import csv
+import hashlib
+import io
+import json
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MedicamentoCatalogo
+from .texto import normalizar
+
+LOTE = 2000
+
+# Nombres de columna aceptados (CSV propio, CIMA, RxNorm) -> campo
+_ALIAS = {
+    "registro": ("registro", "nregistro", "rxcui", "codigo", "id"),
+    "nombre": ("nombre", "name", "descripcion"),
+    "potencia": ("potencia", "dosis", "strength"),
+    "forma": ("forma", "formafarmaceutica", "forma_farmaceutica", "dose_form"),
+    "laboratorio": ("laboratorio", "labtitular", "lab", "fabricante"),
+    "activo": ("activo", "comerc", "autorizado"),
+}
+
+
+@dataclass
+class Resultado:
+    leidos: int = 0
+    nuevos: int = 0
+    actualizados: int = 0
+    sin_cambios: int = 0
+    desactivados: int = 0
+    descartados: int = 0   # sin registro o sin nombre
+
+
+def _texto(v):
+    if isinstance(v, dict):  # CIMA: {"id": 1, "nombre": "COMPRIMIDO"}
+        v = v.get("nombre") or v.get("name") or ""
+    return str(v).strip() if v is not None else ""
+
+
+def _activo(v):
+    if v is None or v == "":
+        return True
+    if isinstance(v, bool):
+        return v
+    return str(v).strip().lower() not in ("0", "false", "no", "n", "f")
+
+
+def normalizar_fila(fila):
+    """Dict de origen -> dict con los campos del modelo (o None si no sirve)."""
+    claves = {k.lower().strip(): v for k, v in fila.items() if isinstance(k, str)}
+    out = {}
+    for campo, alias in _ALIAS.items():
+        out[campo] = next((claves[a] for a in alias if a in claves), None)
+    registro, nombre = _texto(out["registro"]), _texto(out["nombre"])
+    if not registro or not nombre:
+        return None
+    datos = {
+        "registro": registro[:40],
+        "nombre": nombre[:255],
+        "potencia": _texto(out["potencia"])[:80],
+        "forma": _texto(out["forma"])[:80],
+        "laboratorio": _texto(out["laboratorio"])[:160],
+        "activo": _activo(out["activo"]),
+    }
+    if "suppress" in claves:  # RxNorm: N = vigente, O/E/Y = suprimido
+        datos["activo"] = _texto(claves["suppress"]).upper() in ("", "N")
+    datos["busqueda"] = normalizar(f"{datos['nombre']} {datos['potencia']} {datos['forma']}")[:400]
+    datos["huella"] = hashlib.sha1(
+        "\x1f".join(str(datos[c]) for c in ("nombre", "potencia", "forma", "laboratorio", "activo")).encode()
+    ).hexdigest()
+    return datos
+
+
+def leer_filas(archivo, formato="auto"):
+    """Genera los dicts de origen de `archivo` (ruta o archivo de texto)."""
+    if isinstance(archivo, str):
+        with open(archivo, encoding="utf-8-sig", newline="") as f:
+            yield from leer_filas(f, formato if formato != "auto" else
+                                  ("json" if archivo.lower().endswith((".json", ".jsonl")) else "csv"))
+        return
+    if formato == "auto":
+        contenido = archivo.read()
+        formato = "json" if contenido.lstrip()[:1] in ("[", "{") else "csv"
+        archivo = io.StringIO(contenido)
+    if formato == "csv":
+        muestra = archivo.read(4096)
+        archivo.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t|")
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.DictReader(archivo, dialect=dialecto)
+        return
+
+    texto = archivo.read()
+    try:
+        data = json.loads(texto)
+    except json.JSONDecodeError:  # JSON lines
+        data = [json.loads(l) for l in texto.splitlines() if l.strip()]
+    if isinstance(data, dict):
+        if "resultados" in data:                      # CIMA
+            data = data["resultados"]
+        elif "drugGroup" in data:                     # RxNorm drugs.json
+            data = [p for g in (data["drugGroup"].get("conceptGroup") or [])
+                    for p in (g.get("conceptProperties") or [])]
+        elif "minConceptGroup" in data:               # RxNorm allconcepts.json
+            data = data["minConceptGroup"].get("minConcept") or []
+        else:
+            data = [data]
+    yield from data
+
+
+def importar(filas, fuente, desactivar_faltantes=False):
+    """Upsert de `filas` (dicts de origen) en MedicamentoCatalogo. Devuelve un Resultado."""
+    res = Resultado()
+    vistos = {}
+    for fila in filas:
+        res.leidos += 1
+        datos = normalizar_fila(fila)
+        if datos is None:
+            res.descartados += 1
+            continue
+        vistos[datos["registro"]] = datos  # si se repite, gana la última
+
+    campos = ["nombre", "potencia", "forma", "laboratorio", "activo", "busqueda", "huella"]
+    with transaction.atomic():
+        existentes = {
+            reg: (pk, huella)
+            for pk, reg, huella in MedicamentoCatalogo.objects.filter(fuente=fuente)
+            .values_list("pk", "registro", "huella").iterator(chunk_size=LOTE)
+        }
+        nuevos, cambiados, ahora = [], [], timezone.now()
+        for reg, datos in vistos.items():
+            previo = existentes.get(reg)
+            if previo is None:
+                nuevos.append(MedicamentoCatalogo(fuente=fuente, **datos))
+            elif previo[1] != datos["huella"]:
+                cambiados.append(MedicamentoCatalogo(pk=previo[0], fuente=fuente, actualizado_en=ahora, **datos))
+            else:
+                res.sin_cambios += 1
+
+        MedicamentoCatalogo.objects.bulk_create(nuevos, batch_size=LOTE)
+        # bulk_update arma un CASE por campo: lotes chicos rinden más que uno grande
+        MedicamentoCatalogo.objects.bulk_update(cambiados, campos + ["actualizado_en"], batch_size=500)
+        res.nuevos, res.actualizados = len(nuevos), len(cambiados)
+
+        if desactivar_faltantes:
+            faltantes = [pk for reg, (pk, _) in existentes.items() if reg not in vistos]
+            for i in range(0, len(faltantes), LOTE):
+                res.desactivados += (
+                    MedicamentoCatalogo.objects
+                    .filter(pk__in=faltantes[i:i + LOTE], activo=True)
+                    .update(activo=False, huella="", actualizado_en=ahora)
+                )
+    return res
@@ -0,0 +1,128 @@
+# landing/contadores.py
+"""
+Contadores de administraciones por (día, hora local, residente, estado).
+
+En vez de contar Administracion en cada carga del dashboard o de la página
+de hoy, cada cambio suma o resta en ContadorAdministracion dentro de la misma
+transacción:
+
+- Un evento guardado o borrado de a uno: señales de landing.signals.
+- Marcado en bloque (views._marcar_en_bloque): transicion().
+- Agenda generada o regenerada en bloque (landing.agenda): recalcular() de
+  los días y residentes tocados, porque bulk_create con ignore_conflicts no
+  dice cuáles insertó.
+
+Leer es una consulta agregada sobre unas pocas filas por residente y hora.
+Si el cálculo se desalinea (SQL directo, cambio de TIME_ZONE), el comando
+recalcular_contadores lo reconstruye desde Administracion.
+"""
+from collections import Counter
+from datetime import datetime, time as dtime
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Administracion, ContadorAdministracion
+
+
+def clave(programada_para):
+    """(fecha, hora HH:MM) locales de un evento."""
+    local = timezone.localtime(programada_para)
+    return local.date(), local.time().replace(second=0, microsecond=0)
+
+
+def aplicar(cambios):
+    """`cambios`: iterable de (residente_id, programada_para, estado, +n/-n)."""
+    acumulado = Counter()
+    for residente_id, programada_para, estado, d in cambios:
+        acumulado[(*clave(programada_para), residente_id, estado)] += d
+    with transaction.atomic():
+        for (fecha, hora, residente_id, estado), d in acumulado.items():
+            if not d:
+                continue
+            fila = ContadorAdministracion.objects.filter(
+                fecha=fecha, hora=hora, residente_id=residente_id, estado=estado
+            )
+            if fila.update(n=Greatest(F("n") + d, 0)) or d < 0:
+                continue
+            _, creado = ContadorAdministracion.objects.get_or_create(
+                fecha=fecha, hora=hora, residente_id=residente_id, estado=estado, defaults={"n": d}
+            )
+            if not creado:  # otro proceso la creó entre medio
+                fila.update(n=F("n") + d)
+
+
+def transicion(eventos, nuevo):
+    """`eventos`: iterable de (residente_id, programada_para, estado_anterior) que pasan a `nuevo`."""
+    cambios = []
+    for residente_id, programada_para, anterior in eventos:
+        if anterior != nuevo:
+            cambios += [(residente_id, programada_para, anterior, -1),
+                        (residente_id, programada_para, nuevo, 1)]
+    aplicar(cambios)
+
+
+def recalcular(desde, hasta, residentes=None):
+    """
+    Reconstruye los contadores de [desde, hasta] (fechas locales) desde Administracion.
+
+    Las filas del rango se bloquean y se borran antes de contar, en la misma
+    transacción: un aplicar() concurrente espera al bloqueo (y su evento ya
+    está confirmado cuando se cuenta) o llega después y suma sobre la fila
+    nueva. Si otro proceso crea una fila que no existía entre medio, el
+    INSERT choca y se vuelve a intentar.
+    """
+    tz = timezone.get_current_timezone()
+    inicio = timezone.make_aware(datetime.combine(desde, dtime.min), tz)
+    fin = timezone.make_aware(datetime.combine(hasta, dtime.max), tz)
+    eventos = Administracion.objects.filter(programada_para__range=(inicio, fin))
+    contadores = ContadorAdministracion.objects.filter(fecha__range=(desde, hasta))
+    if residentes is not None:
+        residentes = list(residentes)
+        eventos = eventos.filter(residente_id__in=residentes)
+        contadores = contadores.filter(residente_id__in=residentes)
+
+    for intento in range(3):
+        try:
+            with transaction.atomic():
+                list(contadores.select_for_update().values_list("pk", flat=True))
+                contadores.delete()
+                acumulado = Counter(
+                    (*clave(prog), residente_id, estado)
+                    for residente_id, prog, estado in
+                    eventos.values_list("residente_id", "programada_para", "estado").iterator(chunk_size=2000)
+                )
+                ContadorAdministracion.objects.bulk_create(
+                    [ContadorAdministracion(fecha=f, hora=h, residente_id=r, estado=e, n=n)
+                     for (f, h, r, e), n in acumulado.items()],
+                    batch_size=1000,
+                )
+            return sum(acumulado.values())
+        except IntegrityError:
+            if intento == 2:
+                raise
+
+
+def _del_dia(fecha, residentes):
+    qs = ContadorAdministracion.objects.filter(fecha=fecha, n__gt=0)
+    if residentes is not None:
+        qs = qs.filter(residente_id__in=residentes)
+    return qs
+
+
+def totales(fecha, residentes=None):
+    """{estado: n} del día. `residentes` puede ser una lista o un queryset de ids."""
+    return dict(_del_dia(fecha, residentes).values_list("estado").annotate(total=Sum("n")).order_by())
+
+
+def por_hora(fecha, residentes=None):
+    """[(“HH:MM”, total, pendientes)] del día, en orden de hora."""
+    horas = {}
+    filas = (_del_dia(fecha, residentes).values_list("hora", "estado")
+             .annotate(total=Sum("n")).order_by("hora"))
+    for hora, estado, n in filas:
+        total, pendientes = horas.get(hora, (0, 0))
+        horas[hora] = (total + n, pendientes + (n if estado == Administracion.Estado.PENDIENTE else 0))
+    return [(h.strftime("%H:%M"), total, pendientes) for h, (total, pendientes) in horas.items()]
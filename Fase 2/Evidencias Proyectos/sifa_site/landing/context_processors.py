@@ -0,0 +1,21 @@
+# landing/context_processors.py
+from .roles import is_admin, is_cuidadora, is_doctor, is_tens, roles_de
+
+
+def roles(request):
+    """
+    Expone los roles del usuario a todos los templates como `roles`:
+    {{ roles.admin }}, {{ roles.tens }}, {{ roles.cuidadora }}, {{ roles.doctor }}.
+    Se resuelven una sola vez por request (ver landing.roles.roles_de).
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return {"roles": {"admin": False, "tens": False, "cuidadora": False,
+                          "doctor": False, "nombres": frozenset()}}
+    return {"roles": {
+        "admin": is_admin(user),
+        "tens": is_tens(user),
+        "cuidadora": is_cuidadora(user),
+        "doctor": is_doctor(user),
+        "nombres": roles_de(user),
+    }}
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Residente, Receta, OrdenMedicamento, Administracion, Producto
+from .texto import normalizar_rut
 
 class ResidenteForm(forms.ModelForm):
     class Meta:
@@ -14,6 +15,16 @@ class ResidenteForm(forms.ModelForm):
             'activo': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
+    def clean_rut(self):
+        rut = self.cleaned_data['rut'].strip()
+        # "12.345.678-5" y "123456785" son el mismo residente
+        otros = Residente.objects.filter(rut_normalizado=normalizar_rut(rut))
+        if self.instance.pk:
+            otros = otros.exclude(pk=self.instance.pk)
+        if normalizar_rut(rut) and otros.exists():
+            raise forms.ValidationError("Ya existe un residente con ese RUT.")
+        return rut
+
 class RecetaForm(forms.ModelForm):
     class Meta:
         model = Receta
@@ -55,11 +66,14 @@ class ProductoQuickForm(forms.Form):
     def create_if_filled(self):
         cd = self.cleaned_data
         if cd.get('nombre'):
-            return Producto.objects.create(
-                nombre=cd['nombre'].strip(),
-                potencia=cd.get('potencia','').strip(),
-                forma=cd.get('forma','').strip()
-            )
+            nombre = cd['nombre'].strip()
+            potencia = cd.get('potencia','').strip()
+            forma = cd.get('forma','').strip()
+            # Elegido de nuevo desde las sugerencias (local o catálogo): no duplicar
+            existente = Producto.objects.filter(
+                busqueda=Producto.clave_busqueda(nombre, potencia, forma)
+            ).order_by('id').first()
+            return existente or Producto.objects.create(nombre=nombre, potencia=potencia, forma=forma)
         return None
 
 class AdminMarcarForm(forms.ModelForm):
@@ -76,6 +90,7 @@ class AdminMarcarForm(forms.ModelForm):
 # landing/forms.py                  CRUD USUARIOS
 from django import forms
 from django.contrib.auth.models import User, Group
+from .roles import invalidar_roles
 
 ROLE_CHOICES = [
     ("ADMIN", "Admin"),
@@ -92,11 +107,13 @@ def assign_single_role(user: User, role_name: str):
     # Quita los roles conocidos y asigna solo el seleccionado
     known = {r for r, _ in ROLE_CHOICES}
     # Remueve
-    for g in user.groups.all():
-        if g.name in known:
-            user.groups.remove(g)
+    quitar = [g for g in user.groups.all() if g.name in known and g.name != role_name]
+    if quitar:
+        user.groups.remove(*quitar)
     # Asigna
     user.groups.add(_ensure_role_group(role_name))
+    # m2m_changed ya invalida; esto cubre el objeto user en memoria
+    invalidar_roles(user)
 
 class AdminUserCreateForm(forms.ModelForm):
     role = forms.ChoiceField(choices=ROLE_CHOICES, label="Rol")
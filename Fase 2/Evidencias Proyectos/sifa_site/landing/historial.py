@@ -0,0 +1,91 @@
+# landing/historial.py
+"""
+Exportación del historial de administraciones a CSV (vista y comando).
+
+Se recorre por keyset (programada_para, id) en lotes cortos: cada lote es una
+consulta completa y breve, así no queda un cursor abierto durante toda la
+descarga (en SQLite un cursor de lectura abierto bloquea a quien escribe) y la
+memoria se mantiene constante aunque sean años de datos.
+"""
+import csv
+from datetime import datetime, time as dtime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Administracion
+
+COLUMNAS = [
+    "fecha_hora", "residente", "rut", "producto", "dosis", "estado",
+    "realizada_por", "observacion",
+]
+_CAMPOS = (
+    "id", "programada_para", "residente__nombre_completo", "residente__rut",
+    "orden__producto__nombre", "orden__producto__potencia", "orden__dosis", "estado",
+    "realizada_por__username", "realizada_por__first_name", "realizada_por__last_name",
+    "observacion",
+)
+
+
+def historial(desde=None, hasta=None, residente=None, producto=None, cuidadora=None):
+    """Administraciones filtradas (fechas locales inclusive), sin ordenar ni evaluar."""
+    tz = timezone.get_current_timezone()
+    qs = Administracion.objects.all()
+    if desde:
+        qs = qs.filter(programada_para__gte=timezone.make_aware(datetime.combine(desde, dtime.min), tz))
+    if hasta:
+        qs = qs.filter(programada_para__lt=timezone.make_aware(
+            datetime.combine(hasta + timedelta(days=1), dtime.min), tz))
+    if residente:
+        qs = qs.filter(residente_id=residente)
+    if producto:
+        qs = qs.filter(orden__producto_id=producto)
+    if cuidadora:
+        qs = qs.filter(realizada_por_id=cuidadora)
+    return qs
+
+
+def recorrer(qs, lote=2000):
+    """Tuplas de _CAMPOS en orden (programada_para, id), de a `lote` por consulta."""
+    qs = qs.order_by("programada_para", "id").values_list(*_CAMPOS)
+    ultimo = None
+    while True:
+        pagina = qs
+        if ultimo is not None:
+            t, pk = ultimo
+            pagina = qs.filter(Q(programada_para__gt=t) | Q(programada_para=t, id__gt=pk))
+        filas = list(pagina[:lote])
+        if not filas:
+            return
+        yield from filas
+        ultimo = filas[-1][1], filas[-1][0]
+        if len(filas) < lote:
+            return
+
+
+def _fila(r, tz, estados):
+    (_pk, programada, residente, rut, nombre, potencia, dosis, estado,
+     username, first, last, observacion) = r
+    quien = f"{first or ''} {last or ''}".strip() or (username or "")
+    return [
+        programada.astimezone(tz).strftime("%Y-%m-%d %H:%M"),
+        residente, rut, f"{nombre} {potencia}".strip(), dosis,
+        estados.get(estado, estado), quien, observacion,
+    ]
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla."""
+    def write(self, value):
+        return value
+
+
+def lineas_csv(qs, lote=2000, encabezado=True):
+    """Genera el CSV línea a línea (para StreamingHttpResponse o un archivo)."""
+    writer = csv.writer(_Eco())
+    tz = timezone.get_current_timezone()
+    estados = dict(Administracion.Estado.choices)
+    if encabezado:
+        yield writer.writerow(COLUMNAS)
+    for r in recorrer(qs, lote):
+        yield writer.writerow(_fila(r, tz, estados))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from landing.notifications import entregar_pendientes, enviar_resumen_alertas
+
+
+class Command(BaseCommand):
+    help = (
+        "Arma los resúmenes de stock crítico vencidos y entrega los mensajes pendientes "
+        "del outbox (MensajeSaliente) con reintentos y backoff. Con --loop queda corriendo como worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="No terminar: revisar cada --intervalo segundos.")
+        parser.add_argument("--intervalo", type=float, default=5.0)
+        parser.add_argument("--limite", type=int, default=50, help="Mensajes por pasada.")
+
+    def handle(self, *args, **opts):
+        while True:
+            resumenes = enviar_resumen_alertas()
+            if resumenes:
+                self.stdout.write(f"Resumen de stock crítico: {resumenes} mensaje(s) en cola.")
+            enviados, fallidos = entregar_pendientes(limite=opts["limite"])
+            if enviados or fallidos:
+                self.stdout.write(f"Outbox: {enviados} enviado(s), {fallidos} con error.")
+            if not opts["loop"]:
+                break
+            close_old_connections()
+            if not (enviados or fallidos):
+                time.sleep(opts["intervalo"])
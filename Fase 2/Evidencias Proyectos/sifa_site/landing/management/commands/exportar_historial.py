@@ -0,0 +1,41 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from landing.historial import historial, lineas_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta el historial de administraciones a CSV (residente, producto, dosis, hora, "
+        "estado, quién la registró, observación). Memoria constante: se lee por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Fecha inicial YYYY-MM-DD (incluida).")
+        parser.add_argument("--hasta", help="Fecha final YYYY-MM-DD (incluida).")
+        parser.add_argument("--residente", type=int, help="Id del residente.")
+        parser.add_argument("--producto", type=int, help="Id del producto.")
+        parser.add_argument("--cuidadora", type=int, help="Id del usuario que registró.")
+        parser.add_argument("--salida", "-o", help="Archivo de salida (def. stdout).")
+        parser.add_argument("--lote", type=int, default=2000, help="Filas por consulta.")
+
+    def handle(self, *args, **opts):
+        try:
+            desde = date.fromisoformat(opts["desde"]) if opts["desde"] else None
+            hasta = date.fromisoformat(opts["hasta"]) if opts["hasta"] else None
+        except ValueError:
+            raise CommandError("--desde y --hasta deben ser fechas YYYY-MM-DD.")
+
+        qs = historial(desde, hasta, opts["residente"], opts["producto"], opts["cuidadora"])
+        salida = open(opts["salida"], "w", newline="", encoding="utf-8") if opts["salida"] else sys.stdout
+        n = -1
+        try:
+            for n, linea in enumerate(lineas_csv(qs, lote=opts["lote"])):
+                salida.write(linea)
+        finally:
+            if salida is not sys.stdout:
+                salida.close()
+        if opts["salida"]:
+            self.stderr.write(self.style.SUCCESS(f"{max(n, 0)} fila(s) → {opts['salida']}"))
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from landing.models import ExportacionRegistros
+from landing.pdfs import exportaciones_pendientes, exportar_mes, reservar_exportacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta en un ZIP el PDF del registro mensual de cada residente con eventos ese mes. "
+        "Los PDF se generan en paralelo (pool de procesos) y se reutilizan los que ya están en el cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year", type=int, help="Año (def. el del mes anterior).")
+        parser.add_argument("--month", type=int, help="Mes 1-12 (def. el mes anterior).")
+        parser.add_argument("--procesos", type=int, default=None,
+                            help="Procesos en paralelo (def. SIFA_PDF_PROCESOS o núcleos disponibles).")
+        parser.add_argument("--pendientes", action="store_true",
+                            help="En vez de crear una, procesa las exportaciones pedidas desde la web "
+                                 "(y retoma las colgadas).")
+
+    def _progreso(self, hechos, total):
+        self.stdout.write(f"\r{hechos}/{total}", ending="")
+        self.stdout.flush()
+
+    def handle(self, *args, **opts):
+        if opts["pendientes"]:
+            # Incluye las que quedaron PROCESANDO de un proceso que murió (lease vencido)
+            pendientes = exportaciones_pendientes().order_by("creado_en")
+            exportaciones = [e for e in pendientes if reservar_exportacion(e.pk)]
+        else:
+            anterior = timezone.localdate().replace(day=1) - timedelta(days=1)
+            y = opts["year"] or anterior.year
+            m = opts["month"] or anterior.month
+            if not 1 <= m <= 12:
+                raise CommandError("--month debe estar entre 1 y 12.")
+            exportaciones = [ExportacionRegistros.objects.create(year=y, month=m)]
+
+        for exp in exportaciones:
+            self.stdout.write(f"Exportando {exp.year}-{exp.month:02d}…")
+            try:
+                ruta = exportar_mes(exp, procesos=opts["procesos"], progreso=self._progreso)
+            except Exception as e:
+                raise CommandError(f"Exportación {exp.pk} falló: {e}")
+            exp.refresh_from_db()
+            self.stdout.write("")
+            self.stdout.write(self.style.SUCCESS(
+                f"{ruta} ({exp.hechos} PDF, {exp.desde_cache} desde el cache)"))
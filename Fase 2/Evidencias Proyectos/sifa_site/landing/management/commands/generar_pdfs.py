@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from landing.pdfs import procesar_pendientes, purgar
+
+
+class Command(BaseCommand):
+    help = (
+        "Renderiza los PDFs del registro mensual en cola (TrabajoPDF). "
+        "Con --loop queda corriendo como worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="No terminar: revisar la cola cada --intervalo s.")
+        parser.add_argument("--intervalo", type=int, default=5, help="Segundos entre pasadas (con --loop).")
+        parser.add_argument("--limite", type=int, default=5, help="Trabajos por pasada.")
+        parser.add_argument("--purgar-dias", type=int, default=None,
+                            help="Además, borra del cache los PDFs y ZIP con más de N días.")
+
+    def handle(self, *args, **opts):
+        if opts["purgar_dias"] is not None:
+            borrados = purgar(opts["purgar_dias"])
+            self.stdout.write(f"Cache: {borrados} archivo(s) borrado(s).")
+
+        while True:
+            listos, fallidos = procesar_pendientes(opts["limite"])
+            if listos or fallidos:
+                self.stdout.write(f"PDFs: {listos} listo(s), {fallidos} con error.")
+            if not opts["loop"]:
+                break
+            close_old_connections()
+            if not (listos or fallidos):
+                time.sleep(opts["intervalo"])
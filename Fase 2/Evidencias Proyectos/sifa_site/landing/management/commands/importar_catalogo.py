@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from landing.catalogo import importar, leer_filas
+from landing.models import MedicamentoCatalogo
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa un catálogo de medicamentos descargado (CSV o JSON de CIMA/RxNorm) a "
+        "MedicamentoCatalogo. Upsert por número de registro: solo toca filas nuevas o cambiadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta del CSV/JSON descargado.")
+        parser.add_argument("--fuente", required=True, choices=["cima", "rxnorm"],
+                            help="Origen del archivo (clave del registro).")
+        parser.add_argument("--formato", choices=["auto", "csv", "json"], default="auto")
+        parser.add_argument("--desactivar-faltantes", action="store_true",
+                            help="Marca inactivos los registros que ya no vienen en el archivo "
+                                 "(solo con un catálogo completo).")
+
+    def handle(self, *args, **opts):
+        t0 = time.monotonic()
+        fuente = MedicamentoCatalogo.Fuente[opts["fuente"].upper()]
+        try:
+            res = importar(leer_filas(opts["archivo"], opts["formato"]), fuente,
+                           desactivar_faltantes=opts["desactivar_faltantes"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudo leer {opts['archivo']}: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{res.leidos} fila(s) leída(s) en {time.monotonic() - t0:.1f} s: {res.nuevos} nueva(s), "
+            f"{res.actualizados} actualizada(s), {res.sin_cambios} sin cambios, "
+            f"{res.desactivados} desactivada(s), {res.descartados} descartada(s)."
+        ))
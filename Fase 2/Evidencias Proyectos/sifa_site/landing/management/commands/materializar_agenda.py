@@ -0,0 +1,44 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from landing.agenda import materializar_agenda, materializar_eventos
+from landing.models import Administracion
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera los eventos PENDIENTE de hoy + N días y rellena los días pasados "
+        "que no se generaron. Pensado para cron / tarea programada (idempotente)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=None,
+                            help="Días hacia adelante además de hoy (def. SIFA_AGENDA_HORIZONTE_DIAS).")
+        parser.add_argument("--backfill", type=int, default=None,
+                            help="Días hacia atrás a revisar (def. SIFA_AGENDA_BACKFILL_DIAS).")
+        parser.add_argument("--desde", help="Fuerza un rango explícito YYYY-MM-DD (requiere --hasta).")
+        parser.add_argument("--hasta", help="Fin del rango explícito YYYY-MM-DD.")
+
+    def handle(self, *args, **opts):
+        antes = Administracion.objects.count()
+
+        if opts["desde"] or opts["hasta"]:
+            try:
+                desde = date.fromisoformat(opts["desde"] or "")
+                hasta = date.fromisoformat(opts["hasta"] or "")
+            except ValueError:
+                raise CommandError("--desde y --hasta deben ser fechas YYYY-MM-DD.")
+            if hasta < desde:
+                raise CommandError("--hasta no puede ser anterior a --desde.")
+            materializar_eventos(desde, hasta)
+            resumen = f"{desde} → {hasta}"
+        else:
+            dias = materializar_agenda(
+                hoy=timezone.localdate(), horizonte=opts["dias"], backfill=opts["backfill"]
+            )
+            resumen = f"{len(dias)} día(s), {dias[0]} → {dias[-1]}" if dias else "sin días"
+
+        creados = Administracion.objects.count() - antes
+        self.stdout.write(self.style.SUCCESS(f"Agenda materializada ({resumen}): {creados} evento(s) nuevo(s)."))
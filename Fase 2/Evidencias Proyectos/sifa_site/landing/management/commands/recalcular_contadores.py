@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from landing.contadores import clave, recalcular
+from landing.models import Administracion
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye los contadores por día/hora/estado desde Administracion. Solo hace "
+        "falta tras cambios que no pasan por la aplicación (SQL directo, cambio de TIME_ZONE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Primer día YYYY-MM-DD (def. el primer evento).")
+        parser.add_argument("--hasta", help="Último día YYYY-MM-DD (def. el último evento).")
+
+    def handle(self, *args, **opts):
+        rango = Administracion.objects.aggregate(primero=Min("programada_para"), ultimo=Max("programada_para"))
+        if rango["primero"] is None:
+            self.stdout.write("No hay eventos.")
+            return
+        try:
+            desde = date.fromisoformat(opts["desde"]) if opts["desde"] else clave(rango["primero"])[0]
+            hasta = date.fromisoformat(opts["hasta"]) if opts["hasta"] else clave(rango["ultimo"])[0]
+        except ValueError:
+            raise CommandError("--desde y --hasta deben ser fechas YYYY-MM-DD.")
+        if hasta < desde:
+            raise CommandError("--hasta no puede ser anterior a --desde.")
+
+        n = recalcular(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(f"Contadores de {desde} → {hasta}: {n} evento(s) contado(s)."))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from landing.busqueda import reindexar_todos
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula el índice de búsqueda de Producto (palabras y trigramas). Solo hace "
+        "falta tras cargas que no pasan por Producto.save (update(), SQL directo)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=2000, help="Productos por lote.")
+
+    def handle(self, *args, **opts):
+        t0 = time.monotonic()
+        n = reindexar_todos(lote=opts["lote"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{n} producto(s) reindexado(s) en {time.monotonic() - t0:.1f} s."
+        ))
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from landing.models import RegistroMensualSnapshot
+from landing.registro import guardar_snapshot, mes_cerrado, rango_mes, residentes_con_eventos
+
+
+class Command(BaseCommand):
+    help = (
+        "Guarda el registro mensual ya calculado (snapshot) de un mes cerrado para "
+        "cada residente con eventos ese mes. Por defecto, el mes anterior (cron nocturno)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year", type=int, help="Año (def. el del mes anterior).")
+        parser.add_argument("--month", type=int, help="Mes 1-12 (def. el mes anterior).")
+        parser.add_argument("--solo-faltantes", action="store_true",
+                            help="No recalcula los snapshots que ya existen.")
+
+    def handle(self, *args, **opts):
+        anterior = timezone.localdate().replace(day=1) - timedelta(days=1)
+        y = opts["year"] or anterior.year
+        m = opts["month"] or anterior.month
+        if not 1 <= m <= 12:
+            raise CommandError("--month debe estar entre 1 y 12.")
+        if not mes_cerrado(y, m):
+            raise CommandError(f"{y}-{m:02d} aún no está cerrado.")
+
+        residentes = set(residentes_con_eventos(*rango_mes(y, m)))
+        if opts["solo_faltantes"]:
+            residentes -= set(
+                RegistroMensualSnapshot.objects.filter(year=y, month=m).values_list("residente_id", flat=True)
+            )
+
+        for residente_id in sorted(residentes):
+            guardar_snapshot(residente_id, y, m)
+        self.stdout.write(self.style.SUCCESS(f"Snapshots {y}-{m:02d}: {len(residentes)} residente(s)."))
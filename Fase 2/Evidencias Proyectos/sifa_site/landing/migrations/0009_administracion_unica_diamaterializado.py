@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:39
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def quitar_duplicados(apps, schema_editor):
+    """Deja un solo evento por (orden, programada_para); prioriza el ya marcado."""
+    Administracion = apps.get_model('landing', 'Administracion')
+    repetidos = (
+        Administracion.objects
+        .values('orden_id', 'programada_para')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+    )
+    for r in repetidos:
+        filas = list(
+            Administracion.objects
+            .filter(orden_id=r['orden_id'], programada_para=r['programada_para'])
+            .order_by('id')
+        )
+        conservar = next((a for a in filas if a.estado != 'PENDIENTE'), filas[0])
+        Administracion.objects.filter(pk__in=[a.pk for a in filas if a.pk != conservar.pk]).delete()
+
+
+def marcar_dias_existentes(apps, schema_editor):
+    """Los días que ya tienen eventos cuentan como generados (no se rellenan de nuevo)."""
+    Administracion = apps.get_model('landing', 'Administracion')
+    DiaMaterializado = apps.get_model('landing', 'DiaMaterializado')
+    fechas = {
+        timezone.localtime(dt).date()
+        for dt in Administracion.objects.values_list('programada_para', flat=True).iterator()
+    }
+    DiaMaterializado.objects.bulk_create(
+        [DiaMaterializado(fecha=f) for f in sorted(fechas)], ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0008_alter_receta_options_receta_numero_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaMaterializado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('generado_en', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(quitar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='administracion',
+            constraint=models.UniqueConstraint(fields=('orden', 'programada_para'), name='uniq_admin_orden_programada'),
+        ),
+        migrations.RunPython(marcar_dias_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+
+
+def calcular_stock_en_critico(apps, schema_editor):
+    OrdenMedicamento = apps.get_model('landing', 'OrdenMedicamento')
+    OrdenMedicamento.objects.update(stock_en_critico=Case(
+        When(stock_asignado__lte=F('stock_critico'), then=Value(True)),
+        default=Value(False),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0009_administracion_unica_diamaterializado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordenmedicamento',
+            name='stock_en_critico',
+            field=models.BooleanField(db_index=True, default=True, editable=False),
+        ),
+        migrations.RunPython(calcular_stock_en_critico, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('CONSUMO', 'Consumo'), ('DEVOLUCION', 'Devolución'), ('REPOSICION', 'Reposición'), ('AJUSTE', 'Corrección manual')], max_length=12)),
+                ('cantidad', models.IntegerField()),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('administracion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos', to='landing.administracion')),
+                ('orden', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='landing.ordenmedicamento')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['orden', 'creado_en'], name='landing_mov_orden_i_3c9148_idx')],
+            },
+        ),
+    ]
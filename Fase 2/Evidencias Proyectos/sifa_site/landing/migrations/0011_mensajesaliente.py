@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0010_movimientostock_stock_en_critico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MensajeSaliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('texto', models.TextField()),
+                ('chat_id', models.CharField(blank=True, max_length=64)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ENVIADO', 'Enviado'), ('DESCARTADO', 'Descartado')], default='PENDIENTE', max_length=12)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('enviado_en', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='landing_men_estado_aaa7bf_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0011_mensajesaliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertaStockPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creada_en', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('orden', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='alerta_pendiente', to='landing.ordenmedicamento')),
+            ],
+        ),
+    ]
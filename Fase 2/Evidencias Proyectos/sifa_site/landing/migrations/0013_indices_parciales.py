@@ -0,0 +1,56 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Índices trigram para los `icontains` (solo PostgreSQL). Django traduce
+# `campo__icontains=q` a `UPPER(campo::text) LIKE UPPER('%q%')`, así que el
+# índice se arma sobre esa misma expresión. En SQLite no se crea nada.
+TRGM = [
+    ('residente_nombre_trgm', 'landing_residente', 'nombre_completo'),
+    ('residente_rut_trgm', 'landing_residente', 'rut'),
+    ('producto_nombre_trgm', 'landing_producto', 'nombre'),
+    ('producto_potencia_trgm', 'landing_producto', 'potencia'),
+]
+
+
+def crear_trgm(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for nombre, tabla, columna in TRGM:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} '
+            f'USING gin ((UPPER({columna}::text)) gin_trgm_ops)'
+        )
+
+
+def quitar_trgm(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, _, _ in TRGM:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0012_alertastockpendiente'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='administracion',
+            index=models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['programada_para'], name='admin_pendiente_prog_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmedicamento',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['receta'], name='orden_activa_receta_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='residente',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['nombre_completo'], name='residente_activo_nombre_idx'),
+        ),
+        migrations.RunPython(crear_trgm, quitar_trgm),
+    ]
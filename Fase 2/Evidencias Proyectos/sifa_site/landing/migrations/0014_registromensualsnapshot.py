@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0013_indices_parciales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroMensualSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('datos', models.JSONField()),
+                ('hash', models.CharField(max_length=64)),
+                ('generado_en', models.DateTimeField(auto_now=True)),
+                ('residente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_registro', to='landing.residente')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('residente', 'year', 'month'), name='uniq_snapshot_residente_mes')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from landing.texto import normalizar
+
+
+def indexar_catalogo(apps, schema_editor):
+    # Misma lógica que Producto.save + landing.busqueda (congelada aquí)
+    Producto = apps.get_model('landing', 'Producto')
+    ProductoPalabra = apps.get_model('landing', 'ProductoPalabra')
+    ProductoTrigrama = apps.get_model('landing', 'ProductoTrigrama')
+    palabras, tris = [], []
+    for p in list(Producto.objects.all()):
+        p.busqueda = normalizar(f"{p.nombre} {p.potencia} {p.forma}")[:260].rstrip()  # largo de la columna
+        p.save(update_fields=['busqueda'])
+        palabras.extend(ProductoPalabra(producto_id=p.pk, palabra=w[:60]) for w in set(p.busqueda.split()))
+        vistos = set()
+        for w in normalizar(p.nombre).split():
+            w = "  " + w + " "
+            vistos.update(w[i:i + 3] for i in range(len(w) - 2))
+        tris.extend(ProductoTrigrama(producto_id=p.pk, trigrama=t) for t in vistos)
+    ProductoPalabra.objects.bulk_create(palabras, batch_size=2000)
+    ProductoTrigrama.objects.bulk_create(tris, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0016_exportacionregistros'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='busqueda',
+            field=models.CharField(blank=True, editable=False, max_length=260),
+        ),
+        migrations.CreateModel(
+            name='ProductoPalabra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('palabra', models.CharField(max_length=60)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='palabras', to='landing.producto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('palabra', 'producto'), name='uniq_palabra_producto')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductoTrigrama',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigrama', models.CharField(max_length=3)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigramas', to='landing.producto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('trigrama', 'producto'), name='uniq_trigrama_producto')],
+            },
+        ),
+        migrations.RunPython(indexar_catalogo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0017_producto_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SugerenciaExterna',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('proveedor', models.CharField(max_length=12)),
+                ('clave', models.CharField(max_length=200)),
+                ('resultados', models.JSONField(default=list)),
+                ('creado_en', models.DateTimeField(auto_now=True)),
+                ('expira_en', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('proveedor', 'clave'), name='uniq_sugerencia_proveedor_clave')],
+            },
+        ),
+    ]
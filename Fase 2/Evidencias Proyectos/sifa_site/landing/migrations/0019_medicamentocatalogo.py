@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0018_sugerenciaexterna'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='producto',
+            name='busqueda',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=260),
+        ),
+        migrations.CreateModel(
+            name='MedicamentoCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fuente', models.CharField(choices=[('CIMA', 'CIMA (AEMPS)'), ('RXNORM', 'RxNorm (NIH)')], max_length=8)),
+                ('registro', models.CharField(max_length=40)),
+                ('nombre', models.CharField(max_length=255)),
+                ('potencia', models.CharField(blank=True, max_length=80)),
+                ('forma', models.CharField(blank=True, max_length=80)),
+                ('laboratorio', models.CharField(blank=True, max_length=160)),
+                ('activo', models.BooleanField(default=True)),
+                ('busqueda', models.CharField(db_index=True, max_length=400)),
+                ('huella', models.CharField(max_length=40)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fuente', 'registro'), name='uniq_catalogo_fuente_registro')],
+            },
+        ),
+    ]
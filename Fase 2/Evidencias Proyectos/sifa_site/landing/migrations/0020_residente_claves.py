@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:13
+
+from django.db import migrations, models
+
+from landing.texto import normalizar, normalizar_rut
+
+
+def calcular_claves(apps, schema_editor):
+    # Misma lógica que Residente.save (congelada aquí)
+    Residente = apps.get_model('landing', 'Residente')
+    residentes = list(Residente.objects.only('nombre_completo', 'rut'))
+    for r in residentes:
+        r.nombre_clave = normalizar(r.nombre_completo)[:160]
+        r.rut_normalizado = normalizar_rut(r.rut)[:12]
+    Residente.objects.bulk_update(residentes, ['nombre_clave', 'rut_normalizado'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0019_medicamentocatalogo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='residente',
+            name='nombre_clave',
+            field=models.CharField(blank=True, editable=False, max_length=160),
+        ),
+        migrations.AddField(
+            model_name='residente',
+            name='rut_normalizado',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(calcular_claves, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='residente',
+            index=models.Index(fields=['nombre_clave', 'id'], name='residente_clave_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='residente',
+            index=models.Index(fields=['activo', 'nombre_clave', 'id'], name='residente_estado_clave_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:18
+
+import django.db.models.deletion
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def contar_eventos(apps, schema_editor):
+    # Misma lógica que landing.contadores.recalcular (congelada aquí)
+    Administracion = apps.get_model('landing', 'Administracion')
+    ContadorAdministracion = apps.get_model('landing', 'ContadorAdministracion')
+    acumulado = Counter()
+    for residente_id, prog, estado in (
+        Administracion.objects.values_list('residente_id', 'programada_para', 'estado').iterator(chunk_size=2000)
+    ):
+        local = timezone.localtime(prog)
+        acumulado[(local.date(), local.time().replace(second=0, microsecond=0), residente_id, estado)] += 1
+    ContadorAdministracion.objects.bulk_create(
+        [ContadorAdministracion(fecha=f, hora=h, residente_id=r, estado=e, n=n)
+         for (f, h, r, e), n in acumulado.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0020_residente_claves'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorAdministracion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('hora', models.TimeField()),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('DADA', 'Administrada'), ('OMITIDA', 'Omitida'), ('RECHAZADA', 'Rechazada')], max_length=12)),
+                ('n', models.PositiveIntegerField(default=0)),
+                ('residente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='landing.residente')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'hora', 'residente', 'estado'), name='uniq_contador_admin')],
+            },
+        ),
+        migrations.RunPython(contar_eventos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0021_contadoradministracion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioAdministracion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('DADA', 'Administrada'), ('OMITIDA', 'Omitida'), ('RECHAZADA', 'Rechazada')], max_length=12)),
+                ('creado_en', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('administracion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='landing.administracion')),
+                ('realizada_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('residente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='landing.residente')),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0022_cambioadministracion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('ADM', 'Administración'), ('ORD', 'Orden (stock)'), ('DIA', 'Eventos de un residente en el día'), ('ASG', 'Asignaciones del día')], max_length=3)),
+                ('objeto_id', models.BigIntegerField(blank=True, null=True)),
+                ('fecha', models.DateField(blank=True, null=True)),
+                ('creado_en', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TokenApi',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(editable=False, max_length=64, unique=True)),
+                ('nombre', models.CharField(blank=True, max_length=80)),
+                ('activo', models.BooleanField(default=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('usado_en', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_api', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0023_api_sincronizacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportacionregistros',
+            name='iniciado_en',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
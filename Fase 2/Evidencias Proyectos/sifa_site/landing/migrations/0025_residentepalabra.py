@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def indexar_residentes(apps, schema_editor):
+    # Misma lógica que landing.busqueda.indexar_residentes (congelada aquí)
+    Residente = apps.get_model('landing', 'Residente')
+    ResidentePalabra = apps.get_model('landing', 'ResidentePalabra')
+    palabras = [
+        ResidentePalabra(residente_id=pk, palabra=w)
+        for pk, clave in Residente.objects.values_list('pk', 'nombre_clave').iterator()
+        for w in {w[:60] for w in clave.split()}
+    ]
+    ResidentePalabra.objects.bulk_create(palabras, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('landing', '0024_exportacion_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResidentePalabra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('palabra', models.CharField(max_length=60)),
+                ('residente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='palabras', to='landing.residente')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('palabra', 'residente'), name='uniq_palabra_residente')],
+            },
+        ),
+        migrations.RunPython(indexar_residentes, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.conf import settings
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+
+from .texto import normalizar, normalizar_rut
 
 
 # --------- Residentes ----------
@@ -16,21 +19,137 @@ class Residente(models.Model):
     sexo = models.CharField(max_length=1, choices=Sexo.choices, default=Sexo.O)
     alergias = models.TextField(blank=True)
     activo = models.BooleanField(default=True)
+    # Denormalizados (los calcula save): nombre sin tildes ni mayúsculas para
+    # ordenar y buscar por prefijo, y el RUT solo con dígitos y verificador
+    nombre_clave = models.CharField(max_length=160, blank=True, editable=False)
+    rut_normalizado = models.CharField(max_length=12, blank=True, editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Listados y selects solo muestran residentes activos, ordenados por nombre
+            models.Index(fields=["nombre_completo"], condition=models.Q(activo=True),
+                         name="residente_activo_nombre_idx"),
+            # Directorio (landing.views.residente_list): páginas por (nombre_clave, id)
+            models.Index(fields=["nombre_clave", "id"], name="residente_clave_idx"),
+            models.Index(fields=["activo", "nombre_clave", "id"], name="residente_estado_clave_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.nombre_clave = normalizar(self.nombre_completo)[:160]
+        self.rut_normalizado = normalizar_rut(self.rut)[:12]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extra = set()
+            if 'nombre_completo' in update_fields:
+                extra.add('nombre_clave')
+            if 'rut' in update_fields:
+                extra.add('rut_normalizado')
+            if extra:
+                kwargs['update_fields'] = set(update_fields) | extra
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.nombre_completo} ({self.rut})"
 
 
+class ResidentePalabra(models.Model):
+    """Índice del directorio: una palabra de Residente.nombre_clave por fila (búsqueda por prefijo)."""
+    residente = models.ForeignKey(Residente, on_delete=models.CASCADE, related_name="palabras")
+    palabra = models.CharField(max_length=60)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["palabra", "residente"], name="uniq_palabra_residente"),
+        ]
+
+    def __str__(self):
+        return f"{self.palabra} · {self.residente_id}"
+
+
 # --------- Catálogo de medicamentos ----------
 class Producto(models.Model):
     nombre = models.CharField(max_length=160)
     potencia = models.CharField(max_length=60, blank=True)  # ej: 500 mg
     forma = models.CharField(max_length=40, blank=True)     # tableta, jarabe, etc.
+    # Denormalizado: "nombre potencia forma" sin tildes ni mayúsculas (landing.busqueda)
+    busqueda = models.CharField(max_length=260, blank=True, editable=False, db_index=True)
+
+    @staticmethod
+    def clave_busqueda(nombre, potencia, forma):
+        # 160 + 60 + 40 + separadores (y NFKD puede alargar ligaduras): se corta al largo de la columna
+        return normalizar(f"{nombre} {potencia} {forma}")[:260].rstrip()
+
+    def save(self, *args, **kwargs):
+        self.busqueda = self.clave_busqueda(self.nombre, self.potencia, self.forma)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'nombre', 'potencia', 'forma'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'busqueda'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.nombre} {self.potencia}".strip()
 
 
+class ProductoPalabra(models.Model):
+    """Índice de búsqueda: una palabra de Producto.busqueda por fila (búsqueda por prefijo)."""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="palabras")
+    palabra = models.CharField(max_length=60)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["palabra", "producto"], name="uniq_palabra_producto"),
+        ]
+
+    def __str__(self):
+        return f"{self.palabra} · {self.producto_id}"
+
+
+class ProductoTrigrama(models.Model):
+    """Índice de búsqueda: un trigrama de Producto.busqueda por fila (tolerancia a errores)."""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="trigramas")
+    trigrama = models.CharField(max_length=3)
+
+    class Meta:
+        constraints = [
+            # También es el índice (trigrama, producto) con el que se busca
+            models.UniqueConstraint(fields=["trigrama", "producto"], name="uniq_trigrama_producto"),
+        ]
+
+    def __str__(self):
+        return f"{self.trigrama!r} · {self.producto_id}"
+
+
+class MedicamentoCatalogo(models.Model):
+    """
+    Catálogo nacional de referencia (CIMA/RxNorm) importado desde un archivo
+    con `manage.py importar_catalogo`. Solo se usa para sugerir; un
+    medicamento pasa a Producto cuando se receta.
+    """
+    class Fuente(models.TextChoices):
+        CIMA = "CIMA", "CIMA (AEMPS)"
+        RXNORM = "RXNORM", "RxNorm (NIH)"
+
+    fuente = models.CharField(max_length=8, choices=Fuente.choices)
+    registro = models.CharField(max_length=40)             # nregistro (CIMA) o rxcui (RxNorm)
+    nombre = models.CharField(max_length=255)
+    potencia = models.CharField(max_length=80, blank=True)
+    forma = models.CharField(max_length=80, blank=True)
+    laboratorio = models.CharField(max_length=160, blank=True)
+    activo = models.BooleanField(default=True)              # False: ya no viene en el archivo
+    # Normalizado (landing.texto.normalizar) para buscar por prefijo con el índice
+    busqueda = models.CharField(max_length=400, db_index=True)
+    huella = models.CharField(max_length=40)                # sha1 de los campos: detecta cambios
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["fuente", "registro"], name="uniq_catalogo_fuente_registro"),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre} [{self.fuente} {self.registro}]"
+
+
 # --------- Receta y programación ----------
 class Receta(models.Model):
     residente = models.ForeignKey('Residente', on_delete=models.CASCADE, related_name="recetas")
@@ -73,11 +192,51 @@ class OrdenMedicamento(models.Model):
     stock_critico = models.PositiveIntegerField(default=0)
 
     alerta_enviada = models.BooleanField(default=False)
+    # Denormalizado: stock_asignado <= stock_critico (lo mantiene landing.stock / save)
+    stock_en_critico = models.BooleanField(default=True, db_index=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.stock_en_critico = (self.stock_asignado or 0) <= (self.stock_critico or 0)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'stock_asignado', 'stock_critico'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'stock_en_critico'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Agenda y dashboard siempre filtran órdenes activas por receta
+            models.Index(fields=["receta"], condition=models.Q(activo=True),
+                         name="orden_activa_receta_idx"),
+        ]
 
     def __str__(self):
         return f"{self.producto} · {self.dosis}"
 
 
+class MovimientoStock(models.Model):
+    """Libro de movimientos de stock por orden (solo se agregan filas)."""
+    class Tipo(models.TextChoices):
+        CONSUMO = "CONSUMO", "Consumo"
+        DEVOLUCION = "DEVOLUCION", "Devolución"
+        REPOSICION = "REPOSICION", "Reposición"
+        AJUSTE = "AJUSTE", "Corrección manual"
+
+    orden = models.ForeignKey(OrdenMedicamento, on_delete=models.CASCADE, related_name="movimientos")
+    tipo = models.CharField(max_length=12, choices=Tipo.choices)
+    cantidad = models.IntegerField()  # con signo: negativo descuenta
+    administracion = models.ForeignKey('Administracion', on_delete=models.SET_NULL,
+                                       null=True, blank=True, related_name="movimientos")
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                                null=True, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["orden", "creado_en"])]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.cantidad:+d} · {self.orden}"
+
+
 class HoraProgramada(models.Model):
     """Horas fijas por día (puedes crear varias)."""
     class Dia(models.IntegerChoices):
@@ -120,11 +279,157 @@ class Administracion(models.Model):
                                       null=True, blank=True)
 
     class Meta:
-        indexes = [models.Index(fields=["programada_para", "residente"])]
+        indexes = [
+            models.Index(fields=["programada_para", "residente"]),
+            # Rondas y poda de la agenda: solo interesan los eventos sin marcar
+            models.Index(fields=["programada_para"], condition=models.Q(estado="PENDIENTE"),
+                         name="admin_pendiente_prog_idx"),
+        ]
+        constraints = [
+            # Un solo evento por orden y hora programada (la agenda se genera en bloque)
+            models.UniqueConstraint(fields=["orden", "programada_para"], name="uniq_admin_orden_programada"),
+        ]
 
     def __str__(self):
         return f"{self.residente} · {self.orden} · {self.programada_para:%Y-%m-%d %H:%M}"
 
+
+class ContadorAdministracion(models.Model):
+    """
+    Cuántos eventos hay por día, hora (local, HH:MM), residente y estado.
+    Lo mantiene landing.contadores en la misma transacción que cada cambio de
+    Administracion; el dashboard y los chips de hora leen de aquí.
+    """
+    fecha = models.DateField()
+    hora = models.TimeField()
+    residente = models.ForeignKey(Residente, on_delete=models.CASCADE, related_name="+")
+    estado = models.CharField(max_length=12, choices=Administracion.Estado.choices)
+    n = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["fecha", "hora", "residente", "estado"], name="uniq_contador_admin"),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.hora:%H:%M} · {self.residente_id} · {self.estado}: {self.n}"
+
+
+class CambioAdministracion(models.Model):
+    """
+    Registro corto de cambios de estado para el tablero en vivo (landing.tablero).
+    Se escribe en la misma transacción que el cambio; los tableros conectados
+    leen por id creciente y las filas viejas se purgan solas.
+    """
+    administracion = models.ForeignKey(Administracion, on_delete=models.CASCADE, related_name="+")
+    residente = models.ForeignKey(Residente, on_delete=models.CASCADE, related_name="+")
+    estado = models.CharField(max_length=12, choices=Administracion.Estado.choices)
+    realizada_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                                      null=True, blank=True, related_name="+")
+    creado_en = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"#{self.pk} · {self.administracion_id} → {self.estado}"
+
+
+class DiaMaterializado(models.Model):
+    """Días cuya agenda (eventos PENDIENTE) ya fue generada por landing.agenda."""
+    fecha = models.DateField(unique=True)
+    generado_en = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.fecha}"
+
+
+class RegistroMensualSnapshot(models.Model):
+    """Grilla ya calculada de un mes cerrado (ver landing.registro). Se borra si algo la toca."""
+    residente = models.ForeignKey(Residente, on_delete=models.CASCADE, related_name="snapshots_registro")
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    datos = models.JSONField()
+    hash = models.CharField(max_length=64)  # sha256 de `datos` (sirve de ETag)
+    generado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["residente", "year", "month"], name="uniq_snapshot_residente_mes"),
+        ]
+
+    def __str__(self):
+        return f"{self.residente} · {self.year}-{self.month:02d}"
+
+
+class SugerenciaExterna(models.Model):
+    """Cache persistente de sugerencias de CIMA/RxNorm (ver landing.sugerencias)."""
+    proveedor = models.CharField(max_length=12)
+    clave = models.CharField(max_length=200)           # "<limit>:<búsqueda normalizada>"
+    resultados = models.JSONField(default=list)        # [] = cache negativo
+    creado_en = models.DateTimeField(auto_now=True)
+    expira_en = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["proveedor", "clave"], name="uniq_sugerencia_proveedor_clave"),
+        ]
+
+    def __str__(self):
+        return f"{self.proveedor} · {self.clave}"
+
+
+class TrabajoPDF(models.Model):
+    """Cola de PDFs del registro mensual. `clave` es el hash del contenido: dedupe y nombre del archivo."""
+    class Estado(models.TextChoices):
+        PENDIENTE = "PENDIENTE", "Pendiente"
+        PROCESANDO = "PROCESANDO", "Procesando"
+        LISTO = "LISTO", "Listo"
+        ERROR = "ERROR", "Error"
+
+    clave = models.CharField(max_length=64, unique=True)
+    residente = models.ForeignKey(Residente, on_delete=models.CASCADE, related_name="trabajos_pdf")
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    estado = models.CharField(max_length=12, choices=Estado.choices, default=Estado.PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    solicitado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                                       null=True, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    terminado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["estado", "creado_en"])]
+
+    def __str__(self):
+        return f"{self.residente} · {self.year}-{self.month:02d} · {self.get_estado_display()}"
+
+
+class ExportacionRegistros(models.Model):
+    """ZIP con los PDF del registro mensual de todos los residentes de un mes (landing.pdfs)."""
+    class Estado(models.TextChoices):
+        PENDIENTE = "PENDIENTE", "Pendiente"
+        PROCESANDO = "PROCESANDO", "Procesando"
+        LISTO = "LISTO", "Listo"
+        ERROR = "ERROR", "Error"
+
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    estado = models.CharField(max_length=12, choices=Estado.choices, default=Estado.PENDIENTE)
+    total = models.PositiveIntegerField(default=0)
+    hechos = models.PositiveIntegerField(default=0)
+    desde_cache = models.PositiveIntegerField(default=0)   # PDFs que ya estaban generados
+    archivo = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    solicitado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                                       null=True, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)   # lease: se renueva con cada PDF
+    terminado_en = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.year}-{self.month:02d} · {self.hechos}/{self.total} · {self.get_estado_display()}"
+
+
 class DiaAsignacion(models.Model):
     """Configura el modo de visibilidad de hoy: todos ven todo o solo lo asignado."""
     fecha = models.DateField(unique=True)
@@ -150,4 +455,70 @@ class Asignacion(models.Model):
         indexes = [models.Index(fields=['fecha', 'cuidadora']), models.Index(fields=['fecha', 'residente'])]
 
     def __str__(self):
-        return f"{self.fecha} · {self.residente} → {self.cuidadora}"
\ No newline at end of file
+        return f"{self.fecha} · {self.residente} → {self.cuidadora}"
+
+class AlertaStockPendiente(models.Model):
+    """Órdenes que entraron en stock crítico y esperan el próximo resumen (digest)."""
+    orden = models.OneToOneField(OrdenMedicamento, on_delete=models.CASCADE, related_name="alerta_pendiente")
+    creada_en = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.orden} · {self.creada_en:%Y-%m-%d %H:%M}"
+
+
+class MensajeSaliente(models.Model):
+    """Outbox de notificaciones: se escribe en la transacción y lo entrega un worker."""
+    class Estado(models.TextChoices):
+        PENDIENTE = "PENDIENTE", "Pendiente"
+        ENVIADO = "ENVIADO", "Enviado"
+        DESCARTADO = "DESCARTADO", "Descartado"   # agotó reintentos (dead letter)
+
+    texto = models.TextField()
+    chat_id = models.CharField(max_length=64, blank=True)  # vacío = TELEGRAM_CHAT_ID
+    estado = models.CharField(max_length=12, choices=Estado.choices, default=Estado.PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["estado", "proximo_intento"])]
+
+    def __str__(self):
+        return f"{self.get_estado_display()} · {self.texto[:40]}"
+
+
+# --------- API de sincronización (app Android) ----------
+class CambioSync(models.Model):
+    """
+    Versión de los datos del tablero: cada fila es un cambio y su id es el
+    cursor que entrega la API (landing.sincronizacion). Solo dice qué cambió;
+    el contenido se lee de la tabla original al responder.
+    """
+    class Tipo(models.TextChoices):
+        ADMINISTRACION = "ADM", "Administración"
+        ORDEN = "ORD", "Orden (stock)"
+        DIA = "DIA", "Eventos de un residente en el día"    # agenda generada en bloque
+        ASIGNACIONES = "ASG", "Asignaciones del día"
+
+    tipo = models.CharField(max_length=3, choices=Tipo.choices)
+    objeto_id = models.BigIntegerField(null=True, blank=True)  # administración, orden o residente (DIA)
+    fecha = models.DateField(null=True, blank=True)            # día local al que afecta (ORDEN: todos)
+    creado_en = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"#{self.pk} · {self.tipo} {self.objeto_id or ''} {self.fecha or ''}"
+
+
+class TokenApi(models.Model):
+    """Token de la API para un dispositivo; solo se guarda su sha256."""
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="tokens_api")
+    clave = models.CharField(max_length=64, unique=True, editable=False)
+    nombre = models.CharField(max_length=80, blank=True)     # p.ej. el modelo del teléfono
+    activo = models.BooleanField(default=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    usado_en = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.usuario} · {self.nombre or self.clave[:8]}"
@@ -1,48 +1,246 @@
+import logging
 import os
-import requests
+import threading
+from datetime import datetime, time as dtime, timedelta
+
 from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .telegram import ResultadoEnvio, get_transport
+
+logger = logging.getLogger(__name__)
+
 
-def send_telegram_message(text: str, *, return_detail: bool = False):
+def enviar_telegram(text: str, *, chat_id: str = "") -> ResultadoEnvio:
     """
-    Envía un mensaje a Telegram.
-    - Por defecto devuelve solo bool (compatibilidad con tu código actual).
-    - Si return_detail=True, devuelve (ok: bool, detalle: str).
-    Hace POST (form-data) y si falla, prueba GET (como en tu navegador).
+    Envía un mensaje a Telegram por el transporte compartido (landing.telegram):
+    sesión keep-alive, límite por chat y partición de textos largos.
+    Devuelve un ResultadoEnvio con el detalle del intento.
     """
     token = (getattr(settings, "TELEGRAM_BOT_TOKEN", "") or os.getenv("TELEGRAM_BOT_TOKEN", "")).strip()
-    chat  = (getattr(settings, "TELEGRAM_CHAT_ID", "") or os.getenv("TELEGRAM_CHAT_ID", "")).strip()
-
-    def ret(ok, detail=""):
-        return (ok, detail) if return_detail else ok
+    chat  = (chat_id or getattr(settings, "TELEGRAM_CHAT_ID", "") or os.getenv("TELEGRAM_CHAT_ID", "")).strip()
 
     if not token:
-        return ret(False, "Falta TELEGRAM_BOT_TOKEN")
+        return ResultadoEnvio(False, "Falta TELEGRAM_BOT_TOKEN")
     if token.startswith("bot"):
-        return ret(False, "No incluyas el prefijo 'bot' en el token")
+        return ResultadoEnvio(False, "No incluyas el prefijo 'bot' en el token")
     if not chat:
-        return ret(False, "Falta TELEGRAM_CHAT_ID")
-
-    base = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {
-        "chat_id": chat,
-        "text": text,
-        "parse_mode": "HTML",
-        "disable_web_page_preview": True
-    }
-
-    # 1) POST (form-data)
-    try:
-        r = requests.post(base, data=payload, timeout=8)
-        if r.ok:
-            data = r.json()
-            if data.get("ok"):
-                return ret(True, "OK (POST)")
-        # 2) Fallback GET (igual que el link que te funcionó)
-        rg = requests.get(base, params=payload, timeout=8)
-        if rg.ok and rg.json().get("ok"):
-            return ret(True, "OK (GET)")
-        return ret(False, f"POST {r.status_code}:{r.text} | GET {rg.status_code}:{rg.text}")
-    except requests.exceptions.SSLError as e:
-        return ret(False, f"SSL error: {e}")
-    except Exception as e:
-        return ret(False, f"Excepción: {e}")
+        return ResultadoEnvio(False, "Falta TELEGRAM_CHAT_ID")
+
+    transport = get_transport(
+        token,
+        getattr(settings, "TELEGRAM_API_BASE", "https://api.telegram.org"),
+        timeout=getattr(settings, "TELEGRAM_TIMEOUT", 8),
+        tasa=getattr(settings, "TELEGRAM_RATE_POR_CHAT", 1.0),
+        rafaga=getattr(settings, "TELEGRAM_RAFAGA_POR_CHAT", 3),
+    )
+    return transport.enviar(chat, text)
+
+
+def send_telegram_message(text: str, *, return_detail: bool = False, chat_id: str = ""):
+    """
+    Envía un mensaje a Telegram.
+    - Por defecto devuelve solo bool (compatibilidad con tu código actual).
+    - Si return_detail=True, devuelve (ok: bool, detalle: str).
+    """
+    res = enviar_telegram(text, chat_id=chat_id)
+    return (res.ok, res.detalle) if return_detail else res.ok
+
+
+# =========================================================
+# Outbox: los mensajes se guardan en MensajeSaliente dentro de la transacción
+# del request y los entrega un worker (hilo o `manage.py enviar_notificaciones`).
+# Marcar una dosis o reponer stock nunca espera a la red.
+# =========================================================
+
+def encolar_mensaje(text: str, *, chat_id: str = ""):
+    """Guarda el mensaje en el outbox; al confirmar la transacción despierta al worker."""
+    from .models import MensajeSaliente
+    msg = MensajeSaliente.objects.create(texto=text, chat_id=chat_id)
+    transaction.on_commit(despertar_worker)
+    return msg
+
+
+def _backoff(intentos):
+    """30 s, 1 min, 2 min, … con tope en SIFA_OUTBOX_BACKOFF_MAX segundos."""
+    base = int(getattr(settings, "SIFA_OUTBOX_BACKOFF_BASE", 30))
+    tope = int(getattr(settings, "SIFA_OUTBOX_BACKOFF_MAX", 3600))
+    return timedelta(seconds=min(base * 2 ** max(intentos - 1, 0), tope))
+
+
+def entregar_pendientes(limite=50):
+    """
+    Entrega los mensajes vencidos del outbox. Cada mensaje se reserva con un
+    UPDATE condicional, así varios workers no envían el mismo dos veces.
+    Devuelve (enviados, fallidos).
+    """
+    from .models import MensajeSaliente
+    Estado = MensajeSaliente.Estado
+    max_intentos = int(getattr(settings, "SIFA_OUTBOX_MAX_INTENTOS", 6))
+    lease = timedelta(seconds=int(getattr(settings, "SIFA_OUTBOX_LEASE", 60)))
+
+    ahora = timezone.now()
+    lote = list(
+        MensajeSaliente.objects
+        .filter(estado=Estado.PENDIENTE, proximo_intento__lte=ahora)
+        .order_by("proximo_intento", "id")[:limite]
+    )
+    enviados = fallidos = 0
+    for msg in lote:
+        reservado = (
+            MensajeSaliente.objects
+            .filter(pk=msg.pk, estado=Estado.PENDIENTE, proximo_intento=msg.proximo_intento)
+            .update(proximo_intento=ahora + lease)
+        )
+        if not reservado:
+            continue  # lo tomó otro worker
+
+        res = enviar_telegram(msg.texto, chat_id=msg.chat_id)
+        msg.intentos += 1
+        if res.ok:
+            msg.estado = Estado.ENVIADO
+            msg.enviado_en = timezone.now()
+            msg.ultimo_error = ""
+            enviados += 1
+        else:
+            msg.ultimo_error = res.detalle[:2000]
+            if res.partes_enviadas and res.pendiente:
+                msg.texto = res.pendiente  # no repetir las partes que ya llegaron
+            if msg.intentos >= max_intentos:
+                msg.estado = Estado.DESCARTADO
+                logger.warning("Outbox: mensaje %s descartado tras %s intentos: %s", msg.pk, msg.intentos, res.detalle)
+            else:
+                espera = timedelta(seconds=res.retry_after) if res.retry_after else _backoff(msg.intentos)
+                msg.proximo_intento = timezone.now() + espera
+            fallidos += 1
+        msg.save(update_fields=["texto", "estado", "intentos", "proximo_intento", "ultimo_error", "enviado_en"])
+    return enviados, fallidos
+
+
+# =========================================================
+# Alertas de stock crítico: inmediatas o agrupadas en un resumen
+# (SIFA_ALERTAS_VENTANA segundos o por turnos SIFA_ALERTAS_TURNOS).
+# =========================================================
+
+def _linea_stock(orden):
+    return f"📦 {orden.stock_asignado} (crítico {orden.stock_critico})"
+
+
+def texto_alerta_stock(orden):
+    res = orden.receta.residente
+    return (
+        "⚠️ <b>Stock crítico</b>\n"
+        f"👤 Residente: {res.nombre_completo}\n"
+        f"💊 Medicamento: {orden.producto} · {orden.dosis}\n"
+        f"📦 Stock: {orden.stock_asignado} (crítico {orden.stock_critico})"
+    )
+
+
+def _modo_resumen():
+    return bool(getattr(settings, "SIFA_ALERTAS_TURNOS", None)) or int(getattr(settings, "SIFA_ALERTAS_VENTANA", 0)) > 0
+
+
+def registrar_alerta_stock(orden):
+    """
+    Se llama una vez por orden al entrar en crítico (alerta_enviada ya reservado).
+    Sin modo resumen encola el aviso al tiro; con modo resumen lo deja en
+    AlertaStockPendiente para el próximo digest y despierta al worker, que
+    revisa la ventana en cada vuelta (si no, nadie lo mandaría).
+    """
+    from .models import AlertaStockPendiente
+    if not _modo_resumen():
+        return encolar_mensaje(texto_alerta_stock(orden))
+    AlertaStockPendiente.objects.get_or_create(orden=orden)
+    transaction.on_commit(despertar_worker)
+
+
+def _ventana_cerrada(primera, ahora):
+    """True si ya toca mandar el resumen que abrió la alerta `primera`."""
+    turnos = getattr(settings, "SIFA_ALERTAS_TURNOS", None)
+    if turnos:
+        # cierra al pasar cualquier cambio de turno (HH:MM local) desde la primera alerta
+        tz = timezone.get_current_timezone()
+        hoy = timezone.localdate(ahora)
+        for dia in (hoy - timedelta(days=1), hoy):
+            for hhmm in turnos:
+                hh, mm = (int(x) for x in hhmm.split(":", 1))
+                corte = timezone.make_aware(datetime.combine(dia, dtime(hh, mm)), tz)
+                if primera < corte <= ahora:
+                    return True
+        return False
+    return ahora - primera >= timedelta(seconds=int(getattr(settings, "SIFA_ALERTAS_VENTANA", 0)))
+
+
+def enviar_resumen_alertas(forzar=False):
+    """
+    Si la ventana del resumen cerró, arma un mensaje por residente (o por
+    producto, SIFA_ALERTAS_AGRUPAR="PRODUCTO") y lo deja en el outbox.
+    Las órdenes que ya salieron de crítico se omiten. Devuelve mensajes encolados.
+    """
+    from .models import AlertaStockPendiente
+    with transaction.atomic():
+        pendientes = list(
+            AlertaStockPendiente.objects
+            .select_for_update(skip_locked=True)
+            .select_related("orden__receta__residente", "orden__producto")
+            .order_by("creada_en")
+        )
+        if not pendientes:
+            return 0
+        if not forzar and not _ventana_cerrada(pendientes[0].creada_en, timezone.now()):
+            return 0
+        AlertaStockPendiente.objects.filter(pk__in=[a.pk for a in pendientes]).delete()
+
+        por_producto = getattr(settings, "SIFA_ALERTAS_AGRUPAR", "RESIDENTE") == "PRODUCTO"
+        grupos = {}
+        for a in pendientes:
+            o = a.orden
+            if not o.stock_en_critico:
+                continue  # se repuso antes del resumen
+            if por_producto:
+                titulo = f"💊 <b>{o.producto}</b>"
+                linea = f"   👤 {o.receta.residente.nombre_completo} · {o.dosis} — {_linea_stock(o)}"
+            else:
+                titulo = f"👤 <b>{o.receta.residente.nombre_completo}</b>"
+                linea = f"   💊 {o.producto} · {o.dosis} — {_linea_stock(o)}"
+            grupos.setdefault(titulo, []).append(linea)
+
+        for titulo, lineas in grupos.items():
+            encolar_mensaje("\n".join(
+                [f"⚠️ <b>Stock crítico</b> — {len(lineas)} medicamento(s)", titulo, *lineas]
+            ))
+    return len(grupos)
+
+
+# --- Worker en hilo (opcional, SIFA_OUTBOX_HILO) ---
+_despertar = threading.Event()
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def _bucle_worker():
+    intervalo = int(getattr(settings, "SIFA_OUTBOX_INTERVALO", 15))
+    while True:
+        _despertar.wait(timeout=intervalo)
+        _despertar.clear()
+        try:
+            enviar_resumen_alertas()
+            while sum(entregar_pendientes()):
+                pass
+        except Exception:
+            logger.exception("Outbox: error entregando mensajes")
+        finally:
+            close_old_connections()
+
+
+def despertar_worker():
+    """Arranca (una vez por proceso) el hilo de entrega y le avisa que hay trabajo."""
+    global _hilo
+    if not getattr(settings, "SIFA_OUTBOX_HILO", False):
+        return
+    with _hilo_lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_bucle_worker, name="sifa-outbox", daemon=True)
+            _hilo.start()
+    _despertar.set()
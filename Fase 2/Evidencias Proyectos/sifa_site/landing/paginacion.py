@@ -0,0 +1,89 @@
+# landing/paginacion.py
+"""
+Paginación por clave (keyset): en vez de OFFSET, cada página pide "las filas
+que vienen después de (clave, id) de la última vista", así que cuesta lo mismo
+en la primera página que en la número 200 y no necesita contar la tabla.
+
+El cursor viaja en la URL (?tras= / ?antes=) como JSON en base64; las columnas
+del orden deben tener un índice compuesto que termine en id.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+
+@dataclass
+class Pagina:
+    items: list = field(default_factory=list)
+    siguiente: str | None = None   # cursor para ?tras=
+    anterior: str | None = None    # cursor para ?antes=
+
+
+def codificar_cursor(valores):
+    crudo = json.dumps(list(valores), separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor, n):
+    """Valores del cursor, o None si no es válido (se vuelve a la primera página)."""
+    if not cursor:
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(valores, list) or len(valores) != n:
+        return None
+    # Escalares, y el último (el id) entero: un cursor adulterado no llega a la base
+    if not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in valores):
+        return None
+    if not isinstance(valores[-1], int):
+        return None
+    return valores
+
+
+def _despues(campos, valores, op):
+    # (a, b) > (va, vb)  ==  a > va  OR  (a = va AND b > vb)
+    condiciones = []
+    for i, campo in enumerate(campos):
+        iguales = {c: v for c, v in zip(campos[:i], valores[:i])}
+        condiciones.append(Q(**iguales, **{f"{campo}__{op}": valores[i]}))
+    return reduce(or_, condiciones)
+
+
+def pagina_keyset(qs, campos, tras=None, antes=None, tam=30):
+    """
+    Página de `qs` ordenada ascendente por `campos` (el último debe ser único,
+    normalmente "id"). `tras`/`antes` son cursores de una página anterior.
+    """
+    campos = list(campos)
+    valores_tras = decodificar_cursor(tras, len(campos))
+    valores_antes = None if valores_tras else decodificar_cursor(antes, len(campos))
+
+    if valores_antes:
+        # Hacia atrás: se recorre en orden inverso y se da vuelta al final
+        filas = list(qs.filter(_despues(campos, valores_antes, "lt"))
+                     .order_by(*[f"-{c}" for c in campos])[:tam + 1])
+        hay_mas = len(filas) > tam
+        items = filas[:tam][::-1]
+        hay_antes, hay_despues = hay_mas, True
+    else:
+        if valores_tras:
+            qs = qs.filter(_despues(campos, valores_tras, "gt"))
+        filas = list(qs.order_by(*campos)[:tam + 1])
+        items = filas[:tam]
+        hay_antes, hay_despues = bool(valores_tras), len(filas) > tam
+
+    def cursor(obj):
+        return codificar_cursor(getattr(obj, c) for c in campos)
+
+    return Pagina(
+        items=items,
+        siguiente=cursor(items[-1]) if items and hay_despues else None,
+        anterior=cursor(items[0]) if items and hay_antes else None,
+    )
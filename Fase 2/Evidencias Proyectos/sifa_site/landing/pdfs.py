@@ -0,0 +1,361 @@
+# landing/pdfs.py
+"""
+PDFs del registro mensual fuera del request.
+
+- La vista pide el PDF con solicitar_pdf(): si ya existe en disco lo sirve,
+  si no encola un TrabajoPDF y responde "en proceso" (la página se refresca
+  sola hasta que el archivo está listo).
+- `clave` = sha256(hash de la grilla + versión de plantilla/CSS + cabecera).
+  Es el nombre del archivo en SIFA_PDF_DIR y es única en TrabajoPDF: dos
+  pedidos iguales comparten el mismo trabajo y el mismo archivo. La fecha
+  "Generado" que se imprime es la del render y queda en el archivo; no entra
+  en la clave, así un mes cerrado no vence al cambiar el día.
+- Con snapshot (mes cerrado) la clave sale de su hash sin armar la grilla:
+  servir un PDF que ya está en disco no la reconstruye.
+- El archivo se guarda siempre bajo la clave de la grilla con que se dibujó
+  (si el mes cambió entre el pedido y el render, queda bajo la clave nueva y
+  el próximo pedido lo encuentra).
+- Render: hilo del proceso web (SIFA_PDF_HILO) o `manage.py generar_pdfs --loop`.
+- Exportación masiva (cierre de mes): exportar_mes() reparte los PDF de todos
+  los residentes en un pool de procesos, reutiliza los que ya están en el
+  cache y arma un ZIP en disco (ExportacionRegistros lleva el progreso). Cada
+  PDF terminado renueva el lease; una exportación PROCESANDO sin avance por
+  SIFA_EXPORTACION_LEASE segundos (el proceso murió) se vuelve a tomar.
+- purgar() borra los PDF y los ZIP viejos; una exportación cuyo ZIP ya no
+  está se vuelve a armar al pedirla (views.registro_exportacion).
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+
+from . import pdfs_proceso
+from .models import ExportacionRegistros, Residente, TrabajoPDF
+from .registro import grilla_mes_con_hash, hash_datos, hash_snapshot, rango_mes, residentes_con_eventos
+
+try:
+    from weasyprint import HTML, CSS
+    _weasy_available = True
+except Exception:
+    _weasy_available = False
+
+logger = logging.getLogger(__name__)
+
+PLANTILLA = "residentes/registro_mensual_pdf.html"
+CSS_PDF = """
+  @page { size: A4 landscape; margin: 10mm; }
+  body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, 'Noto Sans', sans-serif; }
+  h3 { margin: 0 0 6px 0; }
+  .meta { color: #666; font-size: 11px; margin-bottom: 8px; }
+  table { width: 100%; border-collapse: collapse; font-size: 11px; table-layout: fixed; }
+  thead th { background: #eee; border: 1px solid #ccc; padding: 6px; }
+  td { border: 1px solid #ddd; padding: 4px 6px; text-align: center; word-wrap: break-word; }
+  td.label, th.label { text-align: left; font-weight: 600; width: 320px; }
+  thead { display: table-header-group; }
+  tr { page-break-inside: avoid; }
+  .legend { color:#555; font-size: 10px; margin-top: 6px; }
+"""
+
+
+@lru_cache(maxsize=1)
+def version_plantilla():
+    """Cambia si cambian la plantilla o el CSS (invalida el cache de archivos)."""
+    fuente = get_template(PLANTILLA).template.source
+    return hashlib.sha256((fuente + CSS_PDF).encode()).hexdigest()[:16]
+
+
+def directorio():
+    return Path(getattr(settings, "SIFA_PDF_DIR", settings.BASE_DIR / "pdf_cache"))
+
+
+def ruta_pdf(clave):
+    return directorio() / clave[:2] / f"{clave}.pdf"
+
+
+def nombre_archivo(residente_id, y, m):
+    return f"registro_{residente_id}_{y}-{m:02d}.pdf"
+
+
+def clave_pdf(res, y, m, grilla_hash):
+    partes = [grilla_hash, version_plantilla(), str(res.pk), res.nombre_completo, f"{y}-{m:02d}"]
+    return hashlib.sha256("|".join(partes).encode()).hexdigest()
+
+
+def contenido(res, y, m):
+    """(grilla, clave): la clave sale de la misma grilla que se va a dibujar."""
+    grilla, h = grilla_mes_con_hash(res, y, m)
+    return grilla, clave_pdf(res, y, m, h or hash_datos(grilla.to_dict()))
+
+
+def clave_vigente(res, y, m):
+    """(clave, grilla): con snapshot, solo su hash (grilla None); si no, se arma la grilla."""
+    h = hash_snapshot(res, y, m)
+    if h is not None:
+        return clave_pdf(res, y, m, h), None
+    grilla, clave = contenido(res, y, m)
+    return clave, grilla
+
+
+def solicitar_pdf(res, y, m, usuario=None, reintentar=False):
+    """
+    Devuelve (clave, ruta, trabajo). `ruta` solo si el PDF ya está en disco;
+    si no, deja (o reutiliza) el TrabajoPDF de esa clave y despierta al worker.
+    Un trabajo en ERROR no se reencola solo: hay que pedirlo con reintentar=True.
+    """
+    clave, _ = clave_vigente(res, y, m)
+    ruta = ruta_pdf(clave)
+    if ruta.exists():
+        return clave, ruta, None
+
+    Estado = TrabajoPDF.Estado
+    trabajo, creado = TrabajoPDF.objects.get_or_create(
+        clave=clave,
+        defaults={"residente": res, "year": y, "month": m, "solicitado_por": usuario},
+    )
+    # LISTO sin archivo (cache borrado) o ERROR con reintento: vuelve a la cola
+    reencolar = [Estado.LISTO] + ([Estado.ERROR] if reintentar else [])
+    if not creado and trabajo.estado in reencolar:
+        TrabajoPDF.objects.filter(pk=trabajo.pk, estado=trabajo.estado).update(
+            estado=Estado.PENDIENTE, error="")
+        trabajo.estado = Estado.PENDIENTE
+    if trabajo.estado == Estado.PENDIENTE:
+        transaction.on_commit(despertar_worker)
+    return clave, None, trabajo
+
+
+def _escribir_pdf(ruta, res, y, m, grilla):
+    if not _weasy_available:
+        raise RuntimeError("WeasyPrint no está instalado en el servidor.")
+    html_string = render_to_string(PLANTILLA, {
+        "residente": res,
+        "year": y,
+        "month": m,
+        "days": grilla.days,
+        "rows": grilla.filas,
+        "generated_at": timezone.localdate(),
+    })
+    pdf = HTML(string=html_string, base_url=str(settings.BASE_DIR)).write_pdf(
+        stylesheets=[CSS(string=CSS_PDF)])
+
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ruta.with_name(f"{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(pdf)
+    os.replace(tmp, ruta)
+    return ruta
+
+
+def renderizar(trabajo):
+    """
+    Genera el PDF del trabajo y lo escribe (atómicamente) bajo la clave de la
+    grilla que se dibujó.
+    """
+    res, y, m = trabajo.residente, trabajo.year, trabajo.month
+    grilla, clave = contenido(res, y, m)
+    if clave != trabajo.clave:
+        logger.info("PDF %s: el mes cambió desde el pedido, se guarda como %s", trabajo.clave, clave)
+    return _escribir_pdf(ruta_pdf(clave), res, y, m, grilla)
+
+
+def pdf_en_cache(residente_id, y, m):
+    """(ruta, ya_estaba): deja en el cache el PDF vigente del residente/mes."""
+    res = Residente.objects.get(pk=residente_id)
+    clave, grilla = clave_vigente(res, y, m)
+    ruta = ruta_pdf(clave)
+    if ruta.exists():
+        return ruta, True
+    if grilla is None:
+        grilla, clave = contenido(res, y, m)
+        ruta = ruta_pdf(clave)
+    return _escribir_pdf(ruta, res, y, m, grilla), False
+
+
+def procesar_pendientes(limite=5):
+    """
+    Renderiza los trabajos en cola. Cada uno se reserva con un UPDATE condicional
+    (como el outbox); los PROCESANDO que quedaron colgados más de
+    SIFA_PDF_LEASE segundos se vuelven a tomar. Devuelve (listos, fallidos).
+    """
+    Estado = TrabajoPDF.Estado
+    lease = timedelta(seconds=int(getattr(settings, "SIFA_PDF_LEASE", 300)))
+    max_intentos = int(getattr(settings, "SIFA_PDF_MAX_INTENTOS", 3))
+
+    ahora = timezone.now()
+    lote = list(
+        TrabajoPDF.objects
+        .filter(Q(estado=Estado.PENDIENTE) | Q(estado=Estado.PROCESANDO, iniciado_en__lt=ahora - lease))
+        .select_related("residente")
+        .order_by("creado_en", "id")[:limite]
+    )
+    listos = fallidos = 0
+    for trabajo in lote:
+        reservado = (
+            TrabajoPDF.objects
+            .filter(pk=trabajo.pk, estado=trabajo.estado, iniciado_en=trabajo.iniciado_en)
+            .update(estado=Estado.PROCESANDO, iniciado_en=ahora, intentos=trabajo.intentos + 1)
+        )
+        if not reservado:
+            continue  # lo tomó otro worker
+        trabajo.intentos += 1
+        try:
+            renderizar(trabajo)
+        except Exception as e:
+            logger.exception("PDF %s: error al renderizar", trabajo.clave)
+            trabajo.error = str(e)[:2000]
+            trabajo.estado = Estado.ERROR if trabajo.intentos >= max_intentos else Estado.PENDIENTE
+            fallidos += 1
+        else:
+            trabajo.estado, trabajo.error = Estado.LISTO, ""
+            listos += 1
+        trabajo.terminado_en = timezone.now()
+        trabajo.save(update_fields=["estado", "error", "terminado_en"])
+    return listos, fallidos
+
+
+def purgar(dias):
+    """Borra los PDFs y los ZIP de exportación con más de `dias` días (por fecha de modificación)."""
+    limite = timezone.now().timestamp() - dias * 86400
+    borrados = 0
+    for patron in ("*/*.pdf", "zip/*.zip", "zip/*.tmp"):
+        for ruta in directorio().glob(patron):
+            if ruta.stat().st_mtime < limite:
+                ruta.unlink(missing_ok=True)
+                borrados += 1
+    return borrados
+
+
+# --- Exportación masiva (ZIP del mes) ---
+def _renders(ids, y, m, procesos):
+    """Genera (residente_id, ruta, ya_estaba) a medida que terminan."""
+    if procesos <= 1 or len(ids) <= 1:
+        for residente_id in ids:
+            yield pdfs_proceso.pdf_en_cache(residente_id, y, m)
+        return
+    # "spawn": procesos limpios, sin los hilos ni las conexiones del proceso web
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=ctx, initializer=pdfs_proceso.iniciar,
+                             initargs=(connection.settings_dict["NAME"], str(directorio()))) as pool:
+        futuros = [pool.submit(pdfs_proceso.pdf_en_cache, residente_id, y, m) for residente_id in ids]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+
+
+def exportaciones_pendientes():
+    """PENDIENTE, o PROCESANDO con el lease vencido (el proceso que la tenía murió)."""
+    Estado = ExportacionRegistros.Estado
+    lease = timedelta(seconds=int(getattr(settings, "SIFA_EXPORTACION_LEASE", 600)))
+    colgada = Q(iniciado_en__lt=timezone.now() - lease) | Q(iniciado_en__isnull=True)
+    return ExportacionRegistros.objects.filter(Q(estado=Estado.PENDIENTE) | Q(colgada, estado=Estado.PROCESANDO))
+
+
+def reservar_exportacion(exportacion_id):
+    """Pasa la exportación a PROCESANDO (con lease nuevo); False si ya la tomó otro."""
+    return bool(
+        exportaciones_pendientes().filter(pk=exportacion_id)
+        .update(estado=ExportacionRegistros.Estado.PROCESANDO, iniciado_en=timezone.now())
+    )
+
+
+def exportar_mes(exportacion, procesos=None, progreso=None):
+    """
+    Llena el ZIP de la exportación: un PDF por residente con eventos ese mes.
+    Los PDF se generan en `procesos` procesos (def. SIFA_PDF_PROCESOS o
+    núcleos disponibles) y se agregan al ZIP apenas terminan. `progreso(hechos,
+    total)` se llama tras cada PDF. Devuelve la ruta del ZIP.
+    """
+    Estado = ExportacionRegistros.Estado
+    y, m = exportacion.year, exportacion.month
+    procesos = procesos or int(getattr(settings, "SIFA_PDF_PROCESOS", 0) or os.cpu_count() or 1)
+
+    ids = residentes_con_eventos(*rango_mes(y, m))
+    nombres = dict(Residente.objects.filter(pk__in=ids).values_list("pk", "nombre_completo"))
+    qs = ExportacionRegistros.objects.filter(pk=exportacion.pk)
+    qs.update(estado=Estado.PROCESANDO, total=len(ids), hechos=0, desde_cache=0, error="",
+              iniciado_en=timezone.now())
+
+    destino = directorio() / "zip" / f"registros_{y}-{m:02d}_{exportacion.pk}.zip"
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    # Por proceso: si se retomó una exportación dada por muerta, no se pisan
+    tmp = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+    hechos = desde_cache = 0
+    try:
+        # Los PDF ya vienen comprimidos: ZIP_STORED
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as zf:
+            for residente_id, ruta, cache in _renders(ids, y, m, procesos):
+                nombre = nombres.get(residente_id, "").replace("/", "-")
+                zf.write(ruta, arcname=f"{nombre} - {nombre_archivo(residente_id, y, m)}".strip(" -"))
+                hechos += 1
+                desde_cache += cache
+                qs.update(hechos=hechos, desde_cache=desde_cache, iniciado_en=timezone.now())
+                if progreso:
+                    progreso(hechos, len(ids))
+        os.replace(tmp, destino)
+    except Exception as e:
+        tmp.unlink(missing_ok=True)
+        qs.update(estado=Estado.ERROR, error=str(e)[:2000], terminado_en=timezone.now())
+        raise
+    qs.update(estado=Estado.LISTO, archivo=str(destino), terminado_en=timezone.now())
+    return destino
+
+
+def _correr_exportacion(exportacion_id):
+    if not reservar_exportacion(exportacion_id):
+        return
+    try:
+        exportar_mes(ExportacionRegistros.objects.get(pk=exportacion_id))
+    except Exception:
+        logger.exception("Exportación %s: error", exportacion_id)
+    finally:
+        close_old_connections()
+
+
+def lanzar_exportacion(exportacion):
+    """Corre la exportación en un hilo del proceso web (SIFA_PDF_HILO) al confirmar la transacción."""
+    if not getattr(settings, "SIFA_PDF_HILO", False):
+        return  # la toma `manage.py exportar_registros --pendientes`
+    transaction.on_commit(lambda: threading.Thread(
+        target=_correr_exportacion, args=(exportacion.pk,), name="sifa-export", daemon=True
+    ).start())
+
+
+# --- Worker en hilo (opcional, SIFA_PDF_HILO) ---
+_despertar = threading.Event()
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def _bucle_worker():
+    intervalo = int(getattr(settings, "SIFA_PDF_INTERVALO", 30))
+    while True:
+        _despertar.wait(timeout=intervalo)
+        _despertar.clear()
+        try:
+            while sum(procesar_pendientes()):
+                pass
+        except Exception:
+            logger.exception("PDF: error procesando la cola")
+        finally:
+            close_old_connections()
+
+
+def despertar_worker():
+    """Arranca (una vez por proceso) el hilo de render y le avisa que hay trabajo."""
+    global _hilo
+    if not getattr(settings, "SIFA_PDF_HILO", False):
+        return
+    with _hilo_lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_bucle_worker, name="sifa-pdf", daemon=True)
+            _hilo.start()
+    _despertar.set()
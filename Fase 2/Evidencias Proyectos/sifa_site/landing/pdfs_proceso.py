@@ -0,0 +1,23 @@
+# landing/pdfs_proceso.py
+"""
+Funciones que corren dentro de los procesos del pool de exportación
+(landing.pdfs.exportar_mes). Con "spawn" el proceso hijo importa este módulo
+antes de tener Django listo, por eso no importa modelos al cargar.
+"""
+
+
+def iniciar(nombre_bd=None, directorio_pdf=None):
+    """Misma base y mismo directorio que el proceso padre (sus settings pueden haber cambiado al correr)."""
+    import django
+    from django.conf import settings
+    if nombre_bd:
+        settings.DATABASES["default"]["NAME"] = nombre_bd
+    if directorio_pdf:
+        settings.SIFA_PDF_DIR = directorio_pdf
+    django.setup()
+
+
+def pdf_en_cache(residente_id, y, m):
+    from .pdfs import pdf_en_cache as _pdf_en_cache
+    ruta, cache = _pdf_en_cache(residente_id, y, m)
+    return residente_id, str(ruta), cache
@@ -0,0 +1,327 @@
+# landing/registro.py
+"""
+Grilla del registro de administración (MAR): una fila por (orden, hora local)
+y una columna por día. La usan la vista registro_mensual, el PDF y las
+exportaciones.
+
+- Una sola consulta con values_list (solo las columnas necesarias), ordenada.
+- Cada fila guarda un arreglo de códigos de estado por día (0 = vacío); el
+  texto "✓ (Ana) / R (Luis)" y la clase CSS se arman al recorrer la fila.
+- Sirve para cualquier rango de fechas (mes, trimestre...).
+
+Los meses cerrados se guardan ya calculados en RegistroMensualSnapshot
+(grilla + sha256). Se generan al pedirlos o con `manage.py snapshot_registros`.
+Una corrección tardía (señales de Administracion, relleno de la agenda) borra
+solo el snapshot de ese residente y mes.
+"""
+import hashlib
+import json
+from array import array
+from calendar import monthrange
+from dataclasses import dataclass, field
+from datetime import date, datetime, time as dtime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Administracion, RegistroMensualSnapshot, Residente
+
+VACIO, PENDIENTE, DADA, OMITIDA, RECHAZADA = range(5)
+CODIGO = {
+    Administracion.Estado.PENDIENTE: PENDIENTE,
+    Administracion.Estado.DADA: DADA,
+    Administracion.Estado.OMITIDA: OMITIDA,
+    Administracion.Estado.RECHAZADA: RECHAZADA,
+}
+SIMBOLO = ("", "•", "✓", "✕", "R")
+CSS = ("empty", "status-pend", "status-ok", "status-omit", "status-rech")
+
+
+def fmt_hora(t):
+    """‘10 am’, ‘10:30 pm’ (mismo formato que views._fmt_ampm)."""
+    s = t.strftime("%I:%M %p").lower()
+    if s.startswith("0"):
+        s = s[1:]
+    return s.replace(".", "")
+
+
+def _nombre_corto(first, last, username):
+    name = f"{first or ''} {last or ''}".strip()
+    return name.split()[0] if name else (username or "")
+
+
+@dataclass
+class Fila:
+    orden_id: int
+    hora: dtime
+    medicamento: str
+    dosis: str
+    codigos: array                                   # un código por día
+    marcas: dict = field(default_factory=dict)       # idx -> [(codigo, quien)] si hay nombre o más de una
+
+    @property
+    def label(self):
+        return f"{self.medicamento} · {self.dosis} — {fmt_hora(self.hora)}"
+
+    def _texto(self, idx):
+        extra = self.marcas.get(idx)
+        if extra is None:
+            return SIMBOLO[self.codigos[idx]]
+        return " / ".join(f"{SIMBOLO[c]} ({q})" if q else SIMBOLO[c] for c, q in extra)
+
+    @property
+    def celdas(self):
+        """(texto, clase_css) por día, para los templates."""
+        for idx, c in enumerate(self.codigos):
+            yield (self._texto(idx) if c else ""), CSS[c]
+
+    @property
+    def cells(self):
+        """Solo los textos por día (exportaciones)."""
+        return [self._texto(i) if c else "" for i, c in enumerate(self.codigos)]
+
+    def to_dict(self):
+        return {
+            "orden_id": self.orden_id,
+            "hora": self.hora.strftime("%H:%M"),
+            "medicamento": self.medicamento,
+            "dosis": self.dosis,
+            "codigos": "".join(map(str, self.codigos)),
+            "marcas": {str(i): m for i, m in sorted(self.marcas.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        hh, mm = d["hora"].split(":")
+        return cls(
+            d["orden_id"], dtime(int(hh), int(mm)), d["medicamento"], d["dosis"],
+            array("b", (int(c) for c in d["codigos"])),
+            {int(i): [tuple(x) for x in m] for i, m in d["marcas"].items()},
+        )
+
+
+@dataclass
+class Grilla:
+    desde: date
+    hasta: date
+    filas: list
+    totales: dict
+
+    @property
+    def dias(self):
+        return [self.desde + timedelta(days=i) for i in range((self.hasta - self.desde).days + 1)]
+
+    @property
+    def days(self):
+        """Números de día (1..31) para la cabecera de la tabla."""
+        return [d.day for d in self.dias]
+
+    def to_dict(self):
+        return {
+            "desde": self.desde.isoformat(),
+            "hasta": self.hasta.isoformat(),
+            "totales": self.totales,
+            "filas": [f.to_dict() for f in self.filas],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            date.fromisoformat(d["desde"]), date.fromisoformat(d["hasta"]),
+            [Fila.from_dict(f) for f in d["filas"]], d["totales"],
+        )
+
+
+COLUMNAS = (
+    "orden_id", "programada_para", "estado", "realizada_por_id",
+    "orden__producto__nombre", "orden__producto__potencia", "orden__dosis",
+    "realizada_por__first_name", "realizada_por__last_name", "realizada_por__username",
+)
+
+
+def _limites(desde, hasta):
+    tz = timezone.get_current_timezone()
+    inicio = timezone.make_aware(datetime.combine(desde, dtime.min), tz)
+    fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), dtime.min), tz)
+    return inicio, fin
+
+
+class _Pivot:
+    """Acumula eventos (filas de COLUMNAS) de UN residente y arma la Grilla."""
+
+    def __init__(self, desde, hasta, tz, quienes):
+        self.desde, self.hasta, self.tz = desde, hasta, tz
+        self.n_dias = (hasta - desde).days + 1
+        self.quienes = quienes  # cache user_id -> nombre corto (compartido entre residentes)
+        self.filas = {}
+        self.totales = dict.fromkeys(("DADA", "OMITIDA", "RECHAZADA", "PENDIENTE"), 0)
+
+    def agregar(self, orden_id, programada, estado, user_id, nombre, potencia, dosis, first, last, username):
+        local = programada.astimezone(self.tz)
+        hora = local.time().replace(second=0, microsecond=0)
+        fila = self.filas.get((orden_id, hora))
+        if fila is None:
+            fila = self.filas[(orden_id, hora)] = Fila(
+                orden_id, hora, f"{nombre} {potencia}".strip(), dosis, array("b", bytes(self.n_dias))
+            )
+        codigo = CODIGO[estado]
+        self.totales[estado] += 1
+
+        quien = ""
+        if user_id and codigo != PENDIENTE:
+            quien = self.quienes.get(user_id)
+            if quien is None:
+                quien = self.quienes[user_id] = _nombre_corto(first, last, username)
+
+        idx = (local.date() - self.desde).days
+        previo = fila.codigos[idx]
+        if previo:
+            fila.marcas.setdefault(idx, [(previo, "")]).append((codigo, quien))
+        else:
+            fila.codigos[idx] = codigo
+            if quien:
+                fila.marcas[idx] = [(codigo, quien)]
+
+    def grilla(self):
+        ordenadas = sorted(self.filas.values(), key=lambda f: (f"{f.medicamento} · {f.dosis}".lower(), f.hora))
+        return Grilla(self.desde, self.hasta, ordenadas, self.totales)
+
+
+def construir_grilla(residente, desde, hasta):
+    """Grilla del residente para [desde, hasta] (fechas locales, ambas incluidas)."""
+    inicio, fin = _limites(desde, hasta)
+    eventos = (
+        Administracion.objects
+        .filter(residente=residente, programada_para__gte=inicio, programada_para__lt=fin)
+        .order_by("programada_para")
+        .values_list(*COLUMNAS)
+    )
+    pivot = _Pivot(desde, hasta, timezone.get_current_timezone(), {})
+    for ev in eventos.iterator(chunk_size=2000):
+        pivot.agregar(*ev)
+    return pivot.grilla()
+
+
+def grillas_todos(desde, hasta, residentes=None, chunk_size=2000):
+    """
+    Genera (residente, grilla) para todos los residentes en una sola pasada:
+    una consulta de eventos ordenada por residente (la misma clave que la de
+    residentes) que se recorre en paralelo con ellos. Solo hay en memoria la
+    grilla del residente en curso.
+
+    Por defecto: residentes activos más los inactivos con eventos en el rango.
+    """
+    inicio, fin = _limites(desde, hasta)
+    en_rango = Administracion.objects.filter(programada_para__gte=inicio, programada_para__lt=fin)
+    if residentes is None:
+        residentes = Residente.objects.filter(
+            Q(activo=True) | Q(pk__in=en_rango.values("residente_id"))
+        )
+    residentes = residentes.order_by("nombre_completo", "pk")
+    eventos = (
+        en_rango
+        .filter(residente__in=residentes.values("pk"))
+        .order_by("residente__nombre_completo", "residente_id", "programada_para")
+        .values_list("residente_id", *COLUMNAS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    tz, quienes = timezone.get_current_timezone(), {}
+    ev = next(eventos, None)
+    for res in residentes.iterator(chunk_size=chunk_size):
+        pivot = _Pivot(desde, hasta, tz, quienes)
+        while ev is not None and ev[0] == res.pk:
+            pivot.agregar(*ev[1:])
+            ev = next(eventos, None)
+        yield res, pivot.grilla()
+
+
+def residentes_con_eventos(desde, hasta):
+    """Ids de residentes con al menos un evento en [desde, hasta]."""
+    inicio, fin = _limites(desde, hasta)
+    return sorted(set(
+        Administracion.objects
+        .filter(programada_para__gte=inicio, programada_para__lt=fin)
+        .values_list("residente_id", flat=True)
+        .distinct()
+    ))
+
+
+def rango_mes(y, m):
+    return date(y, m, 1), date(y, m, monthrange(y, m)[1])
+
+
+def grilla_mes(residente, y, m):
+    return construir_grilla(residente, *rango_mes(y, m))
+
+
+# --- Snapshots de meses cerrados ---
+def mes_cerrado(y, m, hoy=None):
+    hoy = hoy or timezone.localdate()
+    return (y, m) < (hoy.year, hoy.month)
+
+
+def hash_datos(datos):
+    return hashlib.sha256(
+        json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def guardar_snapshot(residente, y, m):
+    """Calcula la grilla del mes y la guarda (reemplaza la anterior). Devuelve el snapshot."""
+    datos = grilla_mes(residente, y, m).to_dict()
+    snap, _ = RegistroMensualSnapshot.objects.update_or_create(
+        residente_id=getattr(residente, "pk", residente), year=y, month=m,
+        defaults={"datos": datos, "hash": hash_datos(datos)},
+    )
+    return snap
+
+
+def grilla_mes_con_hash(residente, y, m):
+    """
+    (grilla, hash) del mes. Si el mes está cerrado se sirve desde el snapshot
+    (y se crea si falta); el mes en curso se calcula siempre y el hash es None.
+    """
+    if not mes_cerrado(y, m):
+        return grilla_mes(residente, y, m), None
+    snap = RegistroMensualSnapshot.objects.filter(residente=residente, year=y, month=m).first()
+    if snap is None:
+        try:
+            with transaction.atomic():
+                snap = guardar_snapshot(residente, y, m)
+        except IntegrityError:  # otro request lo creó en paralelo
+            snap = RegistroMensualSnapshot.objects.get(residente=residente, year=y, month=m)
+    return Grilla.from_dict(snap.datos), snap.hash
+
+
+def hash_snapshot(residente, y, m):
+    """Hash del snapshot del mes cerrado sin cargar la grilla; None si no hay."""
+    if not mes_cerrado(y, m):
+        return None
+    return (RegistroMensualSnapshot.objects.filter(residente=residente, year=y, month=m)
+            .values_list("hash", flat=True).first())
+
+
+def invalidar_snapshots(residente_id=None, fechas=()):
+    """
+    Borra los snapshots de los meses de `fechas` (date o datetime aware).
+    Con residente_id, solo los de ese residente; sin fechas, todos los suyos.
+    """
+    qs = RegistroMensualSnapshot.objects.all()
+    if residente_id is not None:
+        qs = qs.filter(residente_id=residente_id)
+    meses = set()
+    for f in fechas:
+        if isinstance(f, datetime):
+            f = timezone.localtime(f).date()
+        meses.add((f.year, f.month))
+    if meses:
+        filtro = None
+        for y, m in meses:
+            q = Q(year=y, month=m)
+            filtro = q if filtro is None else filtro | q
+        qs = qs.filter(filtro)
+    elif residente_id is None:
+        return 0
+    return qs.delete()[0]
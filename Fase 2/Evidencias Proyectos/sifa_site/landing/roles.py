@@ -1,6 +1,11 @@
 # landing/roles.py
+import threading
 from functools import wraps
+from time import monotonic
+
+from django.conf import settings
 from django.contrib.auth.models import Group
+from django.core.cache import caches
 from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
 from django.contrib import messages
@@ -10,8 +15,95 @@ TENS_GROUP = "TENS"
 CUIDADORA_GROUP = "CUIDADORA"
 DOCTOR_GROUP = "DOCTOR"  # << nuevo
 
+# Cache de roles: una consulta por usuario, guardada en
+# - el objeto user (dura el request);
+# - la memoria del proceso por ROLES_LOCAL_TTL segundos: leer no consulta nada;
+# - si settings.SIFA_ROLES_CACHE nombra un cache compartido en memoria (Redis o
+#   memcached en CACHES), también ahí por ROLES_CACHE_TTL, con la versión
+#   global con que se calculó (un solo get_many: versión + roles).
+# Se invalida al cambiar la membresía de grupos (landing/signals.py y
+# assign_single_role): en este proceso y en el cache compartido en el acto; los
+# demás procesos lo ven al vencer su copia local.
+ROLES_CACHE_TTL = 300
+ROLES_LOCAL_TTL = 30
+_LOCAL_MAX = 5000
+_VERSION_KEY = "sifa:roles:ver"
+
+_local = {}                      # user_id -> (vence, roles)
+_local_lock = threading.Lock()
+
+
+def _cache_key(user_id):
+    return f"sifa:roles:{user_id}"
+
+
+def _compartido():
+    alias = getattr(settings, "SIFA_ROLES_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def _de_la_base(user):
+    return frozenset(user.groups.values_list("name", flat=True))
+
+
+def _del_compartido(user, compartido):
+    key = _cache_key(user.pk)
+    hallado = compartido.get_many([_VERSION_KEY, key])
+    ver = hallado.get(_VERSION_KEY)
+    if ver is None:
+        ver = compartido.get_or_set(_VERSION_KEY, 1, None)
+    guardado = hallado.get(key)
+    if guardado is not None and guardado[0] == ver:
+        return guardado[1]
+    roles = _de_la_base(user)
+    compartido.set(key, (ver, roles), ROLES_CACHE_TTL)
+    return roles
+
+
+def roles_de(user):
+    """frozenset con los nombres de grupo del usuario (vacío si es anónimo)."""
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, "_sifa_roles", None)
+    if roles is None:
+        ahora = monotonic()
+        guardado = _local.get(user.pk)
+        if guardado is not None and guardado[0] > ahora:
+            roles = guardado[1]
+        else:
+            compartido = _compartido()
+            roles = _de_la_base(user) if compartido is None else _del_compartido(user, compartido)
+            with _local_lock:
+                if len(_local) >= _LOCAL_MAX:
+                    _local.clear()
+                _local[user.pk] = (ahora + ROLES_LOCAL_TTL, roles)
+        user._sifa_roles = roles
+    return roles
+
+
+def invalidar_roles(user_or_id=None):
+    """Olvida los roles cacheados de un usuario; sin argumento, los de todos."""
+    compartido = _compartido()
+    if user_or_id is None:
+        with _local_lock:
+            _local.clear()
+        if compartido is not None:
+            try:
+                compartido.incr(_VERSION_KEY)
+            except ValueError:
+                compartido.set(_VERSION_KEY, 2, None)
+        return
+    user_id = getattr(user_or_id, "pk", user_or_id)
+    with _local_lock:
+        _local.pop(user_id, None)
+    if compartido is not None:
+        compartido.delete(_cache_key(user_id))
+    if hasattr(user_or_id, "_sifa_roles"):
+        del user_or_id._sifa_roles
+
+
 def _in_group(user, name):
-    return user.is_authenticated and user.groups.filter(name=name).exists()
+    return name in roles_de(user)
 
 def is_admin(user): return _in_group(user, ADMIN_GROUP) or user.is_superuser
 def is_tens(user): return _in_group(user, TENS_GROUP)
@@ -0,0 +1,235 @@
+# landing/signals.py
+"""
+Mantiene la agenda al día cuando cambian recetas, órdenes, horas o el estado
+activo de un residente. Cada señal solo marca las órdenes afectadas; la
+regeneración corre una vez al confirmar la transacción (landing.agenda).
+También invalida los snapshots de meses cerrados del registro mensual
+(landing.registro) y el cache de roles cuando cambian los grupos de un usuario,
+reindexa la búsqueda del catálogo (landing.busqueda) al guardar un Producto,
+lleva los contadores por hora y estado (landing.contadores) de cada evento y
+publica sus cambios de estado al tablero en vivo (landing.tablero) y anota
+en landing.sincronizacion lo que la app Android debe volver a pedir.
+"""
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .agenda import programar_regeneracion
+from .busqueda import indexar_productos, indexar_residentes
+from .contadores import aplicar as aplicar_contadores
+from .models import Administracion, Asignacion, HoraProgramada, OrdenMedicamento, Producto, Receta, Residente
+from .registro import invalidar_snapshots, mes_cerrado
+from .roles import invalidar_roles
+from . import sincronizacion
+from .tablero import publicar
+
+
+@receiver(post_save, sender=OrdenMedicamento)
+def _orden_guardada(sender, instance, raw=False, **kwargs):
+    if not raw:
+        programar_regeneracion([instance.pk])
+
+
+@receiver(post_save, sender=HoraProgramada)
+@receiver(post_delete, sender=HoraProgramada)
+def _hora_cambiada(sender, instance, raw=False, **kwargs):
+    if not raw:
+        programar_regeneracion([instance.orden_id])
+
+
+@receiver(post_save, sender=Receta)
+def _receta_guardada(sender, instance, created, raw=False, **kwargs):
+    # Una receta recién creada aún no tiene órdenes
+    if raw or created:
+        return
+    programar_regeneracion(instance.ordenes.values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=Residente)
+def _residente_antes(sender, instance, raw=False, **kwargs):
+    instance._activo_previo = None
+    if raw or not instance.pk:
+        return
+    instance._activo_previo = (
+        Residente.objects.filter(pk=instance.pk).values_list('activo', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Residente)
+def _residente_guardado(sender, instance, created, raw=False, **kwargs):
+    previo = getattr(instance, '_activo_previo', None)
+    if raw or created or previo is None or previo == instance.activo:
+        return
+    programar_regeneracion(
+        OrdenMedicamento.objects
+        .filter(receta__residente=instance)
+        .values_list('id', flat=True)
+    )
+
+
+# --- Snapshots del registro mensual (landing.registro) ---
+@receiver(post_save, sender=Administracion)
+@receiver(post_delete, sender=Administracion)
+def _administracion_cambiada(sender, instance, raw=False, **kwargs):
+    # Solo importa si el evento cae en un mes ya cerrado (corrección tardía)
+    if raw:
+        return
+    local = timezone.localtime(instance.programada_para)
+    if mes_cerrado(local.year, local.month):
+        invalidar_snapshots(instance.residente_id, [local.date()])
+
+
+# --- Contadores por día/hora/estado (landing.contadores) ---
+@receiver(pre_save, sender=Administracion)
+def _administracion_antes(sender, instance, raw=False, **kwargs):
+    instance._contado_previo = None
+    if raw or not instance.pk:
+        return
+    instance._contado_previo = (
+        Administracion.objects.filter(pk=instance.pk)
+        .values_list('residente_id', 'programada_para', 'estado').first()
+    )
+
+
+@receiver(post_save, sender=Administracion)
+def _administracion_contar(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    actual = (instance.residente_id, instance.programada_para, instance.estado)
+    previo = getattr(instance, '_contado_previo', None)
+    if previo == actual:
+        return
+    cambios = [(*actual, 1)]
+    if previo is not None:
+        cambios.append((*previo, -1))
+    aplicar_contadores(cambios)
+
+
+@receiver(post_save, sender=Administracion)
+def _administracion_publicar(sender, instance, created, raw=False, **kwargs):
+    previo = getattr(instance, '_contado_previo', None)
+    if raw or created or previo is None or previo[2] == instance.estado:
+        return
+    publicar([(instance.pk, instance.residente_id, instance.estado, instance.realizada_por_id)])
+
+
+@receiver(pre_delete, sender=Administracion)
+def _administracion_antes_de_borrar(sender, instance, **kwargs):
+    # La instancia puede estar desactualizada: se descuenta lo que hay en la base
+    instance._contado_previo = (
+        Administracion.objects.filter(pk=instance.pk)
+        .values_list('residente_id', 'programada_para', 'estado').first()
+    )
+
+
+@receiver(post_delete, sender=Administracion)
+def _administracion_descontar(sender, instance, **kwargs):
+    previo = getattr(instance, '_contado_previo', None)
+    if previo is not None:
+        aplicar_contadores([(*previo, -1)])
+
+
+# --- Registro de cambios de la API de sincronización (landing.sincronizacion) ---
+@receiver(post_save, sender=Administracion)
+def _administracion_sync(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previo = getattr(instance, '_contado_previo', None)
+    eventos = [(instance.pk, instance.programada_para)]
+    if previo is not None and previo[1] != instance.programada_para:
+        eventos.append((instance.pk, previo[1]))   # también sale del día anterior
+    sincronizacion.registrar_eventos(eventos)
+
+
+@receiver(post_delete, sender=Administracion)
+def _administracion_sync_borrada(sender, instance, **kwargs):
+    previo = getattr(instance, '_contado_previo', None)
+    sincronizacion.registrar_eventos([(instance.pk, previo[1] if previo else instance.programada_para)])
+
+
+@receiver(post_save, sender=OrdenMedicamento)
+@receiver(post_delete, sender=OrdenMedicamento)
+def _orden_sync(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sincronizacion.registrar_ordenes([instance.pk])
+
+
+@receiver(post_save, sender=Asignacion)
+@receiver(post_delete, sender=Asignacion)
+def _asignacion_sync(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sincronizacion.registrar_asignaciones(instance.fecha)
+
+
+_CAMPOS_ETIQUETA = {'producto', 'dosis'}
+
+
+@receiver(pre_save, sender=OrdenMedicamento)
+def _orden_antes(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Stock o activo no cambian la grilla: solo se mira la etiqueta previa si puede cambiar
+    instance._etiqueta_previa = None
+    if raw or not instance.pk or (update_fields is not None and not _CAMPOS_ETIQUETA & set(update_fields)):
+        return
+    instance._etiqueta_previa = (
+        OrdenMedicamento.objects.filter(pk=instance.pk).values_list('producto_id', 'dosis').first()
+    )
+
+
+@receiver(post_save, sender=OrdenMedicamento)
+def _orden_snapshot(sender, instance, created, raw=False, **kwargs):
+    # Cambian producto/dosis: cambian las etiquetas de las filas
+    previa = getattr(instance, '_etiqueta_previa', None)
+    if raw or created or previa is None or previa == (instance.producto_id, instance.dosis):
+        return
+    residente_id = Receta.objects.filter(pk=instance.receta_id).values_list('residente_id', flat=True).first()
+    invalidar_snapshots(residente_id)
+
+
+@receiver(post_save, sender=Producto)
+def _producto_snapshot(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    for residente_id in (
+        Receta.objects.filter(ordenes__producto=instance).values_list('residente_id', flat=True).distinct()
+    ):
+        invalidar_snapshots(residente_id)
+
+
+# --- Índice de búsqueda del catálogo (landing.busqueda) ---
+@receiver(post_save, sender=Producto)
+def _producto_indexar(sender, instance, raw=False, **kwargs):
+    if not raw:
+        indexar_productos([instance])
+
+
+@receiver(post_save, sender=Residente)
+def _residente_indexar(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and (update_fields is None or 'nombre_clave' in update_fields):
+        indexar_residentes([instance])
+
+
+# --- Cache de roles (landing.roles.roles_de) ---
+@receiver(m2m_changed, sender=User.groups.through)
+def _grupos_cambiados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        invalidar_roles(instance)  # user.groups.add/remove/clear
+    elif pk_set:
+        for user_id in pk_set:     # group.user_set.add/remove
+            invalidar_roles(user_id)
+    else:
+        invalidar_roles()          # group.user_set.clear(): afecta a varios
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def _grupo_cambiado(sender, **kwargs):
+    invalidar_roles()
+
+
+@receiver(post_save, sender=User)
+def _usuario_creado(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        invalidar_roles(instance)  # un id reutilizado no hereda los roles cacheados del anterior
@@ -0,0 +1,239 @@
+# landing/sincronizacion.py
+"""
+API de sincronización para la app Android (views.api_tablero).
+
+La app pide el tablero de un día y guarda el `version` que viene en la
+respuesta; en la siguiente consulta manda ?desde=<version> y recibe solo lo
+que cambió: las Administracion, el stock de las OrdenMedicamento y las
+Asignacion del día, más los ids borrados.
+
+- Cada cambio deja una fila en CambioSync en la misma transacción: señales de
+  landing.signals (de a uno), views._marcar_en_bloque, landing.stock (UPDATE
+  de stock), landing.agenda (agenda generada en bloque) y
+  views.asignaciones_generar. La fila solo dice qué cambió; el contenido se
+  lee de las tablas al responder.
+- version() son tres lecturas de una fila por el índice de la clave
+  primaria: si no cambió nada, la API contesta 304 (If-None-Match) sin leer
+  nada más.
+- Se vuelve a mandar el tablero completo si el cursor es muy viejo (ya se
+  purgaron cambios), si hay demasiados cambios o si cambiaron las
+  asignaciones de quien no es admin (cambia qué residentes ve).
+- La versión entregada es el último cambio con más de SIFA_SYNC_MARGEN
+  segundos, pero el delta llega hasta el último id escrito: lo más nuevo se
+  manda ya y se repite en la consulta siguiente (la app reemplaza por id).
+  Así una transacción más lenta que confirma un id menor después no se
+  salta, sin atrasar nada. Es de mejor esfuerzo: creado_en es la hora del
+  INSERT, no la del COMMIT, y una transacción abierta más que el margen sí
+  se salta; el margen tiene que superar a la escritura más larga (la agenda
+  generada en bloque, landing.agenda).
+"""
+from datetime import datetime, time as dtime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Administracion, Asignacion, CambioSync, OrdenMedicamento, Residente
+from .roles import is_admin
+
+Tipo = CambioSync.Tipo
+
+LIMITE = 500         # más cambios que esto: se manda el tablero completo
+LOTE = 500
+_escrituras = 0
+
+
+def registrar(cambios):
+    """`cambios`: iterable de (tipo, objeto_id, fecha)."""
+    global _escrituras
+    filas = [CambioSync(tipo=t, objeto_id=o, fecha=f) for t, o, f in set(cambios)]
+    if not filas:
+        return
+    CambioSync.objects.bulk_create(filas, batch_size=LOTE)
+    _escrituras += 1
+    if _escrituras % 200 == 0:
+        purgar()
+
+
+def registrar_eventos(eventos):
+    """`eventos`: iterable de (administracion_id, programada_para)."""
+    registrar((Tipo.ADMINISTRACION, pk, timezone.localdate(prog)) for pk, prog in eventos)
+
+
+def registrar_ordenes(orden_ids):
+    registrar((Tipo.ORDEN, pk, None) for pk in orden_ids)
+
+
+def registrar_dias(eventos):
+    """Eventos insertados en bloque (instancias sin id): un cambio por residente y día."""
+    registrar((Tipo.DIA, e.residente_id, timezone.localdate(e.programada_para)) for e in eventos)
+
+
+def registrar_asignaciones(fecha):
+    registrar([(Tipo.ASIGNACIONES, None, fecha)])
+
+
+def purgar():
+    """Borra los cambios más viejos que SIFA_SYNC_RETENCION (siempre queda el último: el id no retrocede)."""
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "SIFA_SYNC_RETENCION", 7 * 24 * 3600))
+    ultimo = CambioSync.objects.order_by("-pk").values_list("pk", flat=True).first()
+    return CambioSync.objects.filter(creado_en__lt=limite).exclude(pk=ultimo).delete()[0]
+
+
+def version():
+    """
+    (versión actual, primer id que queda en el registro, último id escrito).
+    Se recorre la clave primaria desde el final hasta el primer cambio fuera
+    del margen, que son los últimos segundos; un Max filtrado por creado_en
+    leería toda la tabla.
+    """
+    margen = timezone.now() - timedelta(seconds=getattr(settings, "SIFA_SYNC_MARGEN", 60))
+    ids = CambioSync.objects.values_list("pk", flat=True)
+    v = ids.filter(creado_en__lte=margen).order_by("-pk").first() or 0
+    return v, ids.order_by("pk").first(), ids.order_by("-pk").first() or 0
+
+
+def alcance_de(user, fecha):
+    """Residentes que ve `user` ese día (None = todos)."""
+    if is_admin(user):
+        return None
+    return set(Asignacion.objects.filter(fecha=fecha, cuidadora=user).values_list("residente_id", flat=True))
+
+
+def _rango(fecha):
+    tz = timezone.get_current_timezone()
+    return (timezone.make_aware(datetime.combine(fecha, dtime.min), tz),
+            timezone.make_aware(datetime.combine(fecha, dtime.max), tz))
+
+
+def _nombre(u):
+    return (u.get_full_name() or u.username) if u else None
+
+
+def _administracion(a):
+    return {
+        "id": a.pk,
+        "residente": a.residente_id,
+        "orden": a.orden_id,
+        "programada_para": a.programada_para.isoformat(),
+        "estado": a.estado,
+        "cantidad": str(a.cantidad_administrada) if a.cantidad_administrada is not None else None,
+        "realizada_por": _nombre(a.realizada_por),
+    }
+
+
+def _orden(o):
+    return {
+        "id": o.pk,
+        "residente": o.receta.residente_id,
+        "producto": str(o.producto),
+        "dosis": o.dosis,
+        "via": o.via,
+        "activo": o.activo,
+        "stock_asignado": o.stock_asignado,
+        "stock_critico": o.stock_critico,
+        "stock_en_critico": o.stock_en_critico,
+    }
+
+
+def _asignaciones(fecha, user, alcance):
+    qs = Asignacion.objects.filter(fecha=fecha).select_related("cuidadora").order_by("pk")
+    if alcance is not None:
+        qs = qs.filter(cuidadora=user)
+    return [{"id": a.pk, "residente": a.residente_id, "cuidadora": a.cuidadora_id,
+             "cuidadora_nombre": _nombre(a.cuidadora)} for a in qs]
+
+
+def _ordenes(ids, alcance):
+    qs = OrdenMedicamento.objects.filter(pk__in=ids).select_related("producto", "receta")
+    if alcance is not None:
+        qs = qs.filter(receta__residente_id__in=alcance)
+    return [_orden(o) for o in qs.order_by("pk")]
+
+
+def _residentes(ids):
+    return list(Residente.objects.filter(pk__in=ids).order_by("pk").values("id", "nombre_completo", "alergias"))
+
+
+def _completo(user, fecha, alcance, v):
+    eventos = (Administracion.objects.filter(programada_para__range=_rango(fecha))
+               .select_related("realizada_por").order_by("programada_para", "pk"))
+    if alcance is not None:
+        eventos = eventos.filter(residente_id__in=alcance)
+    eventos = list(eventos)
+    asignaciones = _asignaciones(fecha, user, alcance)
+    return {
+        "fecha": fecha.isoformat(),
+        "version": v,
+        "completo": True,
+        "administraciones": [_administracion(a) for a in eventos],
+        "ordenes": _ordenes({a.orden_id for a in eventos}, alcance),
+        "residentes": _residentes({a.residente_id for a in eventos} | {a["residente"] for a in asignaciones}),
+        "asignaciones": asignaciones,
+    }
+
+
+def tablero(user, fecha, desde=None, v=None, primero=None, cabeza=None):
+    """
+    Tablero de `fecha` para `user`: completo, o solo lo cambiado desde
+    `desde` hasta el último id escrito. `v`/`primero`/`cabeza` son los de
+    version() si ya se leyeron.
+    """
+    if v is None:
+        v, primero, cabeza = version()
+    if desde is not None and desde == cabeza:
+        return {"fecha": fecha.isoformat(), "version": v, "completo": False, "administraciones": [],
+                "ordenes": [], "residentes": [], "borrados": {"administraciones": [], "ordenes": []}}
+    alcance = alcance_de(user, fecha)
+    if desde is None or desde > v or (primero is not None and primero > desde + 1):
+        return _completo(user, fecha, alcance, v)
+
+    cambios = list(
+        CambioSync.objects
+        .filter(Q(fecha=fecha) | Q(fecha__isnull=True), pk__gt=desde, pk__lte=cabeza)
+        .values_list("tipo", "objeto_id")[:LIMITE + 1]
+    )
+    if len(cambios) > LIMITE:
+        return _completo(user, fecha, alcance, v)
+
+    adm, ordenes, dias, asignaciones = set(), set(), set(), False
+    for tipo, objeto_id in cambios:
+        if tipo == Tipo.ADMINISTRACION:
+            adm.add(objeto_id)
+        elif tipo == Tipo.ORDEN:
+            ordenes.add(objeto_id)
+        elif tipo == Tipo.DIA:
+            dias.add(objeto_id)
+        elif tipo == Tipo.ASIGNACIONES:
+            asignaciones = True
+    if asignaciones and alcance is not None:
+        return _completo(user, fecha, alcance, v)
+
+    eventos = []
+    if adm or dias:
+        qs = (Administracion.objects
+              .filter(Q(pk__in=adm) | Q(residente_id__in=dias), programada_para__range=_rango(fecha))
+              .select_related("realizada_por").order_by("programada_para", "pk"))
+        if alcance is not None:
+            qs = qs.filter(residente_id__in=alcance)
+        eventos = list(qs)
+    enviadas = _ordenes(ordenes | {a.orden_id for a in eventos}, alcance)
+
+    out = {
+        "fecha": fecha.isoformat(),
+        "version": v,
+        "completo": False,
+        "administraciones": [_administracion(a) for a in eventos],
+        "ordenes": enviadas,
+        "residentes": _residentes({a.residente_id for a in eventos}),
+        # Lo que ya no está (o se movió a otro día); un id que la app no tiene se ignora
+        "borrados": {
+            "administraciones": sorted(adm - {a.pk for a in eventos}),
+            "ordenes": sorted(ordenes - set(
+                OrdenMedicamento.objects.filter(pk__in=ordenes).values_list("pk", flat=True)
+            )) if ordenes else [],
+        },
+    }
+    if asignaciones:  # presente = reemplaza la lista completa del día
+        out["asignaciones"] = _asignaciones(fecha, user, alcance)
+    return out
@@ -0,0 +1,117 @@
+# landing/stock.py
+"""
+Movimientos de stock de OrdenMedicamento.
+
+Cada cambio queda como fila en MovimientoStock y el contador se actualiza en la
+base con un UPDATE atómico (F-expressions), sin leer-modificar-guardar en Python.
+En el mismo UPDATE se recalcula `stock_en_critico`, el flag indexado que usa el
+dashboard. El stock nunca baja de 0. Cada orden tocada queda anotada para la
+app Android (landing.sincronizacion).
+"""
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import MovimientoStock, OrdenMedicamento
+from .sincronizacion import registrar_ordenes
+
+Tipo = MovimientoStock.Tipo
+
+# DADA y RECHAZADA consumen 1 del stock_asignado
+ESTADOS_QUE_CONSUMEN = ('DADA', 'RECHAZADA')
+
+
+def delta_por_transicion(old, new):
+    """-1 si pasa a consumir, +1 si deja de consumir, 0 si no cambia."""
+    antes, despues = old in ESTADOS_QUE_CONSUMEN, new in ESTADOS_QUE_CONSUMEN
+    if not antes and despues:
+        return -1
+    if antes and not despues:
+        return 1
+    return 0
+
+
+def _aplicar(orden_id, cantidad):
+    """UPDATE atómico del contador y del flag crítico (usa los valores previos de la fila)."""
+    registrar_ordenes([orden_id])
+    return OrdenMedicamento.objects.filter(pk=orden_id).update(
+        stock_asignado=Greatest(F('stock_asignado') + cantidad, 0),
+        stock_en_critico=Case(
+            When(Q(stock_asignado__lte=F('stock_critico') - cantidad), then=Value(True)),
+            default=Value(False),
+        ),
+    )
+
+
+def mover_stock(orden_id, cantidad, tipo, usuario=None, administracion=None):
+    """Registra un movimiento y ajusta el stock de la orden. Devuelve el movimiento."""
+    with transaction.atomic():
+        mov = MovimientoStock.objects.create(
+            orden_id=orden_id, tipo=tipo, cantidad=cantidad,
+            usuario=usuario, administracion=administracion,
+        )
+        _aplicar(orden_id, cantidad)
+    return mov
+
+
+def mover_stock_por_eventos(eventos, new, usuario=None):
+    """
+    Registra consumo/devolución para varias transiciones de una vez.
+    `eventos` es una lista de (administracion_id, orden_id, estado_anterior).
+    Un INSERT en bloque para el libro y un UPDATE por orden afectada.
+    Devuelve el dict orden_id → cambio aplicado.
+    """
+    movimientos, deltas = [], {}
+    for admin_id, orden_id, old in eventos:
+        d = delta_por_transicion(old, new)
+        if not d:
+            continue
+        movimientos.append(MovimientoStock(
+            orden_id=orden_id, cantidad=d, usuario=usuario, administracion_id=admin_id,
+            tipo=Tipo.CONSUMO if d < 0 else Tipo.DEVOLUCION,
+        ))
+        deltas[orden_id] = deltas.get(orden_id, 0) + d
+
+    with transaction.atomic():
+        if movimientos:
+            MovimientoStock.objects.bulk_create(movimientos)
+        for orden_id, d in deltas.items():
+            _aplicar(orden_id, d)
+    return deltas
+
+
+def corregir_stock(orden, stock_asignado, stock_critico, usuario=None):
+    """Corrección manual a valores absolutos; el libro guarda la diferencia."""
+    with transaction.atomic():
+        actual = (
+            OrdenMedicamento.objects.select_for_update()
+            .values_list('stock_asignado', flat=True)
+            .get(pk=orden.pk)
+        )
+        if stock_asignado != actual:
+            MovimientoStock.objects.create(
+                orden_id=orden.pk, tipo=Tipo.AJUSTE,
+                cantidad=stock_asignado - actual, usuario=usuario,
+            )
+        orden.stock_asignado = stock_asignado
+        orden.stock_critico = stock_critico
+        orden.save(update_fields=['stock_asignado', 'stock_critico'])
+    return orden
+
+
+def registrar_stock_inicial(orden, usuario=None):
+    """Deja en el libro el stock con que nace la orden (el contador ya está guardado)."""
+    if orden.stock_asignado:
+        MovimientoStock.objects.create(
+            orden_id=orden.pk, tipo=Tipo.REPOSICION,
+            cantidad=orden.stock_asignado, usuario=usuario,
+        )
+
+
+def registrar_ajuste(orden, stock_previo, usuario=None):
+    """Anota en el libro una edición directa del stock hecha desde el formulario."""
+    diferencia = (orden.stock_asignado or 0) - (stock_previo or 0)
+    if diferencia:
+        MovimientoStock.objects.create(
+            orden_id=orden.pk, tipo=Tipo.AJUSTE, cantidad=diferencia, usuario=usuario,
+        )
@@ -0,0 +1,477 @@
+# landing/sugerencias.py
+"""
+Sugerencias de medicamentos desde APIs externas (CIMA de la AEMPS y RxNorm
+del NIH) para api_productos_suggest, con cache en dos niveles:
+
+- En el proceso: LRU con TTL (SIFA_SUGERENCIAS_LRU entradas).
+- Persistente: tabla SugerenciaExterna, compartida entre workers y que
+  sobrevive a reinicios. Las vencidas se purgan cada tanto al escribir.
+
+La clave es la búsqueda normalizada (sin tildes, minúsculas, espacios
+simples), así "Paracetamól " y "paracetamol" son la misma consulta. Una
+respuesta vacía también se guarda, con TTL más corto (cache negativo); un
+error de red o HTTP no se guarda. Si llegan varias consultas idénticas a la
+vez, solo la primera llama a la API y las demás esperan su resultado.
+
+sugerir_en_paralelo consulta varios proveedores a la vez en un pool de
+hilos, con un plazo total (DRUG_SUGGEST_DEADLINE). Cada proveedor tiene un
+Circuito: si la API está caída o lenta se deja de llamar por un rato y la
+consulta cuesta 0 ms (se sigue respondiendo desde el cache).
+"""
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+from .models import SugerenciaExterna
+from .texto import normalizar
+
+try:
+    import requests  # si falta, las APIs externas se omiten
+except Exception:
+    requests = None
+
+log = logging.getLogger(__name__)
+
+_PURGA_CADA = 200  # escrituras entre purgas de vencidas
+
+
+class ErrorProveedor(Exception):
+    """La API externa no respondió o respondió con error (no se cachea)."""
+
+
+# --- Proveedores ---
+_sesion_local = threading.local()
+
+
+def _get(url, params, timeout):
+    # Una sesión por hilo: keep-alive con la API sin compartir la sesión entre hilos
+    sesion = getattr(_sesion_local, "sesion", None)
+    if sesion is None:
+        sesion = _sesion_local.sesion = requests.Session()
+        sesion.headers["Accept"] = "application/json"
+    r = sesion.get(url, params=params, timeout=timeout)
+    if r.status_code != 200:
+        raise ErrorProveedor(f"HTTP {r.status_code} en {url}")
+    return r.json()
+
+
+def _item(id_, nombre, source):
+    return {"id": id_, "label": nombre, "source": source, "nombre": nombre, "potencia": "", "forma": ""}
+
+
+def buscar_cima(q, limit, timeout):
+    """
+    Usa /medicamentos?nombre=<q> (paginado). Si no hay resultados (o falló),
+    intenta /vmpp?nombre=<q> como fallback. `timeout` es el total para
+    las dos llamadas, no para cada una. Si /medicamentos falló, un /vmpp
+    vacío no es "sin resultados": es ErrorProveedor (no se cachea).
+    """
+    fin = monotonic() + timeout
+    fallo = None
+    # 1) /medicamentos?nombre=...  (¡OJO: plural!)
+    try:
+        data = _get("https://cima.aemps.es/cima/rest/medicamentos",
+                    {"nombre": q, "autorizados": 1, "pagina": 1}, timeout) or []
+        # a veces viene como dict con 'resultados', otras como lista
+        items = (data.get("resultados") or []) if isinstance(data, dict) else data
+        out, seen = [], set()
+        for it in items:
+            # en este listado suelen venir 'nombre' y 'nregistro'
+            nombre = (it.get("nombre") or "").strip()
+            if not nombre or nombre in seen:
+                continue
+            seen.add(nombre)
+            out.append(_item(f"cima:{it.get('nregistro') or ''}", nombre, "cima"))
+            if len(out) >= limit:
+                break
+        if out:
+            return out
+    except Exception as e:
+        fallo = e  # se intenta con /vmpp, pero vacío ya no cuenta como respuesta
+
+    # 2) /vmpp?nombre=... (fallback por descripción clínica), con lo que queda del plazo
+    resta = fin - monotonic()
+    if resta <= 0:
+        raise ErrorProveedor(f"CIMA: {fallo}" if fallo else "CIMA: sin tiempo para /vmpp")
+    try:
+        data = _get("https://cima.aemps.es/cima/rest/vmpp", {"nombre": q, "pagina": 1}, resta) or []
+        items = data.get("resultados", []) if isinstance(data, dict) else data
+        out, seen = [], set()
+        for it in items:
+            nombre = (it.get("vmppDesc") or it.get("vmpDesc") or it.get("nombre") or "").strip()
+            _id = it.get("id") or it.get("vmpp") or it.get("vmp") or ""
+            if not nombre or nombre in seen:
+                continue
+            seen.add(nombre)
+            out.append(_item(f"cima-vmpp:{_id}", nombre, "cima"))
+            if len(out) >= limit:
+                break
+    except Exception as e:
+        raise ErrorProveedor(f"CIMA: {e}") from e
+    if not out and fallo is not None:
+        raise ErrorProveedor(f"CIMA: {fallo}") from fallo
+    return out
+
+
+def buscar_rxnorm(q, limit, timeout):
+    # RxNorm: /REST/drugs.json?name=<q>
+    try:
+        data = _get("https://rxnav.nlm.nih.gov/REST/drugs.json", {"name": q}, timeout) or {}
+    except Exception as e:
+        raise ErrorProveedor(f"RxNorm: {e}") from e
+    props = []
+    for group in (data.get("drugGroup", {}) or {}).get("conceptGroup", []) or []:
+        props += group.get("conceptProperties", []) or []
+    seen, out = set(), []
+    for p in props:
+        label = p.get("name")
+        if not label or label in seen:
+            continue
+        seen.add(label)
+        out.append(_item(f"rxnorm:{p.get('rxcui')}", label, "rxnorm"))
+        if len(out) >= limit:
+            break
+    return out
+
+
+PROVEEDORES = {"cima": buscar_cima, "rxnorm": buscar_rxnorm}
+
+
+# --- Circuit breaker y salud por proveedor ---
+class Circuito:
+    """
+    Cortocircuito de un proveedor (estado por proceso). Se abre tras
+    SIFA_CIRCUITO_FALLOS fallos o respuestas lentas seguidas; abierto, no se
+    llama a la API durante la espera; después deja pasar una sola consulta de
+    prueba (semiabierto): si sale bien se cierra, si no se vuelve a abrir con
+    el doble de espera (hasta SIFA_CIRCUITO_ESPERA_MAX).
+    """
+    CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+    def __init__(self, nombre, muestras=200):
+        self.nombre = nombre
+        self._lock = threading.Lock()
+        self._muestras = deque(maxlen=muestras)  # (ms, ok) de las últimas llamadas
+        self.reiniciar()
+
+    @staticmethod
+    def _conf(nombre, defecto):
+        return getattr(settings, nombre, defecto)
+
+    def reiniciar(self):
+        with self._lock:
+            self.estado = self.CERRADO
+            self.fallos_seguidos = 0
+            self.abierto_hasta = 0.0
+            self.espera = self._conf("SIFA_CIRCUITO_ESPERA", 30)
+            self._sondeando = False
+            self._muestras.clear()
+            self.llamadas = self.errores = self.lentas = self.rechazadas = self.aperturas = 0
+            self.ultimo_error, self.ultimo_error_en = "", None
+
+    def permite(self):
+        """¿Se puede llamar a la API ahora? (en semiabierto, solo a una consulta)."""
+        with self._lock:
+            if self.estado == self.ABIERTO and monotonic() >= self.abierto_hasta:
+                self.estado, self._sondeando = self.SEMIABIERTO, False
+            if self.estado == self.CERRADO:
+                return True
+            if self.estado == self.SEMIABIERTO and not self._sondeando:
+                self._sondeando = True
+                return True
+            self.rechazadas += 1
+            return False
+
+    def registrar(self, ok, ms, error=""):
+        lento = ok and ms > self._conf("SIFA_CIRCUITO_LENTO_MS", 2000)
+        with self._lock:
+            self.llamadas += 1
+            self._muestras.append((ms, ok))
+            self._sondeando = False
+            if ok and not lento:
+                self.fallos_seguidos = 0
+                if self.estado != self.CERRADO:
+                    log.info("Sugerencias %s: circuito cerrado", self.nombre)
+                self.estado = self.CERRADO
+                self.espera = self._conf("SIFA_CIRCUITO_ESPERA", 30)
+                return
+            if lento:
+                self.lentas += 1
+                error = f"respuesta lenta ({ms:.0f} ms)"
+            else:
+                self.errores += 1
+            self.ultimo_error, self.ultimo_error_en = error, timezone.now()
+            self.fallos_seguidos += 1
+            if self.estado == self.SEMIABIERTO:
+                self.espera = min(self.espera * 2, self._conf("SIFA_CIRCUITO_ESPERA_MAX", 600))
+                self._abrir()
+            elif self.estado == self.CERRADO and self.fallos_seguidos >= self._conf("SIFA_CIRCUITO_FALLOS", 3):
+                self._abrir()
+
+    def _abrir(self):
+        self.estado = self.ABIERTO
+        self.abierto_hasta = monotonic() + self.espera
+        self.aperturas += 1
+        log.warning("Sugerencias %s: circuito abierto %ss (%s)", self.nombre, self.espera, self.ultimo_error)
+
+    def resumen(self):
+        with self._lock:
+            muestras = list(self._muestras)
+            estado = self.estado
+            if estado == self.ABIERTO and monotonic() >= self.abierto_hasta:
+                estado = self.SEMIABIERTO  # la próxima consulta será la de prueba
+            ms = sorted(m for m, _ in muestras)
+
+            def pct(p):
+                return round(ms[min(len(ms) - 1, int(p / 100 * len(ms)))], 1) if ms else None
+
+            return {
+                "proveedor": self.nombre,
+                "estado": estado,
+                "reabre_en_s": max(0, round(self.abierto_hasta - monotonic())) if estado == self.ABIERTO else 0,
+                "fallos_seguidos": self.fallos_seguidos,
+                "llamadas": self.llamadas,
+                "errores": self.errores,
+                "lentas": self.lentas,
+                "rechazadas": self.rechazadas,
+                "aperturas": self.aperturas,
+                "tasa_error": round(sum(1 for _, ok in muestras if not ok) / len(muestras), 3) if muestras else None,
+                "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+                "muestras": len(muestras),
+                "ultimo_error": self.ultimo_error,
+                "ultimo_error_en": self.ultimo_error_en,
+            }
+
+
+circuitos = {nombre: Circuito(nombre) for nombre in PROVEEDORES}
+
+
+def salud():
+    """Resumen por proveedor (de este proceso) para la vista de administración."""
+    return [c.resumen() for c in circuitos.values()]
+
+
+# --- Cache en el proceso ---
+class _LRU:
+    """Dict ordenado por uso con vencimiento por entrada. Seguro entre hilos."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            vence, valor = entrada
+            if vence <= monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def put(self, clave, valor, ttl):
+        with self._lock:
+            self._datos[clave] = (monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+_lru = _LRU(getattr(settings, "SIFA_SUGERENCIAS_LRU", 2000))
+_vuelos = {}                    # clave -> Future de la consulta en curso
+_vuelos_lock = threading.Lock()
+_escrituras = 0
+
+
+def _ttl(resultados):
+    if resultados:
+        return getattr(settings, "SIFA_SUGERENCIAS_TTL", 24 * 3600)
+    return getattr(settings, "SIFA_SUGERENCIAS_TTL_VACIO", 15 * 60)
+
+
+def _leer_persistente(proveedor, clave):
+    try:
+        return (
+            SugerenciaExterna.objects
+            .filter(proveedor=proveedor, clave=clave, expira_en__gt=timezone.now())
+            .values_list("resultados", "expira_en")
+            .first()
+        )
+    except DatabaseError:
+        log.warning("Sugerencias: no se pudo leer el cache persistente", exc_info=True)
+        return None
+
+
+def _guardar_persistente(proveedor, clave, resultados, ttl):
+    global _escrituras
+    try:
+        SugerenciaExterna.objects.update_or_create(
+            proveedor=proveedor, clave=clave,
+            defaults={"resultados": resultados, "expira_en": timezone.now() + timedelta(seconds=ttl)},
+        )
+        _escrituras += 1
+        if _escrituras % _PURGA_CADA == 0:
+            purgar_vencidas()
+    except DatabaseError:
+        log.warning("Sugerencias: no se pudo guardar en el cache persistente", exc_info=True)
+
+
+def purgar_vencidas():
+    return SugerenciaExterna.objects.filter(expira_en__lte=timezone.now()).delete()[0]
+
+
+def limpiar_cache():
+    """Vacía ambos niveles (tests, o tras cambiar de proveedor)."""
+    _lru.clear()
+    SugerenciaExterna.objects.all().delete()
+
+
+def _clave(q, limit):
+    return f"{limit}:{normalizar(q)}"[:200]
+
+
+def _consultar(proveedor, q, limit, timeout):
+    """(resultados, origen); origen: memoria | tabla | api | en_vuelo | error | circuito_abierto."""
+    clave = _clave(q, limit)
+    lru_clave = (proveedor, clave)
+    resultados = _lru.get(lru_clave)
+    if resultados is not None:
+        return resultados, "memoria"
+
+    with _vuelos_lock:
+        vuelo = _vuelos.get(lru_clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _vuelos[lru_clave] = Future()
+    if not lider:
+        try:
+            return vuelo.result(timeout=timeout * 3), "en_vuelo"
+        except Exception:
+            return [], "error"
+
+    resultados, origen = [], "error"
+    try:
+        fila = _leer_persistente(proveedor, clave)
+        if fila is not None:
+            resultados, expira = fila
+            origen = "tabla"
+            _lru.put(lru_clave, resultados, max(1, (expira - timezone.now()).total_seconds()))
+        elif not circuitos[proveedor].permite():
+            origen = "circuito_abierto"  # sin llamar a la API ni cachear
+        else:
+            t0 = monotonic()
+            try:
+                resultados = PROVEEDORES[proveedor](q, limit, timeout)
+            except Exception as e:
+                circuitos[proveedor].registrar(False, (monotonic() - t0) * 1000, str(e)[:300])
+                log.info("Sugerencias %s: %s", proveedor, e)
+            else:
+                circuitos[proveedor].registrar(True, (monotonic() - t0) * 1000)
+                origen = "api"
+                ttl = _ttl(resultados)
+                _lru.put(lru_clave, resultados, ttl)
+                _guardar_persistente(proveedor, clave, resultados, ttl)
+    finally:
+        vuelo.set_result(resultados)
+        with _vuelos_lock:
+            _vuelos.pop(lru_clave, None)
+    return resultados, origen
+
+
+def sugerir(proveedor, q, limit, timeout):
+    """
+    Sugerencias de `proveedor` ("cima" | "rxnorm") para `q`, desde el cache si
+    se puede. Ante un error del proveedor devuelve [] (sin cachearlo).
+    """
+    if requests is None:
+        return []
+    return _consultar(proveedor, q, limit, timeout)[0]
+
+
+# --- Consulta en paralelo con plazo ---
+# El pool no encola: solo se entrega una tarea si hay un hilo libre (_cupos).
+# Con la API lenta y mucha gente escribiendo, una cola haría que las tareas
+# nuevas ni siquiera empezaran antes de su plazo; mejor omitirlas al tiro.
+_pool = None
+_cupos = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool, _cupos
+    with _pool_lock:
+        if _pool is None:
+            hilos = getattr(settings, "SIFA_SUGERENCIAS_HILOS", 8)
+            _cupos = threading.BoundedSemaphore(hilos)
+            _pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="sifa-sugerencias")
+        return _pool
+
+
+def _enviar(t0, proveedor, q, limit, timeout):
+    """Future de la consulta, o None si todos los hilos están ocupados."""
+    pool, cupos = _executor(), _cupos
+    if not cupos.acquire(blocking=False):
+        return None
+    try:
+        fut = pool.submit(_tarea, t0, proveedor, q, limit, timeout)
+    except Exception:
+        cupos.release()
+        raise
+    fut.add_done_callback(lambda _f: cupos.release())
+    return fut
+
+
+def _tarea(t0, proveedor, q, limit, timeout):
+    # Hilo del pool: conexión a la BD propia, cerrada como al final de un request
+    close_old_connections()
+    try:
+        resultados, origen = _consultar(proveedor, q, limit, timeout)
+        return resultados, origen, (monotonic() - t0) * 1000
+    finally:
+        close_old_connections()
+
+
+def sugerir_en_paralelo(proveedores, q, limit, timeout, plazo):
+    """
+    Consulta `proveedores` a la vez y espera a lo sumo `plazo` segundos en
+    total. Devuelve [(proveedor, resultados, info)] en el orden pedido; info =
+    {"ms", "estado"} con estado = origen de _consultar, "timeout" u "omitido"
+    (sin hilo libre: solo se responde desde la memoria). Las consultas que no
+    alcanzan siguen en segundo plano y dejan su resultado en el cache para la
+    próxima tecla.
+    """
+    if requests is None:
+        return [(p, [], {"ms": 0, "estado": "omitido"}) for p in proveedores]
+    t0 = monotonic()
+    timeout = min(timeout, plazo)
+    futuros = [(p, _enviar(t0, p, q, limit, timeout)) for p in proveedores]
+    wait([f for _, f in futuros if f is not None], timeout=plazo)
+
+    out = []
+    for p, fut in futuros:
+        if fut is None:
+            resultados = _lru.get((p, _clave(q, limit)))
+            resultados, estado, ms = (resultados, "memoria", 0) if resultados is not None else ([], "omitido", 0)
+        elif not fut.done():
+            resultados, estado, ms = [], "timeout", (monotonic() - t0) * 1000
+        elif fut.exception() is not None:
+            log.warning("Sugerencias %s: %r", p, fut.exception())
+            resultados, estado, ms = [], "error", (monotonic() - t0) * 1000
+        else:
+            resultados, estado, ms = fut.result()
+        out.append((p, resultados, {"ms": round(ms, 1), "estado": estado}))
+    return out
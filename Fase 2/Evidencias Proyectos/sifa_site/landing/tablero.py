@@ -0,0 +1,301 @@
+# landing/tablero.py
+"""
+Tablero en vivo de admin_list_hoy por Server-Sent Events.
+
+- Cada cambio de estado de una Administracion deja una fila en
+  CambioAdministracion en la misma transacción (publicar(), llamado desde
+  landing.signals y views._marcar_en_bloque).
+- views.admin_hoy_eventos entrega esas filas como SSE, filtradas por los
+  residentes que puede ver quien mira; la página corrige la fila en su lugar.
+- Servido con ASGI (sifa_site/asgi.py), un solo bucle por proceso consulta la
+  tabla cada SIFA_TABLERO_INTERVALO segundos y reparte a todos los tableros
+  abiertos: una consulta por intervalo y proceso, sin importar cuántos haya.
+- Con WSGI (runserver) no se deja la conexión abierta, que ocuparía un worker
+  por tablero: se entrega lo pendiente y se corta, y el navegador vuelve a
+  preguntar a los SIFA_TABLERO_SONDEO segundos (sondeo corto).
+- Cada flujo dura SIFA_TABLERO_DURACION segundos; el navegador se reconecta
+  solo con Last-Event-ID y sigue desde ahí, así que no se pierden cambios.
+- El cursor (Cursor, que viaja como id del SSE) es el último id leído más
+  los ids que se saltó: una transacción más lenta puede confirmar un id
+  menor después, y mientras siga en la lista de huecos se vuelve a pedir en
+  cada lectura. Un hueco se abandona cuando el id siguiente ya tiene más de
+  SIFA_TABLERO_ESPERA segundos (ids de transacciones revertidas, que nunca
+  llegan). Es de mejor esfuerzo: una transacción que siga abierta más que
+  eso después de tomar su id sí se pierde, así que la espera tiene que
+  superar a la transacción de escritura más larga.
+"""
+import asyncio
+import json
+import logging
+import time
+import weakref
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import CambioAdministracion
+
+log = logging.getLogger(__name__)
+
+LOTE = 500           # cambios por consulta
+PING = 15            # segundos sin cambios antes de mandar un comentario (proxies)
+COLA_MAX = 1000      # si un cliente lento acumula más, se corta y se reconecta
+_escrituras = 0
+
+
+def _intervalo():
+    return float(getattr(settings, "SIFA_TABLERO_INTERVALO", 1.0))
+
+
+def _duracion():
+    return float(getattr(settings, "SIFA_TABLERO_DURACION", 300))
+
+
+def publicar(cambios):
+    """`cambios`: iterable de (administracion_id, residente_id, estado, realizada_por_id)."""
+    global _escrituras
+    filas = [
+        CambioAdministracion(administracion_id=a, residente_id=r, estado=e, realizada_por_id=u)
+        for a, r, e, u in cambios
+    ]
+    if not filas:
+        return
+    CambioAdministracion.objects.bulk_create(filas, batch_size=LOTE)
+    _escrituras += 1
+    if _escrituras % 200 == 0:
+        purgar()
+
+
+def purgar():
+    """Borra los cambios más viejos que SIFA_TABLERO_RETENCION (ya nadie los va a pedir)."""
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "SIFA_TABLERO_RETENCION", 24 * 3600))
+    return CambioAdministracion.objects.filter(creado_en__lt=limite).delete()[0]
+
+
+class Cursor:
+    """
+    Hasta dónde leyó un tablero: `ultimo` id visto y `huecos`, rangos
+    [a, b] de ids menores que todavía pueden confirmar. Siempre existe la
+    fila b + 1 (la que destapó el hueco): su creado_en dice desde cuándo se
+    espera. Como texto: "120" o "120~97-99,115".
+    """
+    HUECOS_MAX = 20   # más rangos abiertos: se abandonan los más viejos
+
+    def __init__(self, ultimo=0, huecos=()):
+        self.ultimo = ultimo
+        self.huecos = [list(h) for h in huecos]
+
+    def __str__(self):
+        if not self.huecos:
+            return str(self.ultimo)
+        return f"{self.ultimo}~" + ",".join(str(a) if a == b else f"{a}-{b}" for a, b in self.huecos)
+
+    @classmethod
+    def desde_texto(cls, texto):
+        """El cursor que mandó el navegador, o None si no es uno válido."""
+        ultimo, _, resto = (texto or "").partition("~")
+        if not ultimo.isdigit():
+            return None
+        huecos = []
+        for parte in filter(None, resto.split(",")):
+            a, _, b = parte.partition("-")
+            b = b or a
+            if not (a.isdigit() and b.isdigit() and int(a) <= int(b) < int(ultimo)):
+                return None
+            huecos.append((int(a), int(b)))
+        if len(huecos) > cls.HUECOS_MAX:
+            return None
+        return cls(int(ultimo), sorted(huecos))
+
+    @classmethod
+    def actual(cls):
+        """Cursor al final del registro, con los huecos recientes entre los últimos LOTE ids."""
+        filas = list(CambioAdministracion.objects.order_by("-pk").values_list("pk", "creado_en")[:LOTE])[::-1]
+        if not filas:
+            return cls()
+        cursor = cls(filas[0][0])
+        limite = _limite_espera()
+        for pk, creado_en in filas[1:]:
+            cursor.anotar(pk, creado_en, limite)
+        return cursor
+
+    def anotar(self, pk, creado_en=None, limite=None):
+        """
+        Registra el id `pk`; False si ya se había visto. Con `creado_en`
+        anterior a `limite`, el hueco que termina justo antes se abandona.
+        """
+        nuevo = True
+        if pk > self.ultimo:
+            if pk > self.ultimo + 1:
+                self.huecos.append([self.ultimo + 1, pk - 1])
+            self.ultimo = pk
+        else:
+            for i, (a, b) in enumerate(self.huecos):
+                if a <= pk <= b:
+                    self.huecos[i:i + 1] = [h for h in ([a, pk - 1], [pk + 1, b]) if h[0] <= h[1]]
+                    break
+            else:
+                nuevo = False
+        if creado_en is not None and limite is not None and creado_en <= limite:
+            self.huecos = [h for h in self.huecos if h[1] != pk - 1]
+        del self.huecos[:-self.HUECOS_MAX]
+        return nuevo
+
+    def leer(self, limite=LOTE):
+        """
+        Cambios nuevos y los que llenaron un hueco, en orden de id, como pares
+        (dict listo para enviar, cursor en texto hasta ese cambio); avanza el
+        cursor. Devuelve (cambios, hay_mas). Trae también las filas b + 1 de
+        cada hueco, para saber si ya vencieron.
+        """
+        filtro = Q(pk__gt=self.ultimo)
+        for a, b in self.huecos:
+            filtro |= Q(pk__range=(a, b + 1))
+        filas = list(CambioAdministracion.objects.filter(filtro)
+                     .select_related("realizada_por").order_by("pk")[:limite])
+        vencido = _limite_espera()
+        abiertos = {b + 1 for a, b in self.huecos}
+        cambios = []
+        for c in filas:
+            abiertos.discard(c.pk)
+            if self.anotar(c.pk, c.creado_en, vencido):
+                cambios.append((_dict(c), str(self)))
+        if len(filas) < limite and abiertos:
+            # La fila que destapó el hueco ya se purgó: hace rato que venció
+            self.huecos = [h for h in self.huecos if h[1] + 1 not in abiertos]
+        return cambios, len(filas) == limite
+
+
+def _limite_espera():
+    return timezone.now() - timedelta(seconds=float(getattr(settings, "SIFA_TABLERO_ESPERA", 120)))
+
+
+def _dict(c):
+    return {
+        "id": c.pk,
+        "evento": c.administracion_id,
+        "residente": c.residente_id,
+        "estado": c.estado,
+        "etiqueta": c.get_estado_display(),
+        "realizada_por": (c.realizada_por.get_full_name() or c.realizada_por.username)
+        if c.realizada_por else "",
+    }
+
+
+def _sse(cambio, cursor):
+    """`cursor`: el texto del cursor justo después de `cambio` (va como Last-Event-ID)."""
+    return f"id: {cursor}\nevent: estado\ndata: {json.dumps(cambio, ensure_ascii=False)}\n\n"
+
+
+def _visible(cambio, alcance):
+    return alcance is None or cambio["residente"] in alcance
+
+
+# --- ASGI: un lector por proceso que reparte a colas ---
+class _Suscripcion:
+    def __init__(self):
+        self.cola = asyncio.Queue(maxsize=COLA_MAX)
+        self.atrasada = False
+
+
+class _Hub:
+    def __init__(self):
+        self.suscripciones = set()
+        self.cursor = None
+        self.tarea = None
+
+    def suscribir(self):
+        sus = _Suscripcion()
+        self.suscripciones.add(sus)
+        if self.tarea is None or self.tarea.done():
+            self.tarea = asyncio.create_task(self._bucle())
+        return sus
+
+    def desuscribir(self, sus):
+        self.suscripciones.discard(sus)
+
+    async def _bucle(self):
+        try:
+            if self.cursor is None:
+                self.cursor = await sync_to_async(Cursor.actual)()
+            while self.suscripciones:
+                try:
+                    cambios, hay_mas = await sync_to_async(self.cursor.leer)()
+                except Exception:
+                    log.exception("Tablero: no se pudieron leer los cambios")
+                    cambios, hay_mas = [], False
+                for c, _ in cambios:
+                    for sus in list(self.suscripciones):
+                        try:
+                            sus.cola.put_nowait(c)
+                        except asyncio.QueueFull:
+                            sus.atrasada = True
+                            self.suscripciones.discard(sus)
+                if not hay_mas:
+                    await asyncio.sleep(_intervalo())
+        finally:
+            # Sin nadie escuchando no se sigue el rastro: el próximo arranca del final
+            self.cursor = None
+
+
+_hubs = weakref.WeakKeyDictionary()   # un hub por event loop
+
+
+def _hub():
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = _Hub()
+    return _hubs[loop]
+
+
+async def flujo(alcance, cursor):
+    """
+    Generador SSE para ASGI: `alcance` es un set de residente_id (None = todos).
+    Los huecos del `cursor` propio se vuelven a pedir al reconectar; en vivo
+    llega lo que lee el hub, que sigue los suyos.
+    """
+    hub = _hub()
+    sus = hub.suscribir()   # antes de ponerse al día, para no perder nada entre medio
+    try:
+        yield "retry: 3000\n\n"
+        hay_mas = True
+        while hay_mas:  # lo que pasó desde que se dibujó la página (o se cortó el flujo)
+            atrasados, hay_mas = await sync_to_async(cursor.leer)()
+            for c, texto in atrasados:
+                if _visible(c, alcance):
+                    yield _sse(c, texto)
+
+        fin = time.monotonic() + _duracion()
+        while not sus.atrasada and (resta := fin - time.monotonic()) > 0:
+            try:
+                c = await asyncio.wait_for(sus.cola.get(), timeout=min(PING, resta))
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if cursor.anotar(c["id"]) and _visible(c, alcance):
+                yield _sse(c, str(cursor))
+    finally:
+        hub.desuscribir(sus)
+
+
+def sondeo_sync(alcance, cursor):
+    """
+    Para WSGI: lo pendiente desde `cursor` y se corta; el navegador reconecta
+    a los SIFA_TABLERO_SONDEO segundos. Al final va un `id:` suelto para que
+    el Last-Event-ID avance (y lleve los huecos) aunque los cambios fueran de
+    otros residentes.
+    """
+    yield f"retry: {int(float(getattr(settings, 'SIFA_TABLERO_SONDEO', 5)) * 1000)}\n\n"
+    enviado = str(cursor)
+    hay_mas = True
+    while hay_mas:
+        cambios, hay_mas = cursor.leer()
+        for c, texto in cambios:
+            if _visible(c, alcance):
+                enviado = texto
+                yield _sse(c, texto)
+    if str(cursor) != enviado:
+        yield f"id: {cursor}\n\n"
@@ -0,0 +1,156 @@
+# landing/telegram.py
+"""
+Transporte HTTP para la Bot API de Telegram.
+
+- Una sesión `requests` por proceso (keep-alive, pool de conexiones).
+- Token bucket por chat para no pasar los límites de Telegram.
+- Los textos de más de 4096 caracteres se parten por líneas (los <b>…</b> que
+  usamos nunca cruzan líneas, así el HTML queda bien formado en cada parte).
+- Cada envío devuelve un ResultadoEnvio en vez de un bool.
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+
+LIMITE_TEXTO = 4096
+
+
+@dataclass
+class ResultadoEnvio:
+    ok: bool
+    detalle: str = ""
+    status: int = None          # último código HTTP recibido
+    retry_after: int = None     # segundos pedidos por Telegram (HTTP 429)
+    partes: int = 0
+    partes_enviadas: int = 0
+    pendiente: str = ""         # texto que quedó sin enviar (para reintentar solo eso)
+
+
+def partir_mensaje(texto, limite=LIMITE_TEXTO):
+    """Divide `texto` en partes de hasta `limite` caracteres, cortando en saltos de línea."""
+    if len(texto) <= limite:
+        return [texto]
+    partes, actual = [], ""
+    for linea in texto.split("\n"):
+        # una línea sola más larga que el límite se corta en seco
+        while len(linea) > limite:
+            if actual:
+                partes.append(actual)
+                actual = ""
+            partes.append(linea[:limite])
+            linea = linea[limite:]
+        candidato = f"{actual}\n{linea}" if actual else linea
+        if len(candidato) > limite:
+            partes.append(actual)
+            actual = linea
+        else:
+            actual = candidato
+    if actual:
+        partes.append(actual)
+    return partes
+
+
+class TokenBucket:
+    """`tasa` envíos por segundo con ráfagas de hasta `capacidad`."""
+
+    def __init__(self, tasa, capacidad, reloj=time.monotonic, dormir=time.sleep):
+        self.tasa = float(tasa)
+        self.capacidad = float(capacidad)
+        self.tokens = float(capacidad)
+        self._reloj, self._dormir = reloj, dormir
+        self._ultimo = reloj()
+        self._lock = threading.Lock()
+
+    def _recargar(self):
+        ahora = self._reloj()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def tomar(self, max_espera=None):
+        """Consume un token, esperando si hace falta. False si la espera superaría `max_espera`."""
+        with self._lock:
+            self._recargar()
+            falta = (1 - self.tokens) / self.tasa if self.tokens < 1 else 0.0
+            if max_espera is not None and falta > max_espera:
+                return False
+            if falta:
+                self._dormir(falta)
+                self._recargar()
+            self.tokens -= 1
+            return True
+
+
+class TelegramTransport:
+    def __init__(self, token, api_base="https://api.telegram.org", timeout=8,
+                 tasa=1.0, rafaga=3, max_espera=30):
+        self.url = f"{api_base.rstrip('/')}/bot{token}/sendMessage"
+        self.timeout = timeout
+        self.tasa, self.rafaga, self.max_espera = tasa, rafaga, max_espera
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+        self.session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+        self.session.headers["Accept"] = "application/json"
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, chat_id):
+        with self._lock:
+            if chat_id not in self._buckets:
+                self._buckets[chat_id] = TokenBucket(self.tasa, self.rafaga)
+            return self._buckets[chat_id]
+
+    def _post(self, chat_id, texto, parse_mode):
+        payload = {
+            "chat_id": chat_id,
+            "text": texto,
+            "parse_mode": parse_mode,
+            "disable_web_page_preview": True,
+        }
+        r = self.session.post(self.url, data=payload, timeout=self.timeout)
+        try:
+            data = r.json()
+        except ValueError:
+            data = {}
+        if r.ok and data.get("ok"):
+            return True, r.status_code, "OK", None
+        retry_after = (data.get("parameters") or {}).get("retry_after")
+        detalle = data.get("description") or r.text[:300]
+        return False, r.status_code, f"HTTP {r.status_code}: {detalle}", retry_after
+
+    def enviar(self, chat_id, texto, parse_mode="HTML"):
+        partes = partir_mensaje(texto)
+        res = ResultadoEnvio(ok=False, partes=len(partes))
+        for i, parte in enumerate(partes):
+            if not self._bucket(chat_id).tomar(self.max_espera):
+                res.detalle = "Límite de envío local: reintentar más tarde"
+                res.retry_after = int(self.max_espera)
+                res.pendiente = "\n".join(partes[i:])
+                return res
+            try:
+                ok, res.status, res.detalle, res.retry_after = self._post(chat_id, parte, parse_mode)
+            except requests.exceptions.SSLError as e:
+                ok, res.detalle = False, f"SSL error: {e}"
+            except requests.RequestException as e:
+                ok, res.detalle = False, f"Excepción: {e}"
+            if not ok:
+                res.pendiente = "\n".join(partes[i:])
+                return res
+            res.partes_enviadas += 1
+        res.ok = True
+        return res
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(token, api_base, **opts):
+    """Un transporte (y su sesión keep-alive) por token/base, compartido en el proceso."""
+    key = (token, api_base)
+    with _transports_lock:
+        if key not in _transports:
+            _transports[key] = TelegramTransport(token, api_base, **opts)
+        return _transports[key]
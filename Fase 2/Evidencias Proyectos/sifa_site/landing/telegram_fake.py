@@ -0,0 +1,112 @@
+# landing/telegram_fake.py
+"""
+Servidor local que imita /bot<token>/sendMessage de la Bot API.
+
+Sirve para probar throughput y fallas del transporte sin red:
+
+    with FakeBotAPI(fallar=2, status_fallo=429, retry_after=3) as api:
+        settings.TELEGRAM_API_BASE = api.url
+        ...
+        api.recibidos   # [{'chat_id': ..., 'text': ...}, ...]
+        api.conexiones  # conexiones TCP abiertas (keep-alive → pocas)
+
+También se puede levantar a mano: python -m landing.telegram_fake 8081
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeBotAPI:
+    def __init__(self, host="127.0.0.1", port=0, fallar=0, status_fallo=500,
+                 retry_after=None, latencia=0.0):
+        self.fallar = fallar                # cuántas respuestas fallidas antes de aceptar
+        self.status_fallo = status_fallo
+        self.retry_after = retry_after
+        self.latencia = latencia
+        self.recibidos = []
+        self.conexiones = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive
+
+            def setup(self):
+                super().setup()
+                with api._lock:
+                    api.conexiones += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                largo = int(self.headers.get("Content-Length") or 0)
+                form = {k: v[0] for k, v in parse_qs(self.rfile.read(largo).decode()).items()}
+                if api.latencia:
+                    time.sleep(api.latencia)
+                if not self.path.endswith("/sendMessage"):
+                    return self._responder(404, {"ok": False, "description": "Not Found"})
+
+                with api._lock:
+                    falla = api.fallar > 0
+                    if falla:
+                        api.fallar -= 1
+                if falla:
+                    data = {"ok": False, "error_code": api.status_fallo, "description": "Falla simulada"}
+                    if api.retry_after is not None:
+                        data["parameters"] = {"retry_after": api.retry_after}
+                    return self._responder(api.status_fallo, data)
+                if len(form.get("text", "")) > 4096:
+                    return self._responder(400, {"ok": False, "description": "Bad Request: message is too long"})
+
+                with api._lock:
+                    api.recibidos.append(form)
+                    message_id = len(api.recibidos)
+                return self._responder(200, {"ok": True, "result": {"message_id": message_id}})
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    api = FakeBotAPI(port=port)
+    print(f"Fake Bot API en {api.url} (TELEGRAM_API_BASE)")
+    api._server.serve_forever()
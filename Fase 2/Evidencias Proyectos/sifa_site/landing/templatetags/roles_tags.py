@@ -26,7 +26,7 @@ def is_doctor_filter(user):
 @register.filter
 def has_group(user, name: str):
     """Devuelve True si el usuario pertenece al grupo exacto `name`."""
-    return user.is_authenticated and user.groups.filter(name=name).exists()
+    return name in rolelib.roles_de(user)
 
 @register.filter
 def has_any_group(user, csv_names: str):
@@ -34,7 +34,7 @@ def has_any_group(user, csv_names: str):
     if not user.is_authenticated:
         return False
     wanted = {n.strip() for n in (csv_names or "").split(",") if n.strip()}
-    return user.groups.filter(name__in=wanted).exists() or user.is_superuser
+    return bool(wanted & rolelib.roles_de(user)) or user.is_superuser
 
 @register.filter
 def can_view_residentes(user):
@@ -1,3 +1,1452 @@
-from django.test import TestCase
+import threading
+from datetime import date, datetime, time as dtime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    AlertaStockPendiente, Administracion, MensajeSaliente, MovimientoStock, OrdenMedicamento,
+    Producto, Receta, Residente, SugerenciaExterna,
+)
+from .notifications import (
+    encolar_mensaje, entregar_pendientes, enviar_resumen_alertas, registrar_alerta_stock,
+    send_telegram_message,
+)
+from .telegram import ResultadoEnvio, TokenBucket, partir_mensaje
+from .telegram_fake import FakeBotAPI
+from .views import _ajustar_stock_por_transicion
+
+
+def _crear_orden(stock=0, critico=0):
+    medico = User.objects.create_user("medico")
+    res = Residente.objects.create(nombre_completo="Ana Pérez", rut="11.111.111-1")
+    receta = Receta.objects.create(residente=res, medico=medico, inicio=date.today(), numero=1)
+    prod = Producto.objects.create(nombre="Paracetamol", potencia="500 mg")
+    return OrdenMedicamento.objects.create(
+        receta=receta, producto=prod, dosis="1 tableta",
+        stock_asignado=stock, stock_critico=critico,
+    )
+
+
+def _crear_orden_para(receta, stock=0):
+    return OrdenMedicamento.objects.create(
+        receta=receta, producto=Producto.objects.create(nombre="Ibuprofeno", potencia="400 mg"),
+        dosis="1 tableta", stock_asignado=stock,
+    )
+
+
+class MaterializarAgendaTests(TestCase):
+
+    def setUp(self):
+        from .models import HoraProgramada
+
+        self.orden = _crear_orden()
+        for h in (dtime(8, 0), dtime(20, 0)):
+            HoraProgramada.objects.create(orden=self.orden, hora=h)
+
+    def test_idempotente(self):
+        from .agenda import materializar_eventos
+
+        hoy = date.today()
+        materializar_eventos(hoy, hoy + timedelta(days=1))
+        materializar_eventos(hoy, hoy + timedelta(days=1))
+        self.assertEqual(Administracion.objects.filter(orden=self.orden).count(), 4)
+
+    def test_no_admite_duplicados(self):
+        from django.db import IntegrityError, transaction
+
+        prog = timezone.make_aware(datetime.combine(date.today(), dtime(8, 0)))
+        Administracion.objects.create(orden=self.orden, residente=self.orden.receta.residente, programada_para=prog)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Administracion.objects.create(orden=self.orden, residente=self.orden.receta.residente,
+                                          programada_para=prog)
+
+    def test_backfill_solo_dias_pendientes(self):
+        from .agenda import materializar_agenda
+        from .models import DiaMaterializado
+
+        hoy = date.today()
+        dias = materializar_agenda(hoy=hoy, horizonte=1, backfill=2)
+        self.assertEqual(dias, [hoy - timedelta(days=2), hoy - timedelta(days=1), hoy, hoy + timedelta(days=1)])
+        self.assertEqual(DiaMaterializado.objects.count(), 4)
+        # Los días pasados ya quedaron registrados: no se vuelven a revisar
+        self.assertEqual(materializar_agenda(hoy=hoy, horizonte=1, backfill=2), [hoy, hoy + timedelta(days=1)])
+        self.assertEqual(Administracion.objects.filter(orden=self.orden).count(), 4)
+
+
+class RegenerarOrdenesTests(TestCase):
+
+    def setUp(self):
+        from .agenda import regenerar_ordenes
+        from .models import HoraProgramada
+
+        self.hoy = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):  # deja vacía la regeneración diferida
+            self.orden = _crear_orden()
+            self.orden.receta.inicio = self.hoy
+            self.orden.receta.save(update_fields=["inicio"])
+            self.h8 = HoraProgramada.objects.create(orden=self.orden, hora=dtime(8, 0))
+            self.h20 = HoraProgramada.objects.create(orden=self.orden, hora=dtime(20, 0))
+        regenerar_ordenes([self.orden.pk], hoy=self.hoy)
+
+    def _eventos(self):
+        return list(Administracion.objects.filter(orden=self.orden)
+                    .order_by("programada_para").values_list("programada_para", "estado"))
+
+    def _regenerar(self):
+        from .agenda import regenerar_ordenes
+        return regenerar_ordenes([self.orden.pk], hoy=self.hoy)
+
+    def test_hora_quitada_conserva_marcados(self):
+        from .agenda import horizonte_dias
+
+        dias = horizonte_dias() + 1
+        self.assertEqual(len(self._eventos()), 2 * dias)
+        marcado = Administracion.objects.filter(orden=self.orden, programada_para__time=dtime(20, 0)).earliest("programada_para")
+        marcado.estado = "DADA"
+        marcado.save(update_fields=["estado"])
+
+        self.h20.delete()
+        self.assertEqual(self._regenerar(), (0, dias - 1))
+        self.assertEqual(sum(1 for _, e in self._eventos() if e == "PENDIENTE"), dias)
+        self.assertTrue(Administracion.objects.filter(pk=marcado.pk, estado="DADA").exists())
+
+    def test_orden_o_residente_inactivo(self):
+        self.orden.activo = False
+        self.orden.save(update_fields=["activo"])
+        self._regenerar()
+        self.assertEqual(self._eventos(), [])
+
+        self.orden.activo = True
+        self.orden.save(update_fields=["activo"])
+        self.assertGreater(self._regenerar()[0], 0)
+        residente = self.orden.receta.residente
+        residente.activo = False
+        residente.save()
+        self._regenerar()
+        self.assertEqual(self._eventos(), [])
+
+    def test_una_pasada_por_transaccion(self):
+        from .models import HoraProgramada
+
+        with mock.patch("landing.agenda.regenerar_ordenes") as regenerar:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.orden.dosis = "2 tabletas"
+                self.orden.save()
+                HoraProgramada.objects.create(orden=self.orden, hora=dtime(12, 0))
+                HoraProgramada.objects.create(orden=self.orden, hora=dtime(16, 0))
+            regenerar.assert_called_once_with({self.orden.pk})
+
+    def test_transaccion_revertida_no_se_arrastra(self):
+        from django.db import transaction
+        from .agenda import _lote_vigente
+        from .models import HoraProgramada
+
+        with mock.patch("landing.agenda.regenerar_ordenes") as regenerar:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        HoraProgramada.objects.create(orden=self.orden, hora=dtime(10, 0))
+                        self.assertIsNotNone(_lote_vigente())
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                self.assertIsNone(_lote_vigente())   # Django soltó el callback: el lote se fue con él
+                otra = _crear_orden_para(self.orden.receta)
+                HoraProgramada.objects.create(orden=otra, hora=dtime(10, 0))
+            regenerar.assert_called_once_with({otra.pk})
+            self.assertIsNone(_lote_vigente())
+
+
+class MarcarGrupoTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import Group
+        from .models import Asignacion
+
+        self.orden = _crear_orden(stock=10)
+        self.mio = self.orden.receta.residente
+        otro = Residente.objects.create(nombre_completo="Beto Rojas", rut="22.222.222-2")
+        otra_orden = _crear_orden_para(Receta.objects.create(residente=otro, medico=self.orden.receta.medico,
+                                                             inicio=date.today()), stock=10)
+        ocho = timezone.make_aware(datetime.combine(timezone.localdate(), dtime(8, 0)))
+        crear = Administracion.objects.create
+        self.a1 = crear(orden=self.orden, residente=self.mio, programada_para=ocho)
+        self.a2 = crear(orden=self.orden, residente=self.mio, programada_para=ocho + timedelta(seconds=30))
+        self.a3 = crear(orden=self.orden, residente=self.mio, programada_para=ocho + timedelta(minutes=1))
+        self.b1 = crear(orden=otra_orden, residente=otro, programada_para=ocho)
+        self.cuidadora = User.objects.create_user("cami")
+        self.cuidadora.groups.add(Group.objects.create(name="CUIDADORA"))
+        Asignacion.objects.create(fecha=timezone.localdate(), cuidadora=self.cuidadora, residente=self.mio)
+
+    def _estados(self):
+        return {e.pk: e.estado for e in Administracion.objects.all()}
+
+    def test_minuto_y_asignados(self):
+        self.client.force_login(self.cuidadora)
+        self.client.post(reverse("admin_marcar_grupo"), {"hora": "08:00", "estado": "DADA"})
+        self.assertEqual(self._estados(), {self.a1.pk: "DADA", self.a2.pk: "DADA",
+                                           self.a3.pk: "PENDIENTE", self.b1.pk: "PENDIENTE"})
+        self.orden.refresh_from_db()
+        self.assertEqual(self.orden.stock_asignado, 8)
+
+    def test_subconjunto_por_ids(self):
+        admin = User.objects.create_superuser("jefa", password="x")
+        self.client.force_login(admin)
+        self.client.post(reverse("admin_marcar_grupo"),
+                         {"hora": "08:00", "estado": "OMITIDA", "ids": [self.a2.pk, self.b1.pk, self.a3.pk]})
+        self.assertEqual(self._estados(), {self.a1.pk: "PENDIENTE", self.a2.pk: "OMITIDA",
+                                           self.a3.pk: "PENDIENTE", self.b1.pk: "OMITIDA"})
+
+
+@override_settings(SIFA_OUTBOX_HILO=False, SIFA_ALERTAS_VENTANA=0)
+class StockConcurrenteTests(TransactionTestCase):
+    """Marcados en paralelo no deben perder descuentos de stock."""
+
+    HILOS = 8
+    POR_HILO = 10
+
+    def test_sin_descuentos_perdidos(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("requiere una base compartida entre hilos (TEST NAME en archivo)")
+        total = self.HILOS * self.POR_HILO
+        orden = _crear_orden(stock=total + 5, critico=2)
+        base = timezone.make_aware(datetime.combine(date.today(), dtime(8, 0)))
+        eventos = Administracion.objects.bulk_create([
+            Administracion(orden=orden, residente_id=orden.receta.residente_id,
+                           programada_para=base + timedelta(minutes=i))
+            for i in range(total)
+        ])
+        ids = [e.id for e in Administracion.objects.order_by("id")]
+        self.assertEqual(len(ids), len(eventos))
+
+        errores, barrera = [], threading.Barrier(self.HILOS)
+
+        def marcar(lote):
+            try:
+                barrera.wait()
+                for pk in lote:
+                    e = Administracion.objects.get(pk=pk)
+                    Administracion.objects.filter(pk=pk).update(estado="DADA")
+                    _ajustar_stock_por_transicion(e, "PENDIENTE", "DADA")
+            except Exception as exc:  # pragma: no cover - se reporta abajo
+                errores.append(exc)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        hilos = [
+            threading.Thread(target=marcar, args=(ids[i::self.HILOS],))
+            for i in range(self.HILOS)
+        ]
+        for t in hilos:
+            t.start()
+        for t in hilos:
+            t.join()
+
+        self.assertEqual(errores, [])
+        orden.refresh_from_db()
+        self.assertEqual(orden.stock_asignado, 5)
+        self.assertEqual(
+            MovimientoStock.objects.filter(orden=orden, tipo=MovimientoStock.Tipo.CONSUMO).count(),
+            total,
+        )
+        self.assertFalse(orden.stock_en_critico)
+
+    def test_flag_critico_y_piso_cero(self):
+        orden = _crear_orden(stock=3, critico=1)
+        e = Administracion.objects.create(
+            orden=orden, residente_id=orden.receta.residente_id, programada_para=timezone.now()
+        )
+        for _ in range(2):
+            _ajustar_stock_por_transicion(e, "PENDIENTE", "DADA")
+        orden.refresh_from_db()
+        self.assertEqual(orden.stock_asignado, 1)
+        self.assertTrue(orden.stock_en_critico)
+        self.assertTrue(orden.alerta_enviada)
+        self.assertEqual(MensajeSaliente.objects.count(), 1)
+
+        for _ in range(3):
+            _ajustar_stock_por_transicion(e, "PENDIENTE", "DADA")
+        orden.refresh_from_db()
+        self.assertEqual(orden.stock_asignado, 0)
+
+        _ajustar_stock_por_transicion(e, "DADA", "OMITIDA")
+        _ajustar_stock_por_transicion(e, "DADA", "OMITIDA")
+        orden.refresh_from_db()
+        self.assertEqual(orden.stock_asignado, 2)
+        self.assertFalse(orden.stock_en_critico)
+        self.assertFalse(orden.alerta_enviada)
+
+
+@override_settings(SIFA_OUTBOX_HILO=False, SIFA_OUTBOX_MAX_INTENTOS=2)
+class OutboxTests(TestCase):
+
+    @mock.patch("landing.notifications.enviar_telegram", return_value=ResultadoEnvio(False, "HTTP 500"))
+    def test_reintenta_y_descarta(self, _send):
+        msg = encolar_mensaje("hola")
+        self.assertEqual(entregar_pendientes(), (0, 1))
+        msg.refresh_from_db()
+        self.assertEqual(msg.estado, MensajeSaliente.Estado.PENDIENTE)
+        self.assertGreater(msg.proximo_intento, timezone.now())
+
+        # aún en backoff: no se reintenta
+        self.assertEqual(entregar_pendientes(), (0, 0))
+
+        MensajeSaliente.objects.filter(pk=msg.pk).update(proximo_intento=timezone.now())
+        entregar_pendientes()
+        msg.refresh_from_db()
+        self.assertEqual(msg.estado, MensajeSaliente.Estado.DESCARTADO)
+        self.assertEqual(msg.intentos, 2)
+
+    @mock.patch("landing.notifications.enviar_telegram", return_value=ResultadoEnvio(True, "OK"))
+    def test_entrega(self, _send):
+        encolar_mensaje("hola")
+        self.assertEqual(entregar_pendientes(), (1, 0))
+        self.assertEqual(entregar_pendientes(), (0, 0))
+        _send.assert_called_once()
+
+
+@override_settings(SIFA_OUTBOX_HILO=False, SIFA_ALERTAS_VENTANA=300)
+class ResumenAlertasTests(TestCase):
+
+    def test_un_mensaje_por_residente(self):
+        orden = _crear_orden(stock=5, critico=1)
+        otras = [
+            OrdenMedicamento.objects.create(receta=orden.receta, producto=orden.producto,
+                                            dosis=f"{i} ml", stock_asignado=5, stock_critico=1)
+            for i in (2, 3)
+        ]
+        e = Administracion.objects.create(
+            orden=orden, residente_id=orden.receta.residente_id, programada_para=timezone.now()
+        )
+        for o in [orden, *otras]:
+            e.orden_id = o.id
+            for _ in range(4):
+                _ajustar_stock_por_transicion(e, "PENDIENTE", "DADA")
+        self.assertEqual(AlertaStockPendiente.objects.count(), 3)
+        self.assertEqual(MensajeSaliente.objects.count(), 0)
+
+        # la ventana sigue abierta
+        self.assertEqual(enviar_resumen_alertas(), 0)
+
+        AlertaStockPendiente.objects.update(creada_en=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(enviar_resumen_alertas(), 1)
+        msg = MensajeSaliente.objects.get()
+        self.assertIn("3 medicamento(s)", msg.texto)
+        self.assertFalse(AlertaStockPendiente.objects.exists())
+        self.assertEqual(OrdenMedicamento.objects.filter(alerta_enviada=True).count(), 3)
+
+    def test_despierta_al_worker(self):
+        # Sin esto el resumen solo saldría cuando otro mensaje arrancara el hilo
+        orden = _crear_orden(stock=1, critico=1)
+        with mock.patch("landing.notifications.despertar_worker") as despertar, \
+                self.captureOnCommitCallbacks(execute=True):
+            registrar_alerta_stock(orden)
+        self.assertEqual(AlertaStockPendiente.objects.count(), 1)
+        despertar.assert_called_once()
+
+
+class TelegramTransportTests(TestCase):
+
+    def test_partir_mensaje_por_lineas(self):
+        lineas = [f"   • Residente número {i}" for i in range(400)]
+        partes = partir_mensaje("\n".join(lineas))
+        self.assertGreater(len(partes), 1)
+        self.assertTrue(all(len(p) <= 4096 for p in partes))
+        self.assertEqual("\n".join(partes).split("\n"), lineas)
+
+    def test_token_bucket_espera(self):
+        reloj = [0.0]
+        esperas = []
+
+        def dormir(s):
+            esperas.append(s)
+            reloj[0] += s
+
+        bucket = TokenBucket(tasa=2, capacidad=2, reloj=lambda: reloj[0], dormir=dormir)
+        for _ in range(4):
+            self.assertTrue(bucket.tomar())
+        self.assertEqual(esperas, [0.5, 0.5])
+        self.assertFalse(bucket.tomar(max_espera=0.1))
+
+    def test_keep_alive_y_particion_contra_fake(self):
+        with FakeBotAPI() as api, self.settings(TELEGRAM_API_BASE=api.url, TELEGRAM_RAFAGA_POR_CHAT=50,
+                                                TELEGRAM_RATE_POR_CHAT=100):
+            for i in range(5):
+                self.assertTrue(send_telegram_message(f"hola {i}", chat_id="fake-1"))
+            ok, _ = send_telegram_message("x" * 5000, return_detail=True, chat_id="fake-1")
+            self.assertTrue(ok)
+            self.assertEqual(len(api.recibidos), 7)
+            self.assertEqual(api.conexiones, 1)
+
+    @override_settings(SIFA_OUTBOX_HILO=False)
+    def test_outbox_respeta_retry_after(self):
+        with FakeBotAPI(fallar=1, status_fallo=429, retry_after=120) as api, \
+                self.settings(TELEGRAM_API_BASE=api.url, TELEGRAM_RAFAGA_POR_CHAT=50):
+            msg = encolar_mensaje("stock crítico", chat_id="fake-2")
+            self.assertEqual(entregar_pendientes(), (0, 1))
+            msg.refresh_from_db()
+            self.assertIn("429", msg.ultimo_error)
+            self.assertGreater(msg.proximo_intento, timezone.now() + timedelta(seconds=100))
+
+
+class RolesCacheTests(TestCase):
+
+    def test_una_consulta_y_se_invalida(self):
+        from django.contrib.auth.models import Group
+        from .forms import assign_single_role
+        from .roles import is_admin, is_tens, roles_de
+
+        u = User.objects.create_user("tens1")
+        assign_single_role(u, "TENS")
+        u = User.objects.get(pk=u.pk)
+        self.assertTrue(is_tens(u))
+        with self.assertNumQueries(0):  # el resto del request no vuelve a consultar
+            self.assertFalse(is_admin(u))
+            roles_de(u)
+        # otro request (objeto nuevo): sale de la memoria del proceso, sin consultas
+        with self.assertNumQueries(0):
+            self.assertTrue(is_tens(User(pk=u.pk, username="tens1")))
+
+        Group.objects.get_or_create(name="ADMIN")[0].user_set.add(u)
+        self.assertTrue(is_admin(User.objects.get(pk=u.pk)))
+
+    @override_settings(SIFA_ROLES_CACHE="compartido", CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "compartido": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "roles-test"},
+    })
+    def test_cache_compartido_entre_procesos(self):
+        from . import roles
+        from .forms import assign_single_role
+
+        u = User.objects.create_user("tens1")
+        assign_single_role(u, "TENS")
+        self.assertTrue(roles.is_tens(User(pk=u.pk)))
+        roles._local.clear()                       # otro proceso: sin copia local
+        with self.assertNumQueries(0):
+            self.assertTrue(roles.is_tens(User(pk=u.pk)))
+
+        with mock.patch.object(roles, "ROLES_LOCAL_TTL", 0):
+            self.assertTrue(roles.is_tens(User(pk=u.pk)))
+            assign_single_role(u, "CUIDADORA")     # invalida el cache compartido en el acto
+            roles._local.clear()
+            self.assertEqual(roles.roles_de(User(pk=u.pk)), {"CUIDADORA"})
+
+
+class GrillaRegistroTests(TestCase):
+
+    def test_pivot_una_consulta(self):
+        from .registro import construir_grilla
+
+        orden = _crear_orden()
+        tens = User.objects.create_user("tens", first_name="Ana María")
+        res_id = orden.receta.residente_id
+        hoy = date.today()
+        tz = timezone.get_current_timezone()
+        ocho = lambda d: timezone.make_aware(datetime.combine(d, dtime(8, 0)), tz)
+        Administracion.objects.create(orden=orden, residente_id=res_id, programada_para=ocho(hoy),
+                                      estado="DADA", realizada_por=tens)
+        Administracion.objects.create(orden=orden, residente_id=res_id,
+                                      programada_para=ocho(hoy + timedelta(days=1)))
+
+        with self.assertNumQueries(1):
+            grilla = construir_grilla(orden.receta.residente, hoy, hoy + timedelta(days=2))
+            fila, = grilla.filas
+            celdas = list(fila.celdas)
+        self.assertEqual(fila.label, "Paracetamol 500 mg · 1 tableta — 8:00 am")
+        self.assertEqual(celdas, [("✓ (Ana)", "status-ok"), ("•", "status-pend"), ("", "empty")])
+        self.assertEqual(grilla.totales["DADA"], 1)
+
+
+class SnapshotRegistroTests(TestCase):
+
+    def test_snapshot_etag_e_invalidacion(self):
+        from django.contrib.auth.models import Group
+        from .models import RegistroMensualSnapshot
+        from .registro import grilla_mes_con_hash
+
+        orden = _crear_orden()
+        res = orden.receta.residente
+        mes_pasado = timezone.localdate().replace(day=1) - timedelta(days=1)
+        e = Administracion.objects.create(
+            orden=orden, residente=res,
+            programada_para=timezone.make_aware(datetime.combine(mes_pasado, dtime(8, 0))),
+        )
+        y, m = mes_pasado.year, mes_pasado.month
+
+        grilla, h = grilla_mes_con_hash(res, y, m)
+        self.assertTrue(h)
+        with self.assertNumQueries(1):
+            grilla2, h2 = grilla_mes_con_hash(res, y, m)
+        self.assertEqual(h, h2)
+        self.assertEqual([list(f.celdas) for f in grilla.filas], [list(f.celdas) for f in grilla2.filas])
+
+        user = User.objects.create_user("doc", password="x")
+        user.groups.add(Group.objects.create(name="DOCTOR"))
+        self.client.force_login(user)
+        url = f"/registro/{res.id}/?year={y}&month={m}"
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+        r = self.client.get(url, HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r.status_code, 304)
+
+        # corrección tardía: borra solo ese snapshot
+        e.estado = "DADA"
+        e.save()
+        self.assertFalse(RegistroMensualSnapshot.objects.exists())
+        _, h3 = grilla_mes_con_hash(res, y, m)
+        self.assertNotEqual(h, h3)
+
+        # Stock o activo no tocan la grilla; la dosis sí
+        from .stock import corregir_stock
+        corregir_stock(orden, 3, 1)
+        orden.activo = False
+        orden.save()
+        self.assertTrue(RegistroMensualSnapshot.objects.exists())
+        orden.dosis = "2 tabletas"
+        orden.save(update_fields=["dosis"])
+        self.assertFalse(RegistroMensualSnapshot.objects.exists())
+
+
+class RegistroTodosTests(TestCase):
+
+    def test_streaming_una_seccion_por_residente(self):
+        from django.contrib.auth.models import Group
+
+        orden = _crear_orden()
+        otro = Residente.objects.create(nombre_completo="Bruno Díaz", rut="22.222.222-2")
+        Administracion.objects.create(
+            orden=orden, residente=orden.receta.residente,
+            programada_para=timezone.make_aware(datetime.combine(date.today(), dtime(8, 0))),
+        )
+        user = User.objects.create_user("doc")
+        user.groups.add(Group.objects.create(name="DOCTOR"))
+        self.client.force_login(user)
+
+        r = self.client.get("/registro/todos/")
+        self.assertTrue(r.streaming)
+        html = b"".join(r.streaming_content).decode()
+        self.assertEqual(html.count('class="residente-seccion'), 2)
+        self.assertLess(html.index("Ana Pérez"), html.index(otro.nombre_completo))
+        self.assertIn("Paracetamol 500 mg · 1 tableta — 8:00 am", html)
+        self.assertIn("</html>", html)
+
+
+class ColaPDFTests(TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_dedupe_cola_y_cache(self):
+        from .models import TrabajoPDF
+        from .pdfs import procesar_pendientes
+
+        orden = _crear_orden()
+        res = orden.receta.residente
+        admin = User.objects.create_superuser("root", password="x")
+        self.client.force_login(admin)
+        url = f"/residentes/{res.id}/registro-mensual/pdf/"
+
+        html = mock.MagicMock()
+        html.return_value.write_pdf.return_value = b"%PDF-1.4 fake"
+        with self.settings(SIFA_PDF_DIR=self.tmp.name, SIFA_PDF_HILO=False), \
+                mock.patch("landing.views._weasy_available", True), \
+                mock.patch("landing.pdfs._weasy_available", True), \
+                mock.patch("landing.pdfs.HTML", html, create=True), \
+                mock.patch("landing.pdfs.CSS", mock.MagicMock(), create=True):
+            self.assertEqual(self.client.get(url).status_code, 202)
+            self.assertEqual(self.client.get(url).status_code, 202)
+            self.assertEqual(TrabajoPDF.objects.count(), 1)
+
+            self.assertEqual(procesar_pendientes(), (1, 0))
+            html.assert_called_once()
+
+            r = self.client.get(url)
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(b"".join(r.streaming_content), b"%PDF-1.4 fake")
+            r = self.client.get(url, HTTP_IF_NONE_MATCH=r["ETag"])
+            self.assertEqual(r.status_code, 304)
+
+            trabajo = TrabajoPDF.objects.get()
+            estado = self.client.get(f"/registro/pdf/{trabajo.clave}/estado/").json()
+            self.assertEqual(estado["estado"], "LISTO")
+
+    def test_archivo_bajo_la_clave_de_lo_dibujado(self):
+        from .pdfs import contenido, procesar_pendientes, ruta_pdf
+
+        orden = _crear_orden()
+        res = orden.receta.residente
+        hoy = timezone.localdate()
+        self.client.force_login(User.objects.create_superuser("root", password="x"))
+        url = f"/residentes/{res.id}/registro-mensual/pdf/"
+
+        html = mock.MagicMock()
+        html.return_value.write_pdf.return_value = b"%PDF-1.4 fake"
+        with self.settings(SIFA_PDF_DIR=self.tmp.name, SIFA_PDF_HILO=False), \
+                mock.patch("landing.views._weasy_available", True), \
+                mock.patch("landing.pdfs._weasy_available", True), \
+                mock.patch("landing.pdfs.HTML", html, create=True), \
+                mock.patch("landing.pdfs.CSS", mock.MagicMock(), create=True):
+            self.assertEqual(self.client.get(url).status_code, 202)
+            # El mes (abierto) cambia entre el pedido y el render
+            Administracion.objects.create(orden=orden, residente=res,
+                                          programada_para=timezone.make_aware(datetime.combine(hoy, dtime(8, 0))))
+            self.assertEqual(procesar_pendientes(), (1, 0))
+            self.assertEqual(self.client.get(url).status_code, 200)
+            _, clave = contenido(res, hoy.year, hoy.month)
+            self.assertTrue(ruta_pdf(clave).exists())
+
+    def test_mes_cerrado_sale_del_hash_del_snapshot(self):
+        from .pdfs import pdf_en_cache, solicitar_pdf
+
+        orden = _crear_orden()
+        res = orden.receta.residente
+        mes_pasado = timezone.localdate().replace(day=1) - timedelta(days=1)
+        Administracion.objects.create(orden=orden, residente=res,
+                                      programada_para=timezone.make_aware(datetime.combine(mes_pasado, dtime(8, 0))))
+        y, m = mes_pasado.year, mes_pasado.month
+
+        html = mock.MagicMock()
+        html.return_value.write_pdf.return_value = b"%PDF-1.4 fake"
+        with self.settings(SIFA_PDF_DIR=self.tmp.name, SIFA_PDF_HILO=False), \
+                mock.patch("landing.pdfs._weasy_available", True), \
+                mock.patch("landing.pdfs.HTML", html, create=True), \
+                mock.patch("landing.pdfs.CSS", mock.MagicMock(), create=True):
+            ruta, ya_estaba = pdf_en_cache(res.pk, y, m)   # crea el snapshot y el archivo
+            self.assertFalse(ya_estaba)
+            with mock.patch("landing.pdfs.grilla_mes_con_hash", side_effect=AssertionError("armó la grilla")), \
+                    self.assertNumQueries(1):             # solo el hash del snapshot
+                clave, ruta2, trabajo = solicitar_pdf(res, y, m)
+            self.assertEqual((ruta2, trabajo), (ruta, None))
+            # La fecha del render queda en el archivo, no en la clave: otro día es el mismo PDF
+            with mock.patch("landing.pdfs.grilla_mes_con_hash", side_effect=AssertionError("armó la grilla")), \
+                    mock.patch("django.utils.timezone.localdate", return_value=timezone.localdate() + timedelta(days=1)):
+                self.assertEqual(pdf_en_cache(res.pk, y, m), (ruta, True))
+        self.assertEqual(html.call_count, 1)
+
+
+class ExportacionZipTests(TestCase):
+
+    def test_zip_reutiliza_cache(self):
+        import tempfile
+        import zipfile
+        from .models import ExportacionRegistros
+        from .pdfs import exportar_mes, pdf_en_cache
+
+        orden = _crear_orden()
+        otro = Residente.objects.create(nombre_completo="Bruno Díaz", rut="22.222.222-2")
+        hoy = timezone.make_aware(datetime.combine(date.today(), dtime(8, 0)))
+        for i, res in enumerate((orden.receta.residente, otro)):
+            Administracion.objects.create(orden=orden, residente=res,
+                                          programada_para=hoy + timedelta(minutes=i))
+
+        html = mock.MagicMock()
+        html.return_value.write_pdf.return_value = b"%PDF-1.4 fake"
+        with tempfile.TemporaryDirectory() as tmp, \
+                self.settings(SIFA_PDF_DIR=tmp, SIFA_PDF_HILO=False), \
+                mock.patch("landing.pdfs._weasy_available", True), \
+                mock.patch("landing.pdfs.HTML", html, create=True), \
+                mock.patch("landing.pdfs.CSS", mock.MagicMock(), create=True):
+            pdf_en_cache(otro.pk, hoy.year, hoy.month)
+            exp = ExportacionRegistros.objects.create(year=hoy.year, month=hoy.month)
+            ruta = exportar_mes(exp, procesos=1)
+
+            exp.refresh_from_db()
+            self.assertEqual((exp.estado, exp.total, exp.hechos, exp.desde_cache), ("LISTO", 2, 2, 1))
+            self.assertEqual(html.call_count, 2)
+            with zipfile.ZipFile(ruta) as zf:
+                self.assertEqual(len(zf.namelist()), 2)
+                self.assertTrue(any(n.startswith("Bruno Díaz") for n in zf.namelist()))
+
+    def test_zip_borrado_se_reencola(self):
+        from .models import ExportacionRegistros
+
+        exp = ExportacionRegistros.objects.create(year=2025, month=1, estado="LISTO",
+                                                  archivo="/no/existe/registros_2025-01.zip")
+        self.client.force_login(User.objects.create_superuser("root", password="x"))
+        with self.settings(SIFA_PDF_HILO=False):
+            r = self.client.get(f"/registro/exportar/{exp.pk}/?descargar=1")
+        self.assertRedirects(r, f"/registro/exportar/{exp.pk}/", fetch_redirect_response=False)
+        exp.refresh_from_db()
+        self.assertEqual((exp.estado, exp.archivo), ("PENDIENTE", ""))
+
+    def test_exportacion_colgada_se_retoma(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import ExportacionRegistros
+        from .pdfs import exportaciones_pendientes, reservar_exportacion
+
+        hace = lambda s: timezone.now() - timedelta(seconds=s)
+        viva = ExportacionRegistros.objects.create(year=2025, month=1, estado="PROCESANDO", iniciado_en=hace(10))
+        muerta = ExportacionRegistros.objects.create(year=2025, month=2, estado="PROCESANDO", iniciado_en=hace(700))
+        with self.settings(SIFA_EXPORTACION_LEASE=600):
+            self.assertEqual(list(exportaciones_pendientes()), [muerta])
+            self.assertFalse(reservar_exportacion(viva.pk))
+            with mock.patch("landing.management.commands.exportar_registros.exportar_mes",
+                            return_value="/tmp/x.zip") as exportar:
+                call_command("exportar_registros", "--pendientes", stdout=StringIO())
+            self.assertEqual([c.args[0].pk for c in exportar.call_args_list], [muerta.pk])
+            muerta.refresh_from_db()
+            self.assertGreater(muerta.iniciado_en, hace(5))           # lease nuevo
+            self.assertFalse(reservar_exportacion(muerta.pk))           # y ya no está libre
+
+    def test_purgar_borra_zip_viejos(self):
+        import os
+        import tempfile
+        from pathlib import Path
+        from .pdfs import purgar
+
+        with tempfile.TemporaryDirectory() as tmp, self.settings(SIFA_PDF_DIR=tmp):
+            viejo = Path(tmp) / "zip" / "registros_2025-01_1.zip"
+            nuevo = Path(tmp) / "zip" / "registros_2025-02_2.zip"
+            pdf = Path(tmp) / "ab" / "abc.pdf"
+            for ruta in (viejo, nuevo, pdf):
+                ruta.parent.mkdir(parents=True, exist_ok=True)
+                ruta.write_bytes(b"x")
+            hace_un_mes = timezone.now().timestamp() - 31 * 86400
+            os.utime(viejo, (hace_un_mes, hace_un_mes))
+            os.utime(pdf, (hace_un_mes, hace_un_mes))
+            self.assertEqual(purgar(30), 2)
+            self.assertEqual([viejo.exists(), nuevo.exists(), pdf.exists()], [False, True, False])
+
+
+class ExportacionProcesosTests(TransactionTestCase):
+    """El pool de procesos (spawn) de exportar_mes, con una base que ven los hijos."""
+
+    def test_pool_de_procesos(self):
+        import sys
+        import tempfile
+        import zipfile
+        from pathlib import Path
+        from .models import ExportacionRegistros
+        from .pdfs import exportar_mes, pdf_en_cache
+
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("requiere una base compartida entre procesos (TEST NAME en archivo)")
+        orden = _crear_orden()
+        otros = [Residente.objects.create(nombre_completo=f"Residente {i}", rut=f"2{i}.222.222-2") for i in range(2)]
+        hoy = timezone.make_aware(datetime.combine(date.today(), dtime(8, 0)))
+        for i, res in enumerate([orden.receta.residente, *otros]):
+            Administracion.objects.create(orden=orden, residente=res, programada_para=hoy + timedelta(minutes=i))
+
+        # Los hijos (spawn) importan un weasyprint falso desde sys.path, que heredan del padre
+        falso = tempfile.TemporaryDirectory()
+        self.addCleanup(falso.cleanup)
+        Path(falso.name, "weasyprint.py").write_text(
+            "class CSS:\n    def __init__(self, **kw): pass\n\n"
+            "class HTML:\n    def __init__(self, **kw): pass\n"
+            "    def write_pdf(self, **kw): return b'%PDF-1.4 hijo'\n"
+        )
+        sys.path.insert(0, falso.name)
+        self.addCleanup(sys.path.remove, falso.name)
+
+        html = mock.MagicMock()
+        html.return_value.write_pdf.return_value = b"%PDF-1.4 padre"
+        progreso = []
+        with tempfile.TemporaryDirectory() as tmp, self.settings(SIFA_PDF_DIR=tmp, SIFA_PDF_HILO=False):
+            with mock.patch("landing.pdfs._weasy_available", True), \
+                    mock.patch("landing.pdfs.HTML", html, create=True), \
+                    mock.patch("landing.pdfs.CSS", mock.MagicMock(), create=True):
+                pdf_en_cache(otros[0].pk, hoy.year, hoy.month)          # uno ya está en el cache
+            exp = ExportacionRegistros.objects.create(year=hoy.year, month=hoy.month)
+            ruta = exportar_mes(exp, procesos=2, progreso=lambda h, t: progreso.append((h, t)))
+
+            exp.refresh_from_db()
+            self.assertEqual((exp.estado, exp.total, exp.hechos, exp.desde_cache), ("LISTO", 3, 3, 1))
+            self.assertEqual(progreso, [(1, 3), (2, 3), (3, 3)])
+            with zipfile.ZipFile(ruta) as zf:
+                contenidos = sorted(zf.read(n) for n in zf.namelist())
+                self.assertEqual(len(zf.namelist()), 3)
+                self.assertTrue(any(n.startswith("Residente 1") for n in zf.namelist()))
+        self.assertEqual(contenidos, [b"%PDF-1.4 hijo", b"%PDF-1.4 hijo", b"%PDF-1.4 padre"])
+
+
+class HistorialCsvTests(TestCase):
+
+    def test_keyset_por_lotes_y_filtros(self):
+        import csv
+        import io
+        from django.contrib.auth.models import Group
+        from .historial import historial, lineas_csv
+
+        orden = _crear_orden()
+        res = orden.receta.residente
+        ana = User.objects.create_user("ana", first_name="Ana", last_name="Soto")
+        base = timezone.make_aware(datetime(2024, 3, 10, 8, 0))
+        # Dos eventos a la misma hora (distinto id) para probar el desempate del keyset
+        otra = OrdenMedicamento.objects.create(receta=orden.receta, producto=orden.producto,
+                                               dosis="1 comp", via="oral")
+        Administracion.objects.create(orden=otra, residente=res, programada_para=base)
+        for i in range(5):
+            Administracion.objects.create(orden=orden, residente=res, estado="DADA", realizada_por=ana,
+                                          observacion="ok, sin problemas" if i == 0 else "",
+                                          programada_para=base + timedelta(days=i))
+
+        filas = list(csv.reader(io.StringIO("".join(lineas_csv(historial(), lote=2)))))
+        self.assertEqual(len(filas), 7)
+        self.assertEqual(filas[1][0], "2024-03-10 08:00")
+        self.assertEqual(filas[2][-2:], ["Ana Soto", "ok, sin problemas"])
+
+        qs = historial(desde=date(2024, 3, 11), hasta=date(2024, 3, 12), cuidadora=ana.pk)
+        self.assertEqual(len(list(lineas_csv(qs, encabezado=False))), 2)
+
+        admin = User.objects.create_user("jefa", password="x")
+        admin.groups.add(Group.objects.create(name="ADMIN"))
+        self.client.force_login(admin)
+        resp = self.client.get(reverse("historial_csv"), {"desde": "2024-03-10", "hasta": "2024-03-10"})
+        self.assertEqual(resp.status_code, 200)
+        cuerpo = b"".join(resp.streaming_content).decode("utf-8-sig")
+        self.assertEqual(len(cuerpo.splitlines()), 3)
+        self.assertEqual(self.client.get(reverse("historial_csv"), {"desde": "x"}).status_code, 400)
+
+
+class BusquedaProductoTests(TestCase):
+
+    def test_sin_tildes_prefijo_y_errores(self):
+        from .busqueda import buscar_productos, reindexar_todos
+
+        amox = Producto.objects.create(nombre="Amoxicilína", potencia="500 mg", forma="Cápsula")
+        Producto.objects.create(nombre="Amoxicilina/Ácido clavulánico", potencia="875/125 mg")
+        Producto.objects.create(nombre="Paracetamol", potencia="500 mg", forma="Tableta")
+
+        def nombres(q):
+            return [p.nombre for p in buscar_productos(q)]
+
+        self.assertEqual(nombres("amoxicilina")[0], "Amoxicilína")       # sin tildes, el más corto primero
+        self.assertEqual(nombres("AMOXI 500")[0], "Amoxicilína")          # todas las palabras como prefijo
+        self.assertEqual(nombres("capsula amox")[0], "Amoxicilína")
+        self.assertIn("Paracetamol", nombres("paracetamlo"))              # error de tipeo
+        self.assertEqual(nombres("zzz"), [])
+
+        amox.nombre = "Amoxil"
+        amox.save()                                                       # la señal reindexa
+        self.assertEqual(nombres("amoxil 500")[0], "Amoxil")
+
+        Producto.objects.filter(pk=amox.pk).update(nombre="Clamoxyl")     # sin señal
+        self.assertEqual(reindexar_todos(), 3)
+        self.assertEqual(nombres("clamox")[0], "Clamoxyl")
+
+    def test_prefijo_comun_ordena_antes_de_cortar(self):
+        from .busqueda import buscar_productos, reindexar_todos
+
+        Producto.objects.bulk_create([
+            Producto(nombre=f"Paracetamol codeína compuesto {i}", potencia="500/30 mg", forma="Comprimido")
+            for i in range(60)
+        ])
+        Producto.objects.create(nombre="Paracetamol")
+        reindexar_todos()
+        self.assertEqual(buscar_productos("para")[0].nombre, "Paracetamol")
+
+        largo = Producto.objects.create(nombre="ﬁ" * 160, potencia="x" * 60, forma="y" * 40)
+        self.assertLessEqual(len(largo.busqueda), 260)
+
+        # El backfill de la migración corta igual que Producto.clave_busqueda
+        import importlib
+        from django.db.migrations.loader import MigrationLoader
+        from .models import ProductoPalabra, ProductoTrigrama
+        migracion = importlib.import_module("landing.migrations.0017_producto_busqueda")
+        apps = MigrationLoader(connection).project_state(("landing", "0017_producto_busqueda")).apps
+        ProductoPalabra.objects.all().delete()
+        ProductoTrigrama.objects.all().delete()
+        migracion.indexar_catalogo(apps, None)
+        largo.refresh_from_db()
+        self.assertEqual(largo.busqueda, Producto.clave_busqueda(largo.nombre, largo.potencia, largo.forma))
+
+
+class DirectorioResidentesTests(TestCase):
+
+    def test_paginas_por_clave_y_rut_con_cualquier_formato(self):
+        from django.contrib.auth.models import Group
+        from .views import RESIDENTES_POR_PAGINA, _filtrar_residentes
+
+        n = RESIDENTES_POR_PAGINA + 5
+        for i in range(n):
+            Residente.objects.create(nombre_completo=f"Residente {i:03d}", rut=f"{10 + i}.000.000-{i % 10}",
+                                     activo=i % 2 == 0)
+        Residente.objects.create(nombre_completo="Ángela Muñoz Peña", rut="12.345.678-k")
+
+        admin = User.objects.create_user("jefa", password="x")
+        admin.groups.add(Group.objects.create(name="ADMIN"))
+        self.client.force_login(admin)
+        url = reverse("residente_list")
+
+        def nombres(**params):
+            resp = self.client.get(url, params)
+            return [r.nombre_completo for r in resp.context["residentes"]], resp.context["pagina"]
+
+        primera, pagina = nombres()
+        self.assertEqual(primera[0], "Ángela Muñoz Peña")   # ordena sin tildes
+        self.assertIsNone(pagina.anterior)
+        segunda, pagina = nombres(tras=pagina.siguiente)
+        self.assertEqual(len(primera) + len(segunda), n + 1)
+        self.assertFalse(set(primera) & set(segunda))
+        self.assertIsNone(pagina.siguiente)
+        self.assertEqual(nombres(antes=pagina.anterior)[0], primera)
+
+        self.assertEqual(nombres(q="12345678K")[0], ["Ángela Muñoz Peña"])
+        self.assertEqual(nombres(q="12.345.678")[0], ["Ángela Muñoz Peña"])
+        self.assertEqual(nombres(q="pena ANGE")[0], ["Ángela Muñoz Peña"])
+        self.assertEqual(nombres(q="ñ")[0], [])                          # solo comienzos de palabra
+        with self.assertNumQueries(1) as consultas:
+            list(_filtrar_residentes(Residente.objects.all(), "ange mu"))
+        self.assertNotIn("LIKE", consultas.captured_queries[0]["sql"].upper())   # rangos sobre el índice
+        # Cursores adulterados (JSON válido, tipos que no son): primera página, no un 500
+        from .paginacion import codificar_cursor
+        for valores in (["a", [1]], [{"x": 1}, 1], ["a", "1"], ["a", True], ["a", None]):
+            self.assertEqual(nombres(tras=codificar_cursor(valores))[0], primera)
+
+        angela = Residente.objects.get(rut="12.345.678-k")
+        angela.nombre_completo = "Angélica Muñoz"
+        angela.save(update_fields=["nombre_completo"])
+        self.assertEqual(nombres(q="angelica")[0], ["Angélica Muñoz"])
+        self.assertEqual(nombres(q="pena")[0], [])
+        inactivos, _ = nombres(q="residente", estado="I", tras="basura")  # cursor inválido: primera página
+        self.assertEqual(len(inactivos), n // 2)
+
+
+class ListadoUsuariosTests(TestCase):
+
+    def test_rol_y_orden_en_la_consulta(self):
+        from django.contrib.auth.models import Group
+        from .views import USUARIOS_POR_PAGINA
+
+        grupos = {n: Group.objects.create(name=n) for n in ("ADMIN", "TENS", "CUIDADORA", "DOCTOR", "OTRO")}
+        jefa = User.objects.create_user("jefa", first_name="Zoe")
+        jefa.groups.add(grupos["ADMIN"])
+        doble = User.objects.create_user("doble", first_name="Ana")
+        doble.groups.add(grupos["CUIDADORA"], grupos["DOCTOR"], grupos["OTRO"])
+        User.objects.create_user("sinrol", first_name="Aaron")
+        for i in range(USUARIOS_POR_PAGINA):
+            User.objects.create_user(f"tens{i:02d}", first_name=f"tens {i:02d}").groups.add(grupos["TENS"])
+        self.client.force_login(jefa)
+
+        resp = self.client.get(reverse("user_list"))
+        items = [(u.username, rol) for u, rol in resp.context["items"]]
+        self.assertEqual(items[:3], [("jefa", "ADMIN"), ("doble", "DOCTOR"), ("tens00", "TENS")])
+        self.assertEqual(len(items), USUARIOS_POR_PAGINA)
+        ultima = self.client.get(reverse("user_list"), {"page": 2}).context["items"]
+        self.assertEqual([(u.username, rol) for u, rol in ultima],
+                         [(f"tens{USUARIOS_POR_PAGINA - 2}", "TENS"), (f"tens{USUARIOS_POR_PAGINA - 1}", "TENS"),
+                          ("sinrol", None)])
+
+        resp = self.client.get(reverse("user_list"), {"rol": "CUIDADORA"})
+        self.assertEqual([(u.username, rol) for u, rol in resp.context["items"]], [("doble", "DOCTOR")])
+
+
+@override_settings(SIFA_OUTBOX_HILO=False, SIFA_ALERTAS_VENTANA=0)
+class ContadoresTests(TestCase):
+
+    def test_transiciones_en_la_misma_transaccion(self):
+        from django.contrib.auth.models import Group
+        from . import contadores
+        from .agenda import materializar_eventos
+        from .models import ContadorAdministracion, HoraProgramada
+
+        orden = _crear_orden(stock=10)
+        for h in (dtime(8, 0), dtime(20, 0)):
+            HoraProgramada.objects.create(orden=orden, hora=h)
+        hoy = timezone.localdate()
+        materializar_eventos(hoy, hoy)
+        self.assertEqual(contadores.totales(hoy), {"PENDIENTE": 2})
+        self.assertEqual(contadores.por_hora(hoy), [("08:00", 1, 1), ("20:00", 1, 1)])
+
+        admin = User.objects.create_user("jefa", password="x")
+        admin.groups.add(Group.objects.create(name="ADMIN"))
+        self.client.force_login(admin)
+        manana = Administracion.objects.order_by("programada_para").first()
+        self.client.post(reverse("admin_marcar_rapido", args=[manana.pk]), {"estado": "DADA"})
+        self.client.post(reverse("admin_marcar_grupo"), {"hora": "20:00", "estado": "OMITIDA"})
+        self.assertEqual(contadores.totales(hoy), {"DADA": 1, "OMITIDA": 1})
+
+        resp = self.client.get(reverse("dashboard"))
+        self.assertEqual((resp.context["admins_hoy"], resp.context["admins_hechas"]), (2, 2))
+        resp = self.client.get(reverse("admin_list_hoy"), {"h": "20:00"})
+        self.assertEqual(resp.context["horas"], [("08:00", 1, 0), ("20:00", 1, 0)])
+        self.assertEqual(list(resp.context["grupos"]), ["20:00"])
+
+        manana.delete()
+        self.assertEqual(contadores.totales(hoy), {"OMITIDA": 1})
+        ContadorAdministracion.objects.all().delete()
+        self.assertEqual(contadores.recalcular(hoy, hoy), 1)
+        self.assertEqual(contadores.totales(hoy), {"OMITIDA": 1})
+
+    def test_recalcular_reintenta_si_otro_crea_la_fila(self):
+        from . import contadores
+        from .agenda import materializar_eventos
+        from .models import ContadorAdministracion, HoraProgramada
+
+        orden = _crear_orden()
+        HoraProgramada.objects.create(orden=orden, hora=dtime(8, 0))
+        hoy = timezone.localdate()
+        materializar_eventos(hoy, hoy)
+        bulk_create, llamadas = ContadorAdministracion.objects.bulk_create, []
+
+        def carrera(filas, **kw):
+            llamadas.append(len(filas))
+            if len(llamadas) == 1:   # otro proceso crea la fila después del DELETE
+                f = filas[0]
+                ContadorAdministracion.objects.create(fecha=f.fecha, hora=f.hora, residente_id=f.residente_id,
+                                                      estado=f.estado, n=1)
+            return bulk_create(filas, **kw)
+
+        with mock.patch.object(ContadorAdministracion.objects, "bulk_create", carrera):
+            self.assertEqual(contadores.recalcular(hoy, hoy), 1)
+        self.assertEqual(llamadas, [1, 1])
+        self.assertEqual(contadores.totales(hoy), {"PENDIENTE": 1})
+
+
+@override_settings(SIFA_OUTBOX_HILO=False, SIFA_ALERTAS_VENTANA=0,
+                   SIFA_TABLERO_DURACION=0.3, SIFA_TABLERO_INTERVALO=0.05)
+class TableroEnVivoTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import Group
+        from .models import Asignacion
+
+        orden = _crear_orden(stock=10)
+        otro = Residente.objects.create(nombre_completo="Beto Rojas", rut="22.222.222-2")
+        ahora = timezone.now()
+        self.mio = Administracion.objects.create(orden=orden, residente=orden.receta.residente, programada_para=ahora)
+        self.ajeno = Administracion.objects.create(orden=orden, residente=otro,
+                                                   programada_para=ahora + timedelta(minutes=1))
+        self.cuidadora = User.objects.create_user("cami", first_name="Cami")
+        self.cuidadora.groups.add(Group.objects.create(name="CUIDADORA"))
+        Asignacion.objects.create(fecha=timezone.localdate(), cuidadora=self.cuidadora, residente=self.mio.residente)
+
+    def _marcar(self, evento, estado):
+        evento.estado, evento.realizada_por = estado, self.cuidadora
+        evento.save(update_fields=["estado", "realizada_por"])
+
+    @staticmethod
+    def _eventos(texto):
+        import json
+        return [json.loads(b.split("data: ", 1)[1]) for b in texto.split("\n\n") if "event: estado" in b]
+
+    def test_flujo_filtrado_por_asignacion(self):
+        from .tablero import Cursor
+
+        desde = Cursor.actual()
+        self._marcar(self.mio, "DADA")
+        self._marcar(self.ajeno, "OMITIDA")
+        self.client.force_login(self.cuidadora)
+        resp = self.client.get(reverse("admin_hoy_eventos"), {"desde": desde})
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        texto = b"".join(resp.streaming_content).decode()   # WSGI: sondeo corto, la respuesta termina
+        eventos = self._eventos(texto)
+        self.assertEqual([(e["evento"], e["estado"], e["realizada_por"]) for e in eventos],
+                         [(self.mio.pk, "DADA", "Cami")])
+        self.assertTrue(texto.startswith("retry: 5000\n\n"))
+        self.assertTrue(texto.endswith(f"id: {Cursor.actual()}\n\n"))   # el cambio ajeno también avanza el cursor
+
+        # Reconexión: Last-Event-ID manda sobre ?desde
+        resp = self.client.get(reverse("admin_hoy_eventos"), {"desde": 0}, HTTP_LAST_EVENT_ID=str(eventos[0]["id"]))
+        self.assertEqual(self._eventos(b"".join(resp.streaming_content).decode()), [])
+
+    def test_id_que_confirma_tarde_no_se_salta(self):
+        from .models import CambioAdministracion
+        from .tablero import Cursor
+
+        desde = Cursor.actual()
+        self._marcar(self.mio, "DADA")
+        self._marcar(self.ajeno, "OMITIDA")
+        self._marcar(self.mio, "RECHAZADA")
+        primero, lento, ultimo = CambioAdministracion.objects.order_by("pk")[:3]
+        pk = lento.pk
+        lento.delete()   # su transacción sigue abierta: el id ya se tomó, la fila todavía no se ve
+        lento.pk = pk
+
+        cursor = Cursor.desde_texto(str(desde))
+        self.assertEqual([c["id"] for c, _ in cursor.leer()[0]], [primero.pk, ultimo.pk])
+        self.assertEqual(str(cursor), f"{ultimo.pk}~{lento.pk}")
+        # El hueco viaja en el Last-Event-ID: otro proceso (o la reconexión) lo sigue esperando
+        cursor = Cursor.desde_texto(str(cursor))
+        self.assertEqual(cursor.leer()[0], [])
+        lento.save(force_insert=True)    # confirma, con su id menor
+        self.assertEqual([(c["id"], c["estado"]) for c, _ in cursor.leer()[0]], [(lento.pk, "OMITIDA")])
+        self.assertEqual(str(cursor), str(ultimo.pk))
+
+        # Un id que nunca llega (transacción revertida) se deja de esperar pasado SIFA_TABLERO_ESPERA
+        lento.delete()
+        lento.pk = pk
+        cursor = Cursor.desde_texto(f"{ultimo.pk}~{lento.pk}")
+        with self.settings(SIFA_TABLERO_ESPERA=60):
+            cursor.leer()
+            self.assertEqual(cursor.huecos, [[lento.pk, lento.pk]])
+            CambioAdministracion.objects.update(creado_en=timezone.now() - timedelta(minutes=2))
+            cursor.leer()
+            self.assertEqual(str(cursor), str(ultimo.pk))
+            self.assertEqual(str(Cursor.actual()), str(ultimo.pk))
+
+        for basura in ("x", "5~7", "5~3-2", "5~a", "5~1," + ",".join(["2"] * 20)):
+            self.assertIsNone(Cursor.desde_texto(basura))
+
+    async def test_flujo_asgi_en_vivo(self):
+        import asyncio
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+
+        cliente = AsyncClient()
+        await cliente.aforce_login(self.cuidadora)
+        resp = await cliente.get(reverse("admin_hoy_eventos"))
+        partes = []
+
+        async def leer():
+            async for b in resp.streaming_content:
+                partes.append(b.decode())
+
+        lector = asyncio.create_task(leer())
+        await asyncio.sleep(0.1)
+        await sync_to_async(self._marcar)(self.mio, "RECHAZADA")
+        await lector
+        eventos = self._eventos("".join(partes))
+        self.assertEqual([(e["evento"], e["estado"]) for e in eventos], [(self.mio.pk, "RECHAZADA")])
+
+
+@override_settings(SIFA_SYNC_MARGEN=0)
+class ApiSincronizacionTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import Group
+        from .models import Asignacion
+
+        self.orden = _crear_orden(stock=10)
+        otro = Residente.objects.create(nombre_completo="Beto Rojas", rut="22.222.222-2")
+        mediodia = timezone.make_aware(datetime.combine(timezone.localdate(), dtime(12, 0)))
+        self.mio = Administracion.objects.create(orden=self.orden, residente=self.orden.receta.residente,
+                                                 programada_para=mediodia)
+        self.ajeno = Administracion.objects.create(orden=self.orden, residente=otro,
+                                                   programada_para=mediodia + timedelta(minutes=1))
+        self.cuidadora = User.objects.create_user("cami", password="clave-segura-1")
+        self.cuidadora.groups.add(Group.objects.create(name="CUIDADORA"))
+        Asignacion.objects.create(fecha=timezone.localdate(), cuidadora=self.cuidadora, residente=self.mio.residente)
+
+    def _token(self):
+        resp = self.client.post(reverse("api_token"), {"username": "cami", "password": "clave-segura-1"})
+        self.assertEqual(resp.status_code, 201)
+        return {"HTTP_AUTHORIZATION": f"Token {resp.json()['token']}"}
+
+    def test_token(self):
+        resp = self.client.post(reverse("api_token"), {"username": "cami", "password": "otra"})
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(self.client.get(reverse("api_tablero")).status_code, 401)
+
+        auth = self._token()
+        self.assertEqual(self.client.get(reverse("api_tablero"), **auth).status_code, 200)
+        self.assertEqual(self.client.delete(reverse("api_token"), **auth).status_code, 204)
+        self.assertEqual(self.client.get(reverse("api_tablero"), **auth).status_code, 401)
+
+    def test_revocar_desde_otro_proceso(self):
+        from .models import TokenApi
+
+        # Otro proceso (admin, otro worker) escribe directo en la base: vale en el acto
+        auth = self._token()
+        self.assertEqual(self.client.get(reverse("api_tablero"), **auth).status_code, 200)
+        TokenApi.objects.update(activo=False)
+        self.assertEqual(self.client.get(reverse("api_tablero"), **auth).status_code, 401)
+
+        auth = self._token()
+        self.assertEqual(self.client.get(reverse("api_tablero"), **auth).status_code, 200)
+        User.objects.filter(pk=self.cuidadora.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse("api_tablero"), **auth).status_code, 401)
+
+    def test_tablero_y_cambios(self):
+        from .stock import mover_stock
+
+        auth = self._token()
+        resp = self.client.get(reverse("api_tablero"), **auth)
+        datos = resp.json()
+        self.assertTrue(datos["completo"])
+        self.assertEqual([a["id"] for a in datos["administraciones"]], [self.mio.pk])  # solo su asignado
+        self.assertEqual(datos["ordenes"][0]["stock_asignado"], 10)
+
+        # Sin cambios: 304 con el ETag, o un delta vacío
+        resp = self.client.get(reverse("api_tablero"), {"desde": datos["version"]},
+                               HTTP_IF_NONE_MATCH=resp["ETag"], **auth)
+        self.assertEqual(resp.status_code, 304)
+        with self.assertNumQueries(4):  # token y versión (asentado, primer y último id); los roles, de memoria
+            resp = self.client.get(reverse("api_tablero"), {"desde": datos["version"]}, **auth)
+        self.assertEqual(resp.json()["administraciones"], [])
+
+        self.mio.estado = "DADA"
+        self.mio.save(update_fields=["estado"])
+        mover_stock(self.orden.pk, -1, "CONSUMO", administracion=self.mio)
+        self.ajeno.estado = "OMITIDA"
+        self.ajeno.save(update_fields=["estado"])
+        delta = self.client.get(reverse("api_tablero"), {"desde": datos["version"]}, **auth).json()
+        self.assertFalse(delta["completo"])
+        self.assertEqual([(a["id"], a["estado"]) for a in delta["administraciones"]], [(self.mio.pk, "DADA")])
+        self.assertEqual([o["stock_asignado"] for o in delta["ordenes"]], [9])
+        self.assertGreater(delta["version"], datos["version"])
+
+        pk = self.mio.pk
+        self.mio.delete()
+        delta = self.client.get(reverse("api_tablero"), {"desde": delta["version"]}, **auth).json()
+        self.assertEqual(delta["borrados"]["administraciones"], [pk])
+
+    def test_margen_manda_lo_nuevo_y_no_salta_lo_que_confirma_tarde(self):
+        from .models import CambioSync
+
+        auth = self._token()
+        CambioSync.objects.update(creado_en=timezone.now() - timedelta(minutes=5))
+        with self.settings(SIFA_SYNC_MARGEN=60):
+            v0 = self.client.get(reverse("api_tablero"), **auth).json()["version"]
+            self.mio.estado = "DADA"
+            self.mio.save(update_fields=["estado"])
+            self.mio.estado = "OMITIDA"
+            self.mio.save(update_fields=["estado"])
+            lento = CambioSync.objects.order_by("-pk")[1]
+            pk = lento.pk
+            lento.delete()   # su transacción sigue abierta: el id es menor que el último
+
+            delta = self.client.get(reverse("api_tablero"), {"desde": v0}, **auth).json()
+            self.assertEqual([a["estado"] for a in delta["administraciones"]], ["OMITIDA"])  # sin esperar
+            self.assertEqual(delta["version"], v0)                   # pero la versión no pasa el margen
+            lento.pk = pk
+            lento.save(force_insert=True)
+            delta = self.client.get(reverse("api_tablero"), {"desde": delta["version"]}, **auth).json()
+            self.assertEqual([a["id"] for a in delta["administraciones"]], [self.mio.pk])
+            self.assertLess(delta["version"], pk)                   # se repite hasta pasar el margen
+
+
+class SugerenciasCacheTests(TestCase):
+
+    def setUp(self):
+        from . import sugerencias
+        self.sug = sugerencias
+        sugerencias.limpiar_cache()
+        self.addCleanup(sugerencias.limpiar_cache)
+        for c in sugerencias.circuitos.values():
+            c.reiniciar()
+            self.addCleanup(c.reiniciar)
+
+    def test_niveles_y_cache_negativo(self):
+        llamadas = []
+
+        def cima(q, limit, timeout):
+            llamadas.append(q)
+            return [] if q == "zzz" else [{"id": "cima:1", "label": "PARACETAMOL 500", "source": "cima"}]
+
+        with mock.patch.dict(self.sug.PROVEEDORES, {"cima": cima}):
+            self.sug.sugerir("cima", "Paracetamól", 10, 1)
+            self.sug.sugerir("cima", " paracetamol ", 10, 1)      # misma clave normalizada
+            self.assertEqual(len(llamadas), 1)
+
+            self.sug._lru.clear()                                   # "reinicio": queda la tabla
+            self.assertEqual(self.sug.sugerir("cima", "PARACETAMOL", 10, 1)[0]["id"], "cima:1")
+            self.assertEqual(len(llamadas), 1)
+
+            self.assertEqual(self.sug.sugerir("cima", "zzz", 10, 1), [])
+            self.assertEqual(self.sug.sugerir("cima", "zzz", 10, 1), [])
+            self.assertEqual(len(llamadas), 2)
+            vacia = SugerenciaExterna.objects.get(clave="10:zzz")
+            self.assertLess(vacia.expira_en, timezone.now() + timedelta(hours=1))
+
+    def test_error_no_se_cachea_y_single_flight(self):
+        from .sugerencias import ErrorProveedor
+
+        def falla(q, limit, timeout):
+            raise ErrorProveedor("HTTP 503")
+
+        with mock.patch.dict(self.sug.PROVEEDORES, {"rxnorm": falla}):
+            self.assertEqual(self.sug.sugerir("rxnorm", "ibuprofeno", 10, 1), [])
+        self.assertFalse(SugerenciaExterna.objects.exists())
+
+        soltar, llamadas = threading.Event(), []
+
+        def lento(q, limit, timeout):
+            llamadas.append(q)
+            soltar.wait(5)
+            return [{"id": "rxnorm:1", "label": "ibuprofen", "source": "rxnorm"}]
+
+        resultados = []
+        with mock.patch.dict(self.sug.PROVEEDORES, {"rxnorm": lento}), \
+                mock.patch.object(self.sug, "_leer_persistente", return_value=None), \
+                mock.patch.object(self.sug, "_guardar_persistente"):
+            hilos = [threading.Thread(target=lambda: resultados.append(
+                self.sug.sugerir("rxnorm", "ibuprofeno", 10, 2))) for _ in range(4)]
+            for h in hilos:
+                h.start()
+            while not llamadas:
+                soltar.wait(0.01)
+            soltar.set()
+            for h in hilos:
+                h.join()
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual([r[0]["id"] for r in resultados], ["rxnorm:1"] * 4)
+
+    @override_settings(DRUG_SUGGEST_PROVIDER="HYBRID", DRUG_SUGGEST_DEADLINE=0.3)
+    def test_api_en_paralelo_con_plazo(self):
+        import time
+
+        Producto.objects.create(nombre="Ibuprofeno", potencia="400 mg")
+        soltar = threading.Event()
+        self.addCleanup(soltar.set)
+
+        def cima(q, limit, timeout):
+            soltar.wait(5)  # más lento que el plazo
+            return [{"id": "cima:1", "label": "IBUPROFENO CINFA", "source": "cima"}]
+
+        def rxnorm(q, limit, timeout):
+            return [{"id": "rxnorm:1", "label": "ibuprofen 200 MG", "source": "rxnorm"}]
+
+        self.client.force_login(User.objects.create_user("doc"))
+        with mock.patch.dict(self.sug.PROVEEDORES, {"cima": cima, "rxnorm": rxnorm}), \
+                mock.patch.object(self.sug, "_leer_persistente", return_value=None), \
+                mock.patch.object(self.sug, "_guardar_persistente"):
+            t0 = time.monotonic()
+            data = self.client.get(reverse("api_productos_suggest"), {"q": "ibupro"}).json()
+            self.assertLess(time.monotonic() - t0, 2)
+            soltar.set()
+
+        self.assertEqual([r["source"] for r in data["results"]], ["local", "rxnorm"])
+        prov = data["meta"]["providers"]
+        self.assertEqual((prov["cima"]["estado"], prov["rxnorm"]["estado"]), ("timeout", "api"))
+        self.assertEqual(prov["local"]["n"], 1)
+
+
+    @override_settings(SIFA_CIRCUITO_FALLOS=2, SIFA_CIRCUITO_ESPERA=0.2)
+    def test_circuito_abre_sondea_y_cierra(self):
+        import time
+        from .sugerencias import ErrorProveedor
+
+        caido, llamadas = [True], []
+
+        def cima(q, limit, timeout):
+            llamadas.append(q)
+            if caido[0]:
+                raise ErrorProveedor("HTTP 503")
+            return [{"id": "cima:1", "label": q.upper(), "source": "cima"}]
+
+        circuito = self.sug.circuitos["cima"]
+        circuito.reiniciar()
+        with mock.patch.dict(self.sug.PROVEEDORES, {"cima": cima}):
+            for q in ("a1", "a2", "a3", "a4"):
+                self.sug.sugerir("cima", q, 10, 1)
+            self.assertEqual(llamadas, ["a1", "a2"])          # abierto: a3 y a4 no llaman
+            self.assertEqual(circuito.resumen()["estado"], "abierto")
+            self.assertEqual(circuito.resumen()["rechazadas"], 2)
+
+            time.sleep(0.25)
+            self.sug.sugerir("cima", "b1", 10, 1)              # prueba (semiabierto) falla
+            self.assertEqual(circuito.estado, "abierto")
+            self.assertEqual(circuito.espera, 0.4)
+
+            caido[0] = False
+            time.sleep(0.45)
+            self.assertEqual(self.sug.sugerir("cima", "c1", 10, 1)[0]["label"], "C1")
+            self.assertEqual(circuito.estado, "cerrado")
+
+        admin = User.objects.create_user("jefa")
+        from django.contrib.auth.models import Group
+        admin.groups.add(Group.objects.create(name="ADMIN"))
+        self.client.force_login(admin)
+        data = self.client.get(reverse("proveedores_salud"), HTTP_ACCEPT="application/json").json()
+        cima_salud = next(p for p in data["proveedores"] if p["proveedor"] == "cima")
+        self.assertEqual((cima_salud["llamadas"], cima_salud["errores"], cima_salud["aperturas"]), (4, 3, 2))
+        self.assertEqual(self.client.get(reverse("proveedores_salud")).status_code, 200)
+
+    def test_pool_saturado_omite_sin_encolar(self):
+        llamadas = []
+
+        def cima(q, limit, timeout):
+            llamadas.append(q)
+            return [{"id": "cima:1", "label": "PARACETAMOL", "source": "cima"}]
+
+        self.sug._executor()
+        cupos = threading.BoundedSemaphore(1)
+        cupos.acquire()                         # el único hilo está ocupado
+        with mock.patch.dict(self.sug.PROVEEDORES, {"cima": cima}), \
+                mock.patch.object(self.sug, "_cupos", cupos), \
+                mock.patch.object(self.sug, "_leer_persistente", return_value=None), \
+                mock.patch.object(self.sug, "_guardar_persistente"):
+            (_, resultados, info), = self.sug.sugerir_en_paralelo(["cima"], "para", 10, 1, 1)
+            self.assertEqual((resultados, info["estado"]), ([], "omitido"))
+            self.assertEqual(llamadas, [])
+
+            self.sug._lru.put(("cima", "10:para"), [{"id": "cima:1"}], 60)   # lo que ya está en memoria sí
+            (_, resultados, info), = self.sug.sugerir_en_paralelo(["cima"], "para", 10, 1, 1)
+            self.assertEqual((resultados, info["estado"]), ([{"id": "cima:1"}], "memoria"))
+
+            cupos.release()
+            (_, resultados, info), = self.sug.sugerir_en_paralelo(["cima"], "ibu", 10, 1, 1)
+            self.assertEqual((info["estado"], llamadas), ("api", ["ibu"]))
+        self.assertTrue(cupos.acquire(timeout=1))   # el cupo se devuelve al terminar
+
+    def test_cima_un_solo_plazo_para_las_dos_llamadas(self):
+        from .sugerencias import ErrorProveedor, buscar_cima
+        plazos, reloj = [], [100.0]
+
+        def get(url, params, timeout):
+            plazos.append(timeout)
+            reloj[0] += 0.7                     # cada llamada tarda 0,7 s
+            return {"resultados": []} if url.endswith("medicamentos") else []
+
+        with mock.patch.object(self.sug, "_get", get), \
+                mock.patch.object(self.sug, "monotonic", lambda: reloj[0]):
+            self.assertEqual(buscar_cima("zzz", 10, 1), [])
+            self.assertEqual(plazos[0], 1)
+            self.assertAlmostEqual(plazos[1], 0.3)
+            with self.assertRaises(ErrorProveedor):
+                buscar_cima("zzz", 10, 0.5)     # /medicamentos se comió todo el plazo
+
+    def test_cima_caido_no_se_cachea_como_vacio(self):
+        import requests
+        from .sugerencias import ErrorProveedor, buscar_cima
+
+        def get(url, params, timeout):
+            if url.endswith("medicamentos"):
+                raise requests.ConnectionError("sin red")
+            return []
+
+        with mock.patch.object(self.sug, "_get", get):
+            with self.assertRaises(ErrorProveedor):
+                buscar_cima("amoxi", 10, 1)
+            with mock.patch.dict(self.sug.PROVEEDORES, {"cima": buscar_cima}):
+                self.assertEqual(self.sug.sugerir("cima", "amoxi", 10, 1), [])
+        self.assertFalse(SugerenciaExterna.objects.exists())
+        self.assertEqual(self.sug.circuitos["cima"].resumen()["errores"], 1)
+
+        # /medicamentos caído pero /vmpp responde: sirve el fallback
+        with mock.patch.object(self.sug, "_get", lambda url, params, timeout: (
+                get(url, params, timeout) if url.endswith("medicamentos") else [{"vmppDesc": "AMOXICILINA 500 MG", "id": 7}])):
+            self.assertEqual([r["id"] for r in buscar_cima("amoxi", 10, 1)], ["cima-vmpp:7"])
+
+
+class CatalogoImportTests(TestCase):
+
+    def test_upsert_incremental_y_sugerencia_local(self):
+        import io
+        import json
+        from .catalogo import importar, leer_filas
+        from .models import MedicamentoCatalogo
+        from .views import _suggest_local
+
+        dump = {"resultados": [
+            {"nregistro": "1", "nombre": "IBUPROFENO CINFA 400 mg COMPRIMIDOS", "labtitular": "Cinfa",
+             "formaFarmaceutica": {"id": 7, "nombre": "COMPRIMIDO RECUBIERTO"}, "dosis": "400 mg"},
+            {"nregistro": "2", "nombre": "IBUPROFENO KERN 600 mg", "dosis": "600 mg"},
+            {"nombre": "sin registro"},
+        ]}
+        res = importar(leer_filas(io.StringIO(json.dumps(dump))), "CIMA")
+        self.assertEqual((res.nuevos, res.descartados), (2, 1))
+
+        dump["resultados"][1]["dosis"] = "600 MG"
+        del dump["resultados"][0]
+        res = importar(leer_filas(io.StringIO(json.dumps(dump))), "CIMA", desactivar_faltantes=True)
+        self.assertEqual((res.nuevos, res.actualizados, res.desactivados), (0, 1, 1))
+
+        csv_rx = "rxcui;name;suppress\n5640;Ibuprofen 200 MG Oral Tablet;N\n"
+        self.assertEqual(importar(leer_filas(io.StringIO(csv_rx)), "RXNORM").nuevos, 1)
+        self.assertFalse(MedicamentoCatalogo.objects.get(registro="1").activo)
+
+        Producto.objects.create(nombre="Ibuprofeno", potencia="400 mg")
+        items = _suggest_local("ibupro", 10)
+        self.assertEqual([i["source"] for i in items], ["local", "catalogo", "catalogo"])
+        self.assertEqual(items[1]["label"], "Ibuprofen 200 MG Oral Tablet")
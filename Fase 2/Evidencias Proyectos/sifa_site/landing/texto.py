@@ -0,0 +1,50 @@
+# landing/texto.py
+"""
+Normalización de texto para búsquedas y claves de orden (sin modelos: lo
+importan models.py, migraciones y procesos hijos).
+
+Las claves normalizadas solo tienen [0-9a-z ] (y K en el RUT), así que una
+búsqueda por prefijo se puede hacer con un rango [prefijo, siguiente_prefijo)
+que usa el índice en cualquier base.
+"""
+import re
+import unicodedata
+
+_NO_ALNUM = re.compile(r"[^a-z0-9]+")
+_NO_RUT = re.compile(r"[^0-9K]")
+_ALFABETO = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def plegar(texto):
+    """Minúsculas y sin tildes ni diéresis: ‘Amoxicilína Ñ’ → ‘amoxicilina n’."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def normalizar(texto):
+    """plegar() y además solo letras/dígitos separados por un espacio."""
+    return _NO_ALNUM.sub(" ", plegar(texto)).strip()
+
+
+def normalizar_rut(rut):
+    """Solo dígitos y dígito verificador, sin ceros a la izquierda: ‘12.345.678-k’ → ‘12345678K’."""
+    return _NO_RUT.sub("", (rut or "").upper()).lstrip("0")
+
+
+def siguiente_prefijo(prefijo):
+    """Menor cadena mayor que todas las que empiezan con `prefijo` (o None)."""
+    while prefijo:
+        i = _ALFABETO.find(prefijo[-1])
+        if 0 <= i < len(_ALFABETO) - 1:
+            return prefijo[:-1] + _ALFABETO[i + 1]
+        prefijo = prefijo[:-1]
+    return None
+
+
+def rango_prefijo(campo, prefijo):
+    """kwargs de filter() para `campo` empieza con `prefijo`, como rango (usa el índice)."""
+    filtro = {f"{campo}__gte": prefijo}
+    fin = siguiente_prefijo(prefijo)
+    if fin:
+        filtro[f"{campo}__lt"] = fin
+    return filtro
@@ -0,0 +1,69 @@
+# landing/tokens.py
+"""
+Tokens de la API para la app Android: cabecera "Authorization: Token <clave>".
+
+La clave se entrega una sola vez (views.api_token) y en la base solo queda su
+sha256. Cada request busca el token con su usuario en una sola consulta (por
+índice único), sin cache: revocar el token o desactivar al usuario vale en el
+acto para todos los procesos.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+from functools import wraps
+
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from .models import TokenApi
+
+USO_CADA = timedelta(hours=1)   # usado_en se actualiza a lo más una vez por hora
+
+
+def _hash(clave):
+    return hashlib.sha256(clave.encode()).hexdigest()
+
+
+def emitir(usuario, nombre=""):
+    """Crea un token para `usuario` y devuelve la clave (no se puede volver a leer)."""
+    clave = secrets.token_urlsafe(32)
+    TokenApi.objects.create(usuario=usuario, clave=_hash(clave), nombre=nombre[:80])
+    return clave
+
+
+def revocar(clave):
+    return TokenApi.objects.filter(clave=_hash(clave), activo=True).update(activo=False)
+
+
+def usuario_de(clave):
+    """Usuario activo dueño de `clave`, o None."""
+    if not clave:
+        return None
+    token = (TokenApi.objects.select_related("usuario")
+             .filter(clave=_hash(clave), activo=True, usuario__is_active=True).first())
+    if token is None:
+        return None
+    ahora = timezone.now()
+    if token.usado_en is None or token.usado_en < ahora - USO_CADA:
+        TokenApi.objects.filter(pk=token.pk).update(usado_en=ahora)
+    return token.usuario
+
+
+def clave_de(request):
+    tipo, _, clave = (request.headers.get("Authorization") or "").partition(" ")
+    return clave.strip() if tipo.lower() == "token" else ""
+
+
+def token_requerido(view):
+    """Autentica con el token (sin sesión ni CSRF); 401 en JSON si falta o no vale."""
+    @wraps(view)
+    def _w(request, *a, **kw):
+        user = usuario_de(clave_de(request))
+        if user is None:
+            resp = JsonResponse({"error": "Token inválido o ausente."}, status=401)
+            resp["WWW-Authenticate"] = "Token"
+            return resp
+        request.user = user
+        return view(request, *a, **kw)
+    return csrf_exempt(_w)
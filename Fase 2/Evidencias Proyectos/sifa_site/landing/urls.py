@@ -19,12 +19,14 @@ urlpatterns = [
     path('orden/<int:orden_id>/restock/', views.orden_restock, name='orden_restock'),
 
     path('administracion/', views.admin_list_hoy, name='admin_list_hoy'),
+    path('administracion/eventos/', views.admin_hoy_eventos, name='admin_hoy_eventos'),
     path('administracion/quick/<int:admin_id>/', views.admin_marcar_rapido, name='admin_marcar_rapido'),
     path('administracion/grupo/', views.admin_marcar_grupo, name='admin_marcar_grupo'),
     path('administracion/marcar/<int:admin_id>/', views.admin_marcar, name='admin_marcar'),
 
     path('registro/<int:residente_id>/', views.registro_mensual, name='registro_mensual'),
     path('residentes/<int:residente_id>/registro-mensual/pdf/', views.registro_mensual_pdf, name='registro_mensual_pdf'),
+    path('registro/pdf/<str:clave>/estado/', views.registro_mensual_pdf_estado, name='registro_mensual_pdf_estado'),
 
 
     path("auth/logout/", LogoutView.as_view(next_page="home_public"), name="logout"),
@@ -32,13 +34,18 @@ urlpatterns = [
     path('residentes/<int:residente_id>/eliminar/', views.residente_delete, name='residente_delete'),
 
     path('api/productos/suggest/', views.api_productos_suggest, name='api_productos_suggest'),
+    path('api/v1/token/', views.api_token, name='api_token'),
+    path('api/v1/tablero/', views.api_tablero, name='api_tablero'),
 
     path("asignaciones/", views.asignaciones_hoy, name="asignaciones_hoy"),
     path("asignaciones/generar/", views.asignaciones_generar, name="asignaciones_generar"),
     path("asignaciones/toggle/", views.asignaciones_toggle_modo, name="asignaciones_toggle_modo"),
     path("asignaciones/limpiar/", views.asignaciones_limpiar, name="asignaciones_limpiar"),
 
-    # path("residentes/<int:pk>/registro-mensual-todos/", views.registro_mensual_todos, name="registro_mensual_todos"),
+    path("registro/todos/", views.registro_mensual_todos, name="registro_mensual_todos"),
+    path("registro/exportar/", views.registro_exportar, name="registro_exportar"),
+    path("registro/exportar/<int:exportacion_id>/", views.registro_exportacion, name="registro_exportacion"),
+    path("historial/csv/", views.historial_csv, name="historial_csv"),
 
 
     # CRUD usuarios
@@ -53,6 +60,7 @@ urlpatterns = [
     path("medicamentos/nuevo/", views.medicamento_create, name="medicamento_create"),
     path("medicamentos/<int:producto_id>/editar/", views.medicamento_edit, name="medicamento_edit"),
     path("medicamentos/<int:producto_id>/eliminar/", views.medicamento_delete, name="medicamento_delete"),
+    path("medicamentos/proveedores/", views.proveedores_salud, name="proveedores_salud"),
 
     # MANDAR MENSAJE
     path("asignaciones/avisar-meds/", views.asignaciones_avisar_meds, name="asignaciones_avisar_meds"),
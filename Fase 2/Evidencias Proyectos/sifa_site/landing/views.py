@@ -1,22 +1,46 @@
 # landing/views.py
 from collections import defaultdict
+from itertools import chain
 from calendar import monthrange
-from datetime import datetime, time as dtime
+from datetime import datetime, time as dtime, timedelta
+import re
+from urllib.parse import urlencode
 
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib import messages
-from django.contrib.auth import logout
+from django.contrib.auth import authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
-from django.db.models import Q, Prefetch, F
-from django.http import JsonResponse
+from django.db.models import (
+    Case, Exists, F, IntegerField, OuterRef, Prefetch, ProtectedError, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Lower
+from django.core.paginator import Paginator
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.core.cache import cache
-from .notifications import send_telegram_message
+from .notifications import encolar_mensaje, registrar_alerta_stock
+from . import contadores, sincronizacion, tablero
+from .agenda import materializar_eventos, podar_pendientes
+from .registro import grilla_mes_con_hash, grillas_todos, rango_mes
+from .historial import historial, lineas_csv
+from .paginacion import pagina_keyset
+from .tokens import clave_de, emitir, revocar, token_requerido
+from .texto import normalizar, normalizar_rut, rango_prefijo
+from .busqueda import buscar_catalogo, buscar_productos, filtrar_por_nombre
+from .sugerencias import circuitos, salud, sugerir_en_paralelo
+from .stock import (
+    corregir_stock, delta_por_transicion, mover_stock, mover_stock_por_eventos,
+    registrar_ajuste, registrar_stock_inicial,
+)
+import os
 import random
+import time
 from django.contrib.auth.models import User
 from django.views.decorators.http import require_http_methods
 from .models import Asignacion, DiaAsignacion
@@ -25,7 +49,8 @@ from django.db.models import Count
 # arriba en views.py
 from .roles import (
     admin_required, cuidadora_or_admin_required, tens_or_admin_required, staff_view_required,
-    is_cuidadora, is_tens, is_admin, doctor_or_admin_required, doctor_tens_or_admin_required,
+    is_cuidadora, is_tens, is_admin, is_doctor, doctor_or_admin_required, doctor_tens_or_admin_required,
+    roles_de,
     CUIDADORA_GROUP,
     TENS_GROUP
 
@@ -41,29 +66,19 @@ def _local_day_bounds(d):
     fin    = timezone.make_aware(datetime.combine(d, dtime.max), tz)
     return inicio, fin
 
-from django.http import HttpResponse
-from django.template.loader import render_to_string
-try:
-    from weasyprint import HTML, CSS
-    _weasy_available = True
-except Exception:
-    _weasy_available = False
+from django.http import FileResponse, HttpResponse
+from django.template.loader import get_template, render_to_string
+from .pdfs import _weasy_available, exportaciones_pendientes, lanzar_exportacion, nombre_archivo, solicitar_pdf
 
 from .models import (
-    Administracion, HoraProgramada, OrdenMedicamento, Receta, Residente, Producto
+    Administracion, ExportacionRegistros, HoraProgramada, MovimientoStock, OrdenMedicamento,
+    Receta, Residente, Producto, SugerenciaExterna, TrabajoPDF
 )
 from .forms import (
     AdminMarcarForm, OrdenMedicamentoForm, ProductoQuickForm,
     RecetaForm, ResidenteForm
 )
 
-# --------- imports opcionales para APIs externas ---------
-try:
-    import requests  # usado por CIMA/RxNorm; si falta, la API externa se omite
-except Exception:
-    requests = None
-
-
 # =========================================================
 # Helpers
 # =========================================================
@@ -107,59 +122,76 @@ def _short_user(u):
     name = (u.get_full_name() or u.username).strip()
     return name.split()[0] if name else u.username
 
-def _ajustar_stock_por_transicion(evento, old, new):
+def _ajustar_stock_por_transicion(evento, old, new, usuario=None):
     """
     DADA y RECHAZADA consumen 1 del stock_asignado.
     - Si pasa de NO consumir → consumir (DADA/RECHAZADA) => stock - 1
     - Si pasa de consumir (DADA/RECHAZADA) → NO consumir => stock + 1
+    El cambio va al libro de movimientos con un UPDATE atómico (landing.stock).
     """
-    orden = evento.orden
-
-    if not hasattr(orden, 'stock_asignado'):
+    d = delta_por_transicion(old, new)
+    if not d:
         return
+    mover_stock(
+        evento.orden_id, d,
+        MovimientoStock.Tipo.CONSUMO if d < 0 else MovimientoStock.Tipo.DEVOLUCION,
+        usuario=usuario, administracion=evento,
+    )
+    _check_alerta_stock([evento.orden_id])
 
-    def consume(estado):
-        return estado in ('DADA', 'RECHAZADA')
-
-    # Entrar a estado que consume
-    if not consume(old) and consume(new):
-        if (orden.stock_asignado or 0) > 0:
-            orden.stock_asignado -= 1
-            orden.save(update_fields=['stock_asignado'])
 
-    # Salir de estado que consume
-    elif consume(old) and not consume(new):
-        orden.stock_asignado = (orden.stock_asignado or 0) + 1
-        orden.save(update_fields=['stock_asignado'])
+def _marcar_en_bloque(eventos_qs, new, user):
+    """
+    Versión en bloque de marcar + _ajustar_stock_por_transicion:
+    un UPDATE para el estado, un INSERT para el libro de stock, un UPDATE de
+    stock por orden afectada, los contadores por hora y los registros del
+    tablero en vivo y de la API. Devuelve cuántos eventos se marcaron.
+    """
+    with transaction.atomic():
+        filas = list(eventos_qs.select_for_update().values_list(
+            'id', 'orden_id', 'estado', 'residente_id', 'programada_para'
+        ))
+        if not filas:
+            return 0
+        Administracion.objects.filter(pk__in=[f[0] for f in filas]).update(
+            estado=new, realizada_por=user
+        )
+        deltas = mover_stock_por_eventos([f[:3] for f in filas], new, usuario=user)
+        contadores.transicion([(f[3], f[4], f[2]) for f in filas], new)
+        tablero.publicar([(f[0], f[3], new, user.pk) for f in filas])
+        sincronizacion.registrar_eventos([(f[0], f[4]) for f in filas])
 
-    _check_alerta_stock(orden)
+    if deltas:
+        _check_alerta_stock(deltas.keys())
+    return len(filas)
 
 
-def _check_alerta_stock(orden):
+def _check_alerta_stock(orden_ids):
     """
-    Si stock_asignado <= stock_critico y no se ha avisado, envía Telegram y marca alerta_enviada=True.
+    Si stock_asignado <= stock_critico y no se ha avisado, registra el aviso de Telegram y marca alerta_enviada=True.
     Si sale de crítico (> stock_critico) y estaba marcada, resetea alerta_enviada=False.
+    Trabaja sobre el flag stock_en_critico; el UPDATE condicional evita que dos
+    marcados simultáneos avisen dos veces.
     """
+    ids = list(orden_ids)
     try:
-        critico = (orden.stock_asignado or 0) <= (orden.stock_critico or 0)
-        if critico and not orden.alerta_enviada:
-            res = orden.receta.residente
-            msg = (
-                "⚠️ <b>Stock crítico</b>\n"
-                f"👤 Residente: {res.nombre_completo}\n"
-                f"💊 Medicamento: {orden.producto} · {orden.dosis}\n"
-                f"📦 Stock: {orden.stock_asignado} (crítico {orden.stock_critico})"
-            )
-            ok = send_telegram_message(msg)
-            if ok:
-                orden.alerta_enviada = True
-                orden.save(update_fields=['alerta_enviada'])
-        elif not critico and orden.alerta_enviada:
-            # se repone → listo para volver a avisar la próxima vez
-            orden.alerta_enviada = False
-            orden.save(update_fields=['alerta_enviada'])
+        # se repone → listo para volver a avisar la próxima vez
+        OrdenMedicamento.objects.filter(
+            pk__in=ids, stock_en_critico=False, alerta_enviada=True
+        ).update(alerta_enviada=False)
+
+        pendientes = (
+            OrdenMedicamento.objects
+            .select_related('receta__residente', 'producto')
+            .filter(pk__in=ids, stock_en_critico=True, alerta_enviada=False)
+        )
+        for orden in pendientes:
+            if not OrdenMedicamento.objects.filter(pk=orden.pk, alerta_enviada=False).update(alerta_enviada=True):
+                continue  # otro request ya avisó
+            # Outbox inmediato o resumen agrupado, según SIFA_ALERTAS_VENTANA
+            registrar_alerta_stock(orden)
     except Exception:
-        # No romper el flujo si hay un problema de red
+        # No romper el flujo del marcado por un aviso
         pass
 
 
@@ -176,13 +208,9 @@ def home_public(request):
 @login_required
 @staff_view_required
 def dashboard(request):
-    # Asegura que existan los eventos de hoy (idempotente)
-    _generar_eventos_hoy()
-
+    # Los eventos de hoy los genera landing.agenda (comando materializar_agenda)
+    # Los totales salen de landing.contadores (no se cuentan eventos)
     hoy = timezone.localdate()
-    inicio, fin = _local_day_bounds(hoy)
-
-    base_admins_qs = Administracion.objects.filter(programada_para__range=(inicio, fin))
 
     if is_cuidadora(request.user):
         res_ids = (
@@ -190,19 +218,23 @@ def dashboard(request):
             .filter(fecha=hoy, cuidadora=request.user)
             .values_list('residente_id', flat=True)
         )
-        admins_hoy = base_admins_qs.filter(residente_id__in=res_ids).count()
+        por_estado = contadores.totales(hoy, res_ids)
         criticos = None
     else:
-        admins_hoy = base_admins_qs.count()
+        por_estado = contadores.totales(hoy)
         criticos = (
             OrdenMedicamento.objects
             .select_related('receta__residente', 'producto')
-            .filter(activo=True, stock_asignado__lte=F('stock_critico'))
+            .filter(activo=True, stock_en_critico=True)
             .order_by('receta__residente__nombre_completo')
         )
 
+    admins_hoy = sum(por_estado.values())
+    pendientes = por_estado.get(Administracion.Estado.PENDIENTE, 0)
     return render(request, 'landing/dashboard.html', {
         'admins_hoy': admins_hoy,
+        'admins_hechas': admins_hoy - pendientes,
+        'admins_avance': round(100 * (admins_hoy - pendientes) / admins_hoy) if admins_hoy else 0,
         'criticos': criticos,
     })
 
@@ -218,9 +250,8 @@ def orden_restock(request, orden_id):
         except ValueError:
             sumar = 0
         if sumar > 0:
-            orden.stock_asignado = (orden.stock_asignado or 0) + sumar
-            orden.save(update_fields=['stock_asignado'])
-            _check_alerta_stock(orden)
+            mover_stock(orden.id, sumar, MovimientoStock.Tipo.REPOSICION, usuario=request.user)
+            _check_alerta_stock([orden.id])
             messages.success(request, f'Se añadieron {sumar} al stock de {orden}.')
         else:
             messages.error(request, 'Cantidad inválida.')
@@ -237,6 +268,25 @@ def logout_view(request):
 # Residentes
 # =========================================================
 
+RESIDENTES_POR_PAGINA = 30
+_PARECE_RUT = re.compile(r"^[\d.\s-]*\d[\d.\s-]*[kK]?$")
+
+
+def _filtrar_residentes(qs, q):
+    """
+    RUT (solo dígitos, puntos, guion y K): prefijo de rut_normalizado, con
+    cualquier formato. Nombre: cada palabra escrita debe ser el comienzo de
+    una palabra del nombre, sin tildes ni mayúsculas.
+    """
+    if _PARECE_RUT.match(q):
+        return qs.filter(**rango_prefijo("rut_normalizado", normalizar_rut(q)))
+    nq = normalizar(q)
+    if not nq:
+        return qs.none()
+    # Cada palabra es un rango sobre el índice de ResidentePalabra (landing.busqueda)
+    return filtrar_por_nombre(qs, nq)
+
+
 @login_required
 @doctor_tens_or_admin_required
 def residente_list(request):
@@ -249,10 +299,7 @@ def residente_list(request):
 
     # Búsqueda por nombre o RUT
     if q:
-        qs = qs.filter(
-            Q(nombre_completo__icontains=q) |
-            Q(rut__icontains=q)
-        )
+        qs = _filtrar_residentes(qs, q)
 
     # Filtro por sexo
     if sexo in ("M", "F", "O"):
@@ -265,14 +312,21 @@ def residente_list(request):
         qs = qs.filter(activo=False)
     # si estado == "" → no se filtra por activo (muestra activos + inactivos)
 
-    qs = qs.order_by("nombre_completo")
+    # Páginas por (nombre_clave, id): sin OFFSET ni count() de toda la tabla
+    pagina = pagina_keyset(
+        qs, ("nombre_clave", "id"),
+        tras=request.GET.get("tras"), antes=request.GET.get("antes"),
+        tam=RESIDENTES_POR_PAGINA,
+    )
+    filtros = {k: v for k, v in (("q", q), ("sexo", sexo), ("estado", estado)) if v}
 
     return render(request, "residentes/residentes_list.html", {
-        "residentes": qs,
+        "residentes": pagina.items,
+        "pagina": pagina,
+        "filtros": urlencode(filtros),
         "q": q,
         "sexo": sexo,
         "estado": estado,      # 👈 IMPORTANTE para que el select quede marcado
-        "total": qs.count(),
     })
 
 @login_required
@@ -335,11 +389,9 @@ def residente_detail(request, residente_id):
             if stock_asignado < 0 or stock_critico < 0:
                 messages.error(request, "El stock no puede ser negativo.")
             else:
-                orden.stock_asignado = stock_asignado
-                orden.stock_critico  = stock_critico
-                orden.save(update_fields=["stock_asignado", "stock_critico"])
+                corregir_stock(orden, stock_asignado, stock_critico, usuario=request.user)
                 # reutilizamos la lógica de alerta
-                _check_alerta_stock(orden)
+                _check_alerta_stock([orden.id])
                 messages.success(
                     request,
                     f'Se actualizó el stock de "{orden.producto.nombre}".'
@@ -439,7 +491,8 @@ def receta_create(request, residente_id):
                 orden.receta = receta
                 orden.producto = producto
                 orden.save()
-                _check_alerta_stock(orden)
+                registrar_stock_inicial(orden, usuario=request.user)
+                _check_alerta_stock([orden.id])
 
                 # Horas
                 for item in horas_data:
@@ -469,7 +522,17 @@ def receta_delete(request, receta_id):
     receta = get_object_or_404(Receta, pk=receta_id)
     res_id = receta.residente_id
     if request.method == 'POST':
-        receta.delete()
+        with transaction.atomic():
+            podar_pendientes(receta.ordenes.values_list('id', flat=True))
+            try:
+                with transaction.atomic():
+                    receta.delete()
+            except ProtectedError:
+                # Ya tiene administraciones registradas: se conserva el historial
+                receta.activa = False
+                receta.save(update_fields=['activa'])
+                messages.info(request, 'La receta tiene administraciones registradas; se marcó como inactiva.')
+                return redirect('residente_detail', residente_id=res_id)
         messages.success(request, 'Receta eliminada.')
         return redirect('residente_detail', residente_id=res_id)
 
@@ -507,7 +570,8 @@ def orden_create(request, receta_id):
             orden.receta = receta
             orden.producto = producto
             orden.save()
-            _check_alerta_stock(orden)
+            registrar_stock_inicial(orden, usuario=request.user)
+            _check_alerta_stock([orden.id])
 
             for item in horas_data:
                 HoraProgramada.objects.create(
@@ -537,6 +601,7 @@ def orden_edit(request, orden_id):
     orden_form = OrdenMedicamentoForm(request.POST or None, instance=orden)
     producto_form = ProductoQuickForm(request.POST or None, prefix='prod')
 
+    stock_previo = orden.stock_asignado  # el form edita la instancia al validar
     horas_data = _parse_horas_from_post(request) if request.method == 'POST' else [
         {'hora': h.hora, 'dia': h.dia_semana} for h in orden.horas.all()
     ]
@@ -555,13 +620,17 @@ def orden_edit(request, orden_id):
             if creando_nuevo and not prod_sel:
                 orden.producto = producto_form.create_if_filled()
             orden = orden_form.save()
-
-            # Reemplazar horas
-            orden.horas.all().delete()
-            for item in horas_data:
-                HoraProgramada.objects.create(
-                    orden=orden, hora=item['hora'], dia_semana=item['dia']
-                )
+            registrar_ajuste(orden, stock_previo, usuario=request.user)
+            _check_alerta_stock([orden.id])
+
+            # Solo tocar las horas que cambiaron (las señales regeneran la agenda)
+            actuales = {(h.hora, h.dia_semana): h.pk for h in orden.horas.all()}
+            nuevas = {(item['hora'], item['dia']) for item in horas_data}
+            quitar = [pk for key, pk in actuales.items() if key not in nuevas]
+            if quitar:
+                HoraProgramada.objects.filter(pk__in=quitar).delete()
+            for hora, dia in nuevas - set(actuales):
+                HoraProgramada.objects.create(orden=orden, hora=hora, dia_semana=dia)
 
             messages.success(request, 'Medicamento actualizado.')
             return redirect('residente_detail', residente_id=orden.receta.residente_id)
@@ -585,7 +654,17 @@ def orden_delete(request, orden_id):
     orden = get_object_or_404(OrdenMedicamento, pk=orden_id)
     res_id = orden.receta.residente_id
     if request.method == 'POST':
-        orden.delete()
+        with transaction.atomic():
+            podar_pendientes([orden.id])
+            try:
+                with transaction.atomic():
+                    orden.delete()
+            except ProtectedError:
+                # Ya tiene administraciones registradas: se conserva el historial
+                orden.activo = False
+                orden.save(update_fields=['activo'])
+                messages.info(request, 'El medicamento tiene administraciones registradas; se marcó como inactivo.')
+                return redirect('residente_detail', residente_id=res_id)
         messages.success(request, 'Medicamento eliminado.')
         return redirect('residente_detail', residente_id=res_id)
     return render(request, 'residentes/confirm_delete.html', {
@@ -601,37 +680,9 @@ def orden_delete(request, orden_id):
 # Administración (Hoy)
 # =========================================================
 
-def _generar_eventos_hoy():
-    """Genera registros PENDIENTE para hoy (hora local) según recetas activas."""
-    hoy = timezone.localdate()
-    dia_sem = hoy.weekday()  # L=0..D=6 (¡asegúrate de que HoraProgramada usa el mismo mapping!)
-    tz = timezone.get_current_timezone()
-
-    recetas = (
-        Receta.objects.filter(activa=True, inicio__lte=hoy)
-        .filter(Q(fin__isnull=True) | Q(fin__gte=hoy))
-    )
-    ordenes = (
-        OrdenMedicamento.objects.filter(receta__in=recetas, activo=True)
-        .prefetch_related('horas', 'receta__residente')
-    )
-    for orden in ordenes:
-        for h in orden.horas.all():
-            if h.dia_semana is not None and h.dia_semana != dia_sem:
-                continue
-            dt_local = timezone.make_aware(datetime.combine(hoy, h.hora), tz)
-            Administracion.objects.get_or_create(
-                orden=orden,
-                residente=orden.receta.residente,
-                programada_para=dt_local,
-                defaults={'estado': Administracion.Estado.PENDIENTE},
-            )
-
-
 @login_required
 @staff_view_required
 def admin_list_hoy(request):
-    _generar_eventos_hoy()
     hoy = timezone.localdate()
     inicio, fin = _local_day_bounds(hoy)
 
@@ -659,6 +710,7 @@ def admin_list_hoy(request):
     )
 
     cuid_selected = None
+    alcance = None  # residentes cuyos contadores se suman (None = todos)
 
     if es_admin:
         cuid_list = (
@@ -683,35 +735,42 @@ def admin_list_hoy(request):
                              .values_list('residente_id', flat=True)
                 )
                 eventos_qs = eventos_qs.filter(residente_id__in=res_ids)
+                alcance = res_ids
                 cuid_selected = User.objects.filter(id=cuid_id).first()
     else:
         asigns_qs = asigns_qs.filter(cuidadora=user)
         res_ids = list(asigns_qs.values_list('residente_id', flat=True))
         eventos_qs = eventos_qs.filter(residente_id__in=res_ids)
+        alcance = res_ids
         cuid_list = []  # no se muestra a no-admin
 
     if q:
         eventos_qs = eventos_qs.filter(residente__nombre_completo__icontains=q)
+        por_nombre = Residente.objects.filter(nombre_completo__icontains=q)
+        if alcance is not None:
+            por_nombre = por_nombre.filter(pk__in=alcance)
+        alcance = por_nombre.values('pk')
 
-    # Agrupar por hora HH:MM (local)
-    from collections import defaultdict
-    buckets, counts = defaultdict(list), defaultdict(int)
-    for e in eventos_qs:
-        hhmm = timezone.localtime(e.programada_para).strftime("%H:%M")
-        buckets[hhmm].append(e)
-        counts[hhmm] += 1
-
-    def keyf(h): return (int(h[:2]), int(h[3:5]))
-    horas_sorted = sorted(counts.keys(), key=keyf)
+    # Chips por hora: (HH:MM, total, pendientes) desde landing.contadores
+    horas = contadores.por_hora(hoy, alcance)
 
+    # Con una hora elegida solo se cargan los eventos de ese minuto
+    t_sel = None
     if selected:
-        grupos = {selected: sorted(buckets.get(selected, []),
-                                   key=lambda x: x.residente.nombre_completo)}
-    else:
-        grupos = {h: sorted(buckets[h], key=lambda x: x.residente.nombre_completo)
-                  for h in horas_sorted}
-
-    horas = [(h, counts[h]) for h in horas_sorted]
+        try:
+            t_sel = datetime.strptime(selected, "%H:%M").time()
+        except ValueError:
+            selected = None
+    if t_sel is not None:
+        desde = timezone.make_aware(datetime.combine(hoy, t_sel), timezone.get_current_timezone())
+        eventos_qs = eventos_qs.filter(programada_para__gte=desde,
+                                       programada_para__lt=desde + timedelta(minutes=1))
+
+    # Agrupar por hora HH:MM (local); ya vienen en orden de hora y nombre
+    grupos = defaultdict(list)
+    for e in eventos_qs.order_by('programada_para', 'residente__nombre_completo'):
+        grupos[timezone.localtime(e.programada_para).strftime("%H:%M")].append(e)
+    grupos = dict(grupos) if not selected else {selected: grupos.get(selected, [])}
 
     return render(request, 'administracion/admin_hoy.html', {
         'grupos': grupos,
@@ -721,9 +780,37 @@ def admin_list_hoy(request):
         'q': q,
         'cuid_list': list(cuid_list),
         'cuid_selected': cuid_selected,
+        'tablero_desde': tablero.Cursor.actual(),   # el flujo en vivo sigue desde aquí
     })
 
 
+@login_required
+@staff_view_required
+def admin_hoy_eventos(request):
+    """
+    Flujo SSE con los cambios de estado de hoy que ve este usuario
+    (landing.tablero). Admin ve todo, o a una cuidadora con ?cuid=.
+    Con WSGI no se deja abierto: entrega lo pendiente y el navegador vuelve a preguntar.
+    """
+    hoy = timezone.localdate()
+    alcance = None
+    asigns = Asignacion.objects.filter(fecha=hoy)
+    if not is_admin(request.user):
+        alcance = set(asigns.filter(cuidadora=request.user).values_list('residente_id', flat=True))
+    elif (request.GET.get('cuid') or '').isdigit():
+        alcance = set(asigns.filter(cuidadora_id=int(request.GET['cuid'])).values_list('residente_id', flat=True))
+
+    # Al reconectar, el navegador manda el último id recibido (con los huecos que quedaban)
+    desde = request.headers.get('Last-Event-ID') or request.GET.get('desde') or ''
+    cursor = tablero.Cursor.desde_texto(desde) or tablero.Cursor.actual()
+
+    flujo = (tablero.flujo if isinstance(request, ASGIRequest) else tablero.sondeo_sync)(alcance, cursor)
+    resp = StreamingHttpResponse(flujo, content_type='text/event-stream')
+    resp['Cache-Control'] = 'no-cache'
+    resp['X-Accel-Buffering'] = 'no'   # nginx: no juntar el flujo en buffer
+    return resp
+
+
 @login_required
 def admin_marcar_rapido(request, admin_id):
     """Marca una administración con un clic y ajusta stock."""
@@ -738,8 +825,9 @@ def admin_marcar_rapido(request, admin_id):
     old = evento.estado
     evento.estado = new
     evento.realizada_por = request.user
-    evento.save(update_fields=['estado', 'realizada_por'])
-    _ajustar_stock_por_transicion(evento, old, new)
+    with transaction.atomic():  # estado, stock y contadores juntos
+        evento.save(update_fields=['estado', 'realizada_por'])
+        _ajustar_stock_por_transicion(evento, old, new, usuario=request.user)
 
     h = request.GET.get('h')
     url = reverse('admin_list_hoy') + (f'?h={h}' if h else '')
@@ -748,32 +836,45 @@ def admin_marcar_rapido(request, admin_id):
 @login_required
 @cuidadora_or_admin_required
 def admin_marcar_grupo(request):
-    """Marca todos los eventos de una hora (hoy) con el mismo estado; ajusta stock."""
+    """
+    Marca los eventos de una hora (hoy) con el mismo estado, en bloque.
+    - Solo alcanza a los residentes asignados si quien marca no es admin.
+    - Si llegan ids (name='ids'), solo marca ese subconjunto de la hora.
+    """
     if request.method != 'POST':
         return redirect('admin_list_hoy')
 
     hora = request.POST.get('hora')  # 'HH:MM'
     new = request.POST.get('estado')
-    if not hora or new not in ('DADA', 'OMITIDA', 'RECHAZADA', 'PENDIENTE'):
+    try:
+        hh, mm = (hora or '').split(':', 1)
+        t = dtime(int(hh), int(mm))
+    except (TypeError, ValueError):
+        t = None
+    if t is None or new not in ('DADA', 'OMITIDA', 'RECHAZADA', 'PENDIENTE'):
         messages.error(request, 'Datos inválidos.')
         return redirect('admin_list_hoy')
 
+    # Rango local [HH:MM, HH:MM+1min) → usa el índice (programada_para, residente)
     hoy = timezone.localdate()
-    eventos = (
-        Administracion.objects.select_related("residente", "orden")
-        .filter(programada_para__date=hoy)
+    desde = timezone.make_aware(datetime.combine(hoy, t), timezone.get_current_timezone())
+    eventos = Administracion.objects.filter(
+        programada_para__gte=desde,
+        programada_para__lt=desde + timedelta(minutes=1),
     )
 
-    updated = 0
-    for e in eventos:
-        hhmm = timezone.localtime(e.programada_para).strftime("%H:%M")
-        if hhmm == hora:
-            old = e.estado
-            e.estado = new
-            e.realizada_por = request.user
-            e.save(update_fields=['estado', 'realizada_por'])
-            _ajustar_stock_por_transicion(e, old, new)
-            updated += 1
+    if not is_admin(request.user):
+        eventos = eventos.filter(
+            residente_id__in=Asignacion.objects
+            .filter(fecha=hoy, cuidadora=request.user)
+            .values('residente_id')
+        )
+
+    ids = [x for x in request.POST.getlist('ids') if x.isdigit()]
+    if ids:
+        eventos = eventos.filter(pk__in=ids)
+
+    updated = _marcar_en_bloque(eventos, new, request.user)
 
     messages.success(request, f'{updated} registros marcados como {new.lower()}.')
     return redirect(reverse('admin_list_hoy') + f'?h={hora}')
@@ -788,8 +889,9 @@ def admin_marcar(request, admin_id):
     if request.method == 'POST' and form.is_valid():
         e = form.save(commit=False)
         e.realizada_por = request.user
-        e.save()
-        _ajustar_stock_por_transicion(e, old, e.estado)
+        with transaction.atomic():
+            e.save()
+            _ajustar_stock_por_transicion(e, old, e.estado, usuario=request.user)
         messages.success(request, 'Registro actualizado.')
         return redirect('admin_list_hoy')
     return render(request, 'administracion/admin_marcar.html', {'evento': evento, 'form': form})
@@ -801,6 +903,22 @@ def admin_marcar(request, admin_id):
 
 # helpers (colócalos cerca de tus otros helpers)
 from datetime import date
+import hashlib
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+
+def _etag_registro(request, res, snap_hash, *extra):
+    """
+    ETag de una página del registro de un mes cerrado: hash del snapshot +
+    ficha del residente + quién mira (la navbar depende del rol).
+    None si el mes sigue abierto (no hay snapshot).
+    """
+    if not snap_hash:
+        return None
+    partes = [snap_hash, res.nombre_completo, res.rut, str(res.fecha_nacimiento), res.sexo,
+              res.alergias or "", str(res.activo), str(request.user.pk),
+              ",".join(sorted(roles_de(request.user))), *map(str, extra)]
+    return '"%s"' % hashlib.sha256("|".join(partes).encode()).hexdigest()[:32]
 
 def _calc_edad(fn):
     if not fn:
@@ -824,6 +942,7 @@ def registro_mensual(request, residente_id):
     Una fila por (orden, hora local). En cada celda:
     ✓ (Ana), ✕ (Pedro), R (Luis) o • si está pendiente.
     Si hubiera más de un registro ese día para la misma fila, se concatena con '/'.
+    La grilla la arma landing.registro (la misma que usa el PDF).
     """
     # --- helper local para edad ---
     def _calc_edad(fn):
@@ -851,51 +970,12 @@ def registro_mensual(request, residente_id):
     if m < 1 or m > 12:
         m = hoy_local.month
 
-    days_in_month = monthrange(y, m)[1]
-
-    # Ventana de tiempo (aware)
-    inicio = timezone.make_aware(datetime(y, m, 1, 0, 0))
-    fin = timezone.make_aware(datetime(y, m, days_in_month, 23, 59))
-
-    # Eventos del mes del residente
-    eventos = (
-        Administracion.objects
-        .select_related("orden__producto", "realizada_por")
-        .filter(residente=res, programada_para__range=(inicio, fin))
-        .order_by("orden_id", "programada_para")
-    )
-
-    # key = (orden_id, HH:MM local) → una fila por hora específica
-    rows_map = {}
-    for e in eventos:
-        local_dt = timezone.localtime(e.programada_para)
-        hhmm_24 = local_dt.strftime("%H:%M")
-        label_hora = _fmt_ampm(e.programada_para)  # ya definida en tu archivo
-
-        prod = e.orden.producto
-        med_label = f"{prod.nombre} {prod.potencia}".strip()
-        orden_label = f"{med_label} · {e.orden.dosis} — {label_hora}"
-
-        key = (e.orden_id, hhmm_24)
-        if key not in rows_map:
-            rows_map[key] = {"label": orden_label, "cells": [""] * days_in_month}
-
-        sym = {"DADA": "✓", "OMITIDA": "✕", "RECHAZADA": "R", "PENDIENTE": "•"}[e.estado]
-        who = _short_user(e.realizada_por) if e.estado != 'PENDIENTE' and e.realizada_por else ''  # _short_user ya definida
-        mark = f"{sym}{f' ({who})' if who else ''}"
-
-        idx = local_dt.day - 1
-        rows_map[key]["cells"][idx] = (
-            rows_map[key]["cells"][idx] + " / " if rows_map[key]["cells"][idx] else ""
-        ) + mark
-
-    # Orden: por nombre de medicamento y hora
-    def sort_key(item):
-        (orden_id, hhmm), data = item
-        h, m_ = int(hhmm[:2]), int(hhmm[3:5])
-        return (data["label"].split(" — ")[0].lower(), h, m_)
-
-    rows = [v for _, v in sorted(rows_map.items(), key=sort_key)]
+    grilla, snap_hash = grilla_mes_con_hash(res, y, m)
+    etag = _etag_registro(request, res, snap_hash)
+    if etag:
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
 
     # Ficha del paciente para cabecera/impresión
     paciente = {
@@ -908,66 +988,69 @@ def registro_mensual(request, residente_id):
         "activo": res.activo,
     }
 
-    return render(request, 'residentes/registro_mensual.html', {
+    resp = render(request, 'residentes/registro_mensual.html', {
         'residente': res,
         'year': y,
         'month': m,
-        'days': range(1, days_in_month + 1),
-        'rows': rows,
+        'days': grilla.days,
+        'rows': grilla.filas,
+        'totales': grilla.totales,
         'paciente': paciente,   # <-- ficha para el template
     })
+    if etag:
+        resp['ETag'] = etag
+        patch_cache_control(resp, private=True, no_cache=True)  # revalidar siempre
+    return resp
 
 
 
-def _build_registro_mensual_ctx(res, y, m):
-    """
-    Copia 99% de la lógica de 'registro_mensual' para construir days/rows.
-    Así no duplicamos reglas sueltas, y la tabla del PDF queda idéntica.
-    """
-    days_in_month = monthrange(y, m)[1]
-    inicio = timezone.make_aware(datetime(y, m, 1, 0, 0))
-    fin = timezone.make_aware(datetime(y, m, days_in_month, 23, 59))
-
-    eventos = (
-        Administracion.objects
-        .select_related("orden__producto", "realizada_por")
-        .filter(residente=res, programada_para__range=(inicio, fin))
-        .order_by("orden_id", "programada_para")
-    )
-
-    rows_map = {}
-    for e in eventos:
-        local_dt = timezone.localtime(e.programada_para)
-        hhmm_24 = local_dt.strftime("%H:%M")
-        label_hora = _fmt_ampm(e.programada_para)
-
-        prod = e.orden.producto
-        med_label = f"{prod.nombre} {prod.potencia}".strip()
-        orden_label = f"{med_label} · {e.orden.dosis} — {label_hora}"
-
-        key = (e.orden_id, hhmm_24)
-        if key not in rows_map:
-            rows_map[key] = {"label": orden_label, "cells": [""] * days_in_month}
-
-        sym = {"DADA": "✓", "OMITIDA": "✕", "RECHAZADA": "R", "PENDIENTE": "•"}[e.estado]
-        who = _short_user(e.realizada_por) if e.estado != 'PENDIENTE' and e.realizada_por else ''
-        mark = f"{sym}{f' ({who})' if who else ''}"
+_MARCADOR_SECCIONES = "<!--secciones-registro-->"
 
-        idx = local_dt.day - 1
-        rows_map[key]["cells"][idx] = (rows_map[key]["cells"][idx] + " / " if rows_map[key]["cells"][idx] else "") + mark
 
-    def sort_key(item):
-        (orden_id, hhmm), data = item
-        h, mm = int(hhmm[:2]), int(hhmm[3:5])
-        return (data["label"].split(" — ")[0].lower(), h, mm)
+@login_required
+@doctor_tens_or_admin_required
+def registro_mensual_todos(request):
+    """
+    Registro mensual de TODOS los residentes en una sola página.
+    Los eventos del mes se leen en una sola consulta ordenada por residente
+    (landing.registro.grillas_todos) y cada sección se renderiza y se envía
+    apenas está lista (StreamingHttpResponse): la memoria no crece con la
+    cantidad de residentes.
+    """
+    hoy_local = timezone.localdate()
+    try:
+        y = int(request.GET.get('year', hoy_local.year))
+        m = int(request.GET.get('month', hoy_local.month))
+    except (TypeError, ValueError):
+        y, m = hoy_local.year, hoy_local.month
+    if y < 2000 or y > 2100 or m < 1 or m > 12:
+        y, m = hoy_local.year, hoy_local.month
 
-    rows = [v for _, v in sorted(rows_map.items(), key=sort_key)]
+    # Página completa con un marcador donde van las secciones
+    pagina = render_to_string('residentes/registro_mensual_todos.html', {
+        'year': y,
+        'month': m,
+        'desde': rango_mes(y, m)[0],
+        'hasta': rango_mes(y, m)[1],
+        'marcador_secciones': _MARCADOR_SECCIONES,
+    }, request=request)
+    cabeza, cola = pagina.split(_MARCADOR_SECCIONES, 1)
+    seccion = get_template('residentes/_registro_mensual_seccion.html')
+
+    def _stream():
+        yield cabeza
+        for res, grilla in grillas_todos(*rango_mes(y, m)):
+            yield seccion.render({
+                'residente': res,
+                'edad': _calc_edad(res.fecha_nacimiento),
+                'year': y,
+                'month': m,
+                'days': grilla.days,
+                'rows': grilla.filas,
+            })
+        yield cola
 
-    return {
-        "days": range(1, days_in_month + 1),
-        "rows": rows,
-        "days_in_month": days_in_month,
-    }
+    return StreamingHttpResponse(_stream(), content_type='text/html; charset=utf-8')
 
 
 # --- ADD: view PDF ---
@@ -975,7 +1058,9 @@ def _build_registro_mensual_ctx(res, y, m):
 @admin_required
 def registro_mensual_pdf(request, residente_id):
     """
-    Genera un PDF A4 apaisado del registro mensual del residente.
+    PDF A4 apaisado del registro mensual del residente.
+    Se genera en segundo plano (landing.pdfs): si ya está en el cache se
+    descarga; si no, se muestra una página de espera que se refresca sola.
     """
     if not _weasy_available:
         return HttpResponse("WeasyPrint no está instalado en el servidor.", status=500)
@@ -988,42 +1073,121 @@ def registro_mensual_pdf(request, residente_id):
         m = int(request.GET.get('month', hoy_local.month))
     except (TypeError, ValueError):
         y, m = hoy_local.year, hoy_local.month
+    if y < 2000 or y > 2100 or m < 1 or m > 12:
+        y, m = hoy_local.year, hoy_local.month
 
-    data = _build_registro_mensual_ctx(res, y, m)
+    clave, ruta, trabajo = solicitar_pdf(res, y, m, usuario=request.user,
+                                         reintentar=bool(request.GET.get('reintentar')))
+    if ruta:
+        etag = f'"{clave}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        resp = FileResponse(open(ruta, 'rb'), as_attachment=True,
+                            filename=nombre_archivo(res.id, y, m), content_type="application/pdf")
+        resp['ETag'] = etag
+        patch_cache_control(resp, private=True, max_age=3600)
+        return resp
+
+    estado_url = reverse('registro_mensual_pdf_estado', args=[clave])
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'estado': trabajo.estado, 'estado_url': estado_url}, status=202)
+    return render(request, 'residentes/registro_mensual_pdf_espera.html', {
+        'residente': res,
+        'year': y,
+        'month': m,
+        'trabajo': trabajo,
+        'estado_url': estado_url,
+    }, status=202)
 
-    ctx = {
-        "residente": res,
-        "year": y,
-        "month": m,
-        "days": data["days"],
-        "rows": data["rows"],
-        "generated_at": timezone.localdate(),
-    }
 
-    html_string = render_to_string("residentes/registro_mensual_pdf.html", ctx, request=request)
-
-    css = CSS(string="""
-      @page { size: A4 landscape; margin: 10mm; }
-      body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, 'Noto Sans', sans-serif; }
-      h3 { margin: 0 0 6px 0; }
-      .meta { color: #666; font-size: 11px; margin-bottom: 8px; }
-      table { width: 100%; border-collapse: collapse; font-size: 11px; table-layout: fixed; }
-      thead th { background: #eee; border: 1px solid #ccc; padding: 6px; }
-      td { border: 1px solid #ddd; padding: 4px 6px; text-align: center; word-wrap: break-word; }
-      td.label, th.label { text-align: left; font-weight: 600; width: 320px; }
-      thead { display: table-header-group; }
-      tr { page-break-inside: avoid; }
-      .legend { color:#555; font-size: 10px; margin-top: 6px; }
-    """)
-
-    base_url = request.build_absolute_uri('/')  # por si referencias estáticos o imágenes
-    pdf = HTML(string=html_string, base_url=base_url).write_pdf(stylesheets=[css])
-
-    filename = f"registro_{res.id}_{y}-{m:02d}.pdf"
-    resp = HttpResponse(pdf, content_type="application/pdf")
-    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-    return resp
+@login_required
+@admin_required
+def registro_mensual_pdf_estado(request, clave):
+    """Estado de un TrabajoPDF (JSON) y, si está listo, la URL de descarga."""
+    trabajo = get_object_or_404(TrabajoPDF, clave=clave)
+    data = {'estado': trabajo.estado, 'intentos': trabajo.intentos, 'error': trabajo.error}
+    if trabajo.estado == TrabajoPDF.Estado.LISTO:
+        data['url'] = (reverse('registro_mensual_pdf', args=[trabajo.residente_id])
+                       + f'?year={trabajo.year}&month={trabajo.month}')
+    return JsonResponse(data)
+
+
+
+@login_required
+@admin_required
+@require_POST
+def registro_exportar(request):
+    """Pide el ZIP con los PDF de todos los residentes de un mes (cierre de mes)."""
+    try:
+        y = int(request.POST.get('year'))
+        m = int(request.POST.get('month'))
+    except (TypeError, ValueError):
+        messages.error(request, 'Período inválido.')
+        return redirect('registro_mensual_todos')
+    if y < 2000 or y > 2100 or m < 1 or m > 12:
+        messages.error(request, 'Período inválido.')
+        return redirect('registro_mensual_todos')
 
+    exp = ExportacionRegistros.objects.create(year=y, month=m, solicitado_por=request.user)
+    lanzar_exportacion(exp)
+    return redirect('registro_exportacion', exportacion_id=exp.id)
+
+
+@login_required
+@admin_required
+def registro_exportacion(request, exportacion_id):
+    """Progreso de una exportación (HTML o JSON) y descarga del ZIP cuando está lista."""
+    Estado = ExportacionRegistros.Estado
+    exp = get_object_or_404(ExportacionRegistros, pk=exportacion_id)
+    listo = exp.estado == Estado.LISTO
+    if listo and not os.path.exists(exp.archivo):
+        # El ZIP ya no está en disco (limpieza del cache): se vuelve a armar
+        if ExportacionRegistros.objects.filter(pk=exp.pk, estado=Estado.LISTO).update(
+                estado=Estado.PENDIENTE, archivo='', hechos=0, desde_cache=0):
+            lanzar_exportacion(exp)
+        exp.refresh_from_db()
+        listo = False
+        if request.GET.get('descargar'):
+            messages.warning(request, 'El archivo ya no estaba disponible; se está generando de nuevo.')
+            return redirect('registro_exportacion', exportacion_id=exp.id)
+    elif exp.estado == Estado.PROCESANDO and exportaciones_pendientes().filter(pk=exp.pk).exists():
+        lanzar_exportacion(exp)   # el proceso que la armaba murió (lease vencido): se retoma
+    if listo and request.GET.get('descargar'):
+        return FileResponse(open(exp.archivo, 'rb'), as_attachment=True,
+                            filename=f"registros_{exp.year}-{exp.month:02d}.zip",
+                            content_type="application/zip")
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'estado': exp.estado, 'total': exp.total, 'hechos': exp.hechos,
+            'desde_cache': exp.desde_cache, 'error': exp.error,
+            'url': (reverse('registro_exportacion', args=[exp.id]) + '?descargar=1') if listo else None,
+        })
+    return render(request, 'residentes/registro_exportacion.html', {'exp': exp})
+
+
+@login_required
+@admin_required
+def historial_csv(request):
+    """
+    Historial de administraciones en CSV (streaming). Filtros por GET:
+    desde/hasta (YYYY-MM-DD, incluidas), residente, producto y cuidadora (ids).
+    """
+    g = request.GET
+    try:
+        desde = datetime.strptime(g['desde'], '%Y-%m-%d').date() if g.get('desde') else None
+        hasta = datetime.strptime(g['hasta'], '%Y-%m-%d').date() if g.get('hasta') else None
+        ids = {k: int(g[k]) if g.get(k) else None for k in ('residente', 'producto', 'cuidadora')}
+    except ValueError:
+        return HttpResponse('Filtros inválidos.', status=400, content_type='text/plain; charset=utf-8')
+
+    qs = historial(desde, hasta, **ids)
+    # BOM para que Excel reconozca UTF-8 (tildes y ñ)
+    lineas = chain(['\ufeff'], lineas_csv(qs))
+    resp = StreamingHttpResponse(lineas, content_type='text/csv; charset=utf-8')
+    sufijo = '_'.join(x.isoformat() for x in (desde, hasta) if x) or 'completo'
+    resp['Content-Disposition'] = f'attachment; filename="historial_{sufijo}.csv"'
+    return resp
 
 
 # =========================================================
@@ -1031,135 +1195,27 @@ def registro_mensual_pdf(request, residente_id):
 # =========================================================
 
 def _suggest_local(q, limit):
-    qs = (Producto.objects
-          .filter(Q(nombre__icontains=q) | Q(potencia__icontains=q))
-          .order_by('nombre', 'potencia')[:limit])
-    return [{
+    """Productos ya usados y, si falta, el catálogo importado (importar_catalogo)."""
+    out = [{
         "id": p.id,
         "label": f"{p.nombre} {p.potencia}".strip(),
         "source": "local",
         "nombre": p.nombre,
         "potencia": p.potencia or "",
         "forma": p.forma or "",
-    } for p in qs]
-
-# ---------- Proveedor: CIMA (AEMPS, ES) ----------
-def _suggest_cima(q, limit, timeout):
-    """
-    Usa /medicamentos?nombre=<q> (paginado). Si no hay resultados,
-    intenta /vmpp?nombre=<q> como fallback.
-    """
-    if not requests:
-        return []
-
-    headers = {"Accept": "application/json"}
-
-    # 1) /medicamentos?nombre=...  (¡OJO: plural!)
-    try:
-        r = requests.get(
-            "https://cima.aemps.es/cima/rest/medicamentos",
-            params={"nombre": q, "autorizados": 1, "pagina": 1},
-            timeout=timeout,
-            headers=headers,
-        )
-        items = []
-        if r.status_code == 200:
-            data = r.json() or []
-            # a veces viene como dict con 'resultados', otras como lista
-            if isinstance(data, dict):
-                items = data.get("resultados", []) or []
-            elif isinstance(data, list):
-                items = data
-
-        out, seen = [], set()
-        for it in items:
-            # en este listado suelen venir 'nombre' y 'nregistro'
-            nombre = (it.get("nombre") or "").strip()
-            nreg   = it.get("nregistro") or ""
-            if not nombre or nombre in seen:
-                continue
-            seen.add(nombre)
+    } for p in buscar_productos(q, limit)]
+    if len(out) < limit:
+        for m in buscar_catalogo(q, limit - len(out)):
+            pot = m.potencia if m.potencia and m.potencia.lower() not in m.nombre.lower() else ""
             out.append({
-                "id": f"cima:{nreg}",
-                "label": nombre,
-                "source": "cima",
-                "nombre": nombre,
-                "potencia": "",
-                "forma": "",
-            })
-            if len(out) >= limit:
-                return out
-        if out:
-            return out
-    except Exception:
-        pass
-
-    # 2) /vmpp?nombre=... (fallback por descripción clínica)
-    try:
-        r2 = requests.get(
-            "https://cima.aemps.es/cima/rest/vmpp",
-            params={"nombre": q, "pagina": 1},
-            timeout=timeout,
-            headers=headers,
-        )
-        if r2.status_code != 200:
-            return []
-        data2 = r2.json() or []
-        items2 = data2.get("resultados", []) if isinstance(data2, dict) else data2
-        out2, seen2 = [], set()
-        for it in items2:
-            nombre = (it.get("vmppDesc") or it.get("vmpDesc") or it.get("nombre") or "").strip()
-            _id    = it.get("id") or it.get("vmpp") or it.get("vmp") or ""
-            if not nombre or nombre in seen2:
-                continue
-            seen2.add(nombre)
-            out2.append({
-                "id": f"cima-vmpp:{_id}",
-                "label": nombre,
-                "source": "cima",
-                "nombre": nombre,
-                "potencia": "",
-                "forma": "",
+                "id": f"catalogo:{m.fuente.lower()}:{m.registro}",
+                "label": f"{m.nombre} {pot}".strip(),
+                "source": "catalogo",
+                "nombre": m.nombre,
+                "potencia": m.potencia,
+                "forma": m.forma,
             })
-            if len(out2) >= limit:
-                break
-        return out2
-    except Exception:
-        return []
-
-def _suggest_rxnorm(q, limit, timeout):
-    if not requests:
-        return []
-    # RxNorm: /REST/drugs.json?name=<q>
-    url = "https://rxnav.nlm.nih.gov/REST/drugs.json"
-    try:
-        r = requests.get(url, params={"name": q}, timeout=timeout, headers={"Accept": "application/json"})
-        if r.status_code != 200:
-            return []
-        data = r.json() or {}
-        props = []
-        for group in (data.get("drugGroup", {}) or {}).get("conceptGroup", []) or []:
-            props += group.get("conceptProperties", []) or []
-        seen, out = set(), []
-        for p in props:
-            label = p.get("name")
-            rxcui = p.get("rxcui")
-            if not label or label in seen:
-                continue
-            seen.add(label)
-            out.append({
-                "id": f"rxnorm:{rxcui}",
-                "label": label,
-                "source": "rxnorm",
-                "nombre": label,
-                "potencia": "",
-                "forma": "",
-            })
-            if len(out) >= limit:
-                break
-        return out
-    except Exception:
-        return []
+    return out
 
 @login_required
 def api_productos_suggest(request):
@@ -1170,6 +1226,9 @@ def api_productos_suggest(request):
     - RXNORM: NIH por nombre
     - HYBRID: combina (Local primero, luego externos)
     Forzar proveedor con ?provider=LOCAL|CIMA|RXNORM|HYBRID
+    Las respuestas externas salen del cache de landing.sugerencias y se
+    consultan a la vez con un plazo total (DRUG_SUGGEST_DEADLINE); lo que no
+    llega a tiempo se omite. meta.providers trae ms/estado/n por proveedor.
     """
     q = (request.GET.get('q') or '').strip()
     if not q:
@@ -1178,25 +1237,102 @@ def api_productos_suggest(request):
     provider = request.GET.get("provider") or getattr(settings, "DRUG_SUGGEST_PROVIDER", "HYBRID")
     limit    = int(getattr(settings, "DRUG_SUGGEST_LIMIT", 10))
     timeout  = int(getattr(settings, "DRUG_SUGGEST_TIMEOUT", 2))
+    plazo    = float(getattr(settings, "DRUG_SUGGEST_DEADLINE", 2.5))
 
     results, labels = [], set()
+    proveedores = {}  # nombre -> {"ms", "estado"[, "n"]}
 
     def add(items):
+        n = 0
         for it in items:
+            if len(results) >= limit:
+                break
             if it["label"] not in labels:
                 labels.add(it["label"])
                 results.append(it)
-                if len(results) >= limit:
-                    break
+                n += 1
+        return n
 
     if provider in ("LOCAL", "HYBRID"):
-        add(_suggest_local(q, limit))
-    if len(results) < limit and provider in ("CIMA", "HYBRID"):
-        add(_suggest_cima(q, limit, timeout))
-    if len(results) < limit and provider in ("RXNORM", "HYBRID"):
-        add(_suggest_rxnorm(q, limit, timeout))
+        t0 = time.monotonic()
+        n = add(_suggest_local(q, limit))
+        proveedores["local"] = {"ms": round((time.monotonic() - t0) * 1000, 1), "estado": "ok", "n": n}
+
+    # Externos a la vez, con un plazo total; el orden de `results` sigue siendo local, CIMA, RxNorm
+    externos = [p for p in ("cima", "rxnorm") if provider in (p.upper(), "HYBRID")]
+    if len(results) < limit and externos:
+        for nombre, items, info in sugerir_en_paralelo(externos, q, limit, timeout, plazo):
+            info["n"] = add(items)
+            proveedores[nombre] = info
+    else:
+        for nombre in externos:
+            proveedores[nombre] = {"ms": 0, "estado": "omitido", "n": 0}
+
+    return JsonResponse({"results": results, "meta": {"deadline_ms": int(plazo * 1000), "providers": proveedores}})
 
-    return JsonResponse({"results": results})
+
+# =========================================================
+# API de sincronización (app Android): landing.sincronizacion
+# =========================================================
+
+def _puede_usar_api(user):
+    return is_admin(user) or is_tens(user) or is_cuidadora(user) or is_doctor(user)
+
+
+@csrf_exempt
+@require_http_methods(["POST", "DELETE"])
+def api_token(request):
+    """
+    POST username + password (+ nombre del dispositivo) → {"token": ...}; la
+    clave se muestra solo esta vez. DELETE con "Authorization: Token ..." la revoca.
+    """
+    if request.method == "DELETE":
+        if not revocar(clave_de(request)):
+            return JsonResponse({"error": "Token inválido o ausente."}, status=401)
+        return HttpResponse(status=204)
+
+    user = authenticate(request, username=request.POST.get("username", ""),
+                        password=request.POST.get("password", ""))
+    if user is None:
+        return JsonResponse({"error": "Usuario o contraseña incorrectos."}, status=401)
+    if not _puede_usar_api(user):
+        return JsonResponse({"error": "Tu usuario no tiene acceso a la app."}, status=403)
+    return JsonResponse({"token": emitir(user, request.POST.get("nombre", ""))}, status=201)
+
+
+@require_http_methods(["GET"])
+@token_requerido
+def api_tablero(request):
+    """
+    Tablero de un día (?fecha=YYYY-MM-DD, def. hoy) con los residentes que ve
+    quien consulta. Con ?desde=<version> manda solo lo que cambió. El ETag es
+    la versión: si la app ya la tiene, responde 304 con una sola consulta.
+    """
+    user = request.user
+    if not _puede_usar_api(user):
+        return JsonResponse({"error": "Sin permiso."}, status=403)
+    try:
+        fecha = date.fromisoformat(request.GET["fecha"]) if request.GET.get("fecha") else timezone.localdate()
+    except ValueError:
+        return JsonResponse({"error": "fecha debe ser YYYY-MM-DD."}, status=400)
+    desde = request.GET.get("desde", "")
+    desde = int(desde) if desde.isdigit() else None
+
+    # Cualquier respuesta deja a la app en `version` con lo escrito hasta `cabeza`:
+    # basta con eso, el día y quién mira
+    v, primero, cabeza = sincronizacion.version()
+    partes = [str(v), str(cabeza), fecha.isoformat(), str(user.pk), ",".join(sorted(roles_de(user)))]
+    etag = '"%s"' % hashlib.sha256("|".join(partes).encode()).hexdigest()[:32]
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    resp = JsonResponse(sincronizacion.tablero(user, fecha, desde, v, primero, cabeza),
+                        json_dumps_params={"ensure_ascii": False})
+    resp["ETag"] = etag
+    patch_cache_control(resp, private=True, no_cache=True)
+    patch_vary_headers(resp, ["Authorization"])
+    return resp
 
 from datetime import datetime, time as dtime
 
@@ -1240,6 +1376,28 @@ ROLE_ORDER = {
     "DOCTOR": 1,
 }
 
+USUARIOS_POR_PAGINA = 50
+
+
+def _usuarios_con_rol():
+    """
+    Usuarios anotados con `rol` (su grupo de ROLE_CHOICES; si tuviera varios,
+    el de menor ROLE_ORDER) y `rol_orden`, ambos calculados en la consulta.
+    """
+    Pertenencia = User.groups.through
+    rango = Case(*[When(group__name=code, then=Value(n)) for code, n in ROLE_ORDER.items()],
+                 default=Value(99), output_field=IntegerField())
+    rol = (Pertenencia.objects
+           .filter(user=OuterRef("pk"), group__name__in=[code for code, _ in ROLE_CHOICES])
+           .annotate(rango=rango).order_by("rango")
+           .values("group__name")[:1])
+    return User.objects.annotate(
+        rol=Subquery(rol),
+        rol_orden=Case(*[When(rol=code, then=Value(n)) for code, n in ROLE_ORDER.items()],
+                       default=Value(99), output_field=IntegerField()),
+    )
+
+
 # Lista de usuarios (búsqueda + orden por rol)
 @login_required
 @admin_required
@@ -1247,8 +1405,8 @@ def user_list(request):
     q   = (request.GET.get("q") or "").strip()
     rol = (request.GET.get("rol") or "").strip()   # código de rol (nombre del grupo)
 
-    # Base queryset
-    users = User.objects.all()
+    # Base queryset: rol y su orden salen de la base (sin prefetch ni sort en memoria)
+    users = _usuarios_con_rol()
 
     # Búsqueda de texto
     if q:
@@ -1259,38 +1417,26 @@ def user_list(request):
             Q(email__icontains=q)
         )
 
-    # Filtro por rol (grupo)
+    # Filtro por rol (grupo); con EXISTS no hace falta distinct()
     if rol:
-        users = users.filter(groups__name=rol)
-
-    # Para no hacer mil consultas por usuario
-    users = users.prefetch_related("groups").distinct()
-
-    # Conjunto de códigos válidos de rol (ADMIN, TENS, CUIDADORA, DOCTOR)
-    known_codes = {code for code, _ in ROLE_CHOICES}
-
-    items = []
-    for u in users:
-        # buscamos el primer grupo cuyo nombre esté en ROLE_CHOICES
-        code = next((g.name for g in u.groups.all() if g.name in known_codes), None)
-        # guardamos (usuario, código_de_rol) -> el template se encarga de mostrar texto y color
-        items.append((u, code))
-
-    # Ordenar por rol (según ROLE_ORDER) y luego por nombre
-    items.sort(
-        key=lambda t: (
-            ROLE_ORDER.get(t[1], 99),                     # primero por rol
-            (t[0].first_name or "").lower(),             # luego por nombre
-            (t[0].last_name or "").lower(),              # luego apellido
-            t[0].username.lower(),                       # luego username
-        )
-    )
+        users = users.filter(Exists(
+            User.groups.through.objects.filter(user=OuterRef("pk"), group__name=rol)
+        ))
+
+    # Ordenar por rol (según ROLE_ORDER) y luego por nombre, apellido y username
+    users = users.order_by("rol_orden", Lower("first_name"), Lower("last_name"), Lower("username"), "pk")
+
+    page_obj = Paginator(users, USUARIOS_POR_PAGINA).get_page(request.GET.get("page"))
+    filtros = {k: v for k, v in (("q", q), ("rol", rol)) if v}
 
     return render(
         request,
         "users/user_list.html",
         {
-            "items": items,
+            # (usuario, código_de_rol) -> el template se encarga de mostrar texto y color
+            "items": [(u, u.rol) for u in page_obj.object_list],
+            "page_obj": page_obj,
+            "filtros": urlencode(filtros),
             "q": q,
             "rol": rol,                 # para marcar el option seleccionado
             "role_choices": ROLE_CHOICES,
@@ -1367,15 +1513,17 @@ from .forms import ProductoForm
 from .roles import admin_required
 from .models import Producto
 
+BUSQUEDA_LISTADO_MAX = 200  # resultados rankeados que se paginan en el listado
+
 @login_required
 @admin_required
 def medicamentos_list(request):
     q = (request.GET.get("q") or "").strip()
-    qs = Producto.objects.all().order_by("nombre", "potencia")
     if q:
-        qs = qs.filter(
-            Q(nombre__icontains=q) | Q(potencia__icontains=q) | Q(forma__icontains=q)
-        )
+        # Ordenados por relevancia (sin tildes, por prefijo y con errores de tipeo)
+        qs = buscar_productos(q, limit=BUSQUEDA_LISTADO_MAX)
+    else:
+        qs = Producto.objects.all().order_by("nombre", "potencia")
     paginator = Paginator(qs, 20)
     page = request.GET.get("page")
     page_obj = paginator.get_page(page)
@@ -1431,6 +1579,33 @@ def medicamento_delete(request, producto_id):
         "obj": p
     })
 
+
+@login_required
+@admin_required
+def proveedores_salud(request):
+    """Estado de CIMA/RxNorm: circuito, errores y latencias (de este proceso) y el cache."""
+    if request.method == "POST":
+        nombre = request.POST.get("reiniciar")
+        if nombre in circuitos:
+            circuitos[nombre].reiniciar()
+            messages.success(request, f"Circuito de {nombre.upper()} reiniciado.")
+        return redirect("proveedores_salud")
+
+    proveedores = salud()
+    ahora = timezone.now()
+    en_cache = dict(
+        SugerenciaExterna.objects.filter(expira_en__gt=ahora)
+        .values("proveedor").annotate(n=Count("id")).values_list("proveedor", "n")
+    )
+    for p in proveedores:
+        p["en_cache"] = en_cache.get(p["proveedor"], 0)
+    if "application/json" in request.headers.get("Accept", ""):
+        return JsonResponse({"pid": os.getpid(), "proveedores": proveedores})
+    return render(request, "medicamentos/proveedores_salud.html", {
+        "proveedores": proveedores,
+        "pid": os.getpid(),
+    })
+
 from datetime import datetime, time as dtime
 
 from django.contrib import messages
@@ -1443,7 +1618,6 @@ from django.views.decorators.http import require_http_methods
 
 from .roles import tens_or_admin_required, CUIDADORA_GROUP, TENS_GROUP
 from .models import DiaAsignacion, Asignacion, Administracion, Residente
-from .notifications import send_telegram_message  # importante
 
 
 from datetime import datetime, time as dtime
@@ -1452,7 +1626,6 @@ from django.utils import timezone
 @login_required
 @tens_or_admin_required
 def asignaciones_hoy(request):
-    _generar_eventos_hoy()
     hoy = timezone.localdate()
 
     # 🔽 Incluir CUIDADORA + TENS
@@ -1496,9 +1669,9 @@ from django.utils import timezone
 @tens_or_admin_required
 @transaction.atomic
 def asignaciones_generar(request):
-    _generar_eventos_hoy()
-
     hoy = timezone.localdate()
+    # POST: por si la tarea programada aún no corrió hoy (idempotente)
+    materializar_eventos(hoy, hoy)
     tz = timezone.get_current_timezone()
     inicio_dia = timezone.make_aware(datetime.combine(hoy, dtime.min), tz)
     fin_dia    = timezone.make_aware(datetime.combine(hoy, dtime.max), tz)
@@ -1558,10 +1731,11 @@ def asignaciones_generar(request):
         c = personal[i % len(personal)]
         bulk.append(Asignacion(fecha=hoy, cuidadora=c, residente=r))
     Asignacion.objects.bulk_create(bulk)
+    sincronizacion.registrar_asignaciones(hoy)  # bulk_create no dispara señales
 
     messages.success(request, f"Asignados {len(residentes)} residentes entre {len(personal)} personas.")
 
-    # Telegram (igual que lo tienes) ...
+    # Telegram: va al outbox, se entrega después del commit
     try:
         from collections import defaultdict
         asigns = (
@@ -1582,11 +1756,9 @@ def asignaciones_generar(request):
                 lineas.append(f"   • {nom}")
             lineas.append("")
         texto = "\n".join(lineas)
-        ok, detail = send_telegram_message(texto, return_detail=True)
-        if not ok:
-            messages.error(request, f"Asignación creada, pero no se pudo enviar a Telegram: {detail}")
+        encolar_mensaje(texto)
     except Exception as e:
-        messages.warning(request, f"Asignación creada. No se pudo enviar el aviso a Telegram ({e}).")
+        messages.warning(request, f"Asignación creada. No se pudo encolar el aviso a Telegram ({e}).")
 
     return redirect('asignaciones_hoy')
 
@@ -1636,11 +1808,8 @@ def asignaciones_avisar_meds(request):
             "retiro en Enfermería. Por favor pasar a buscar y administrar. Gracias."
         )
 
-    ok, detail = send_telegram_message(texto, return_detail=True)
-    if ok:
-        messages.success(request, "Aviso enviado a Telegram.")
-    else:
-        messages.error(request, f"No se pudo enviar el aviso a Telegram: {detail}")
+    encolar_mensaje(texto)
+    messages.success(request, "Aviso en cola para Telegram.")
     return redirect('asignaciones_hoy')
 
 
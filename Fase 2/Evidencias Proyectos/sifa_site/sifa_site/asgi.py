@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+El tablero en vivo de administraciones (landing.tablero) usa flujos SSE de
+larga duración: con ASGI (p.ej. ``uvicorn sifa_site.asgi:application``) cada
+conexión es una corrutina y no ocupa un hilo del servidor.
 """
 
 import os
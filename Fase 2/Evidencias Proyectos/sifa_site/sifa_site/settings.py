@@ -63,6 +63,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'landing.context_processors.roles',
             ],
         },
     },
@@ -74,12 +75,49 @@ WSGI_APPLICATION = 'sifa_site.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite por defecto (desarrollo). En producción: SIFA_DB=postgres y las POSTGRES_*.
+# Los tests corren contra un Postgres local con la misma variable:
+#   SIFA_DB=postgres python manage.py test
+if os.getenv("SIFA_DB", "sqlite") == "postgres":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv("POSTGRES_DB", "sifa"),
+            'USER': os.getenv("POSTGRES_USER", "sifa"),
+            'PASSWORD': os.getenv("POSTGRES_PASSWORD", ""),
+            'HOST': os.getenv("POSTGRES_HOST", "localhost"),
+            'PORT': os.getenv("POSTGRES_PORT", "5432"),
+            # Conexiones persistentes: evita reconectar en cada request de la ronda
+            'CONN_MAX_AGE': int(os.getenv("SIFA_DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+            'TEST': {'NAME': os.getenv("POSTGRES_TEST_DB", "test_sifa")},
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Varias cuidadoras marcan a la vez: esperar el lock en vez de fallar
+            'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
+            # Base de tests en archivo para que los tests con hilos compartan datos
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+# Cache compartido de roles (landing.roles), opcional: con SIFA_REDIS_URL los
+# roles se guardan en Redis además de la memoria de cada proceso (requiere el
+# paquete redis).
+SIFA_ROLES_CACHE = None
+if os.getenv("SIFA_REDIS_URL"):
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'compartido': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ["SIFA_REDIS_URL"],
+        },
+    }
+    SIFA_ROLES_CACHE = 'compartido'
 
 
 # Password validation
@@ -145,9 +183,62 @@ LOGOUT_REDIRECT_URL = 'home'
 DRUG_SUGGEST_PROVIDER = "HYBRID"   # "LOCAL" | "CIMA" | "RXNORM" | "HYBRID"
 DRUG_SUGGEST_LIMIT = 10            # tope de sugerencias
 DRUG_SUGGEST_TIMEOUT = 4           # segundos de timeout para APIs externas
+DRUG_SUGGEST_DEADLINE = 2.5        # segundos máximos de espera por todos los externos juntos
+# Cache de sugerencias externas (landing.sugerencias): en el proceso + tabla SugerenciaExterna
+SIFA_SUGERENCIAS_TTL = int(os.getenv("SIFA_SUGERENCIAS_TTL", str(24 * 3600)))     # con resultados
+SIFA_SUGERENCIAS_TTL_VACIO = int(os.getenv("SIFA_SUGERENCIAS_TTL_VACIO", "900"))  # sin resultados
+SIFA_SUGERENCIAS_LRU = 2000        # entradas en memoria por proceso
+SIFA_SUGERENCIAS_HILOS = 8         # hilos para consultar proveedores en paralelo (sin cola: si están todos ocupados se omite)
+# Circuit breaker por proveedor: tras N fallos/lentas seguidas no se llama durante la espera
+SIFA_CIRCUITO_FALLOS = 3
+SIFA_CIRCUITO_LENTO_MS = 2000      # más que esto cuenta como falla
+SIFA_CIRCUITO_ESPERA = 30          # segundos abierto (se duplica si la prueba falla)
+SIFA_CIRCUITO_ESPERA_MAX = 600
+
+# Tablero en vivo de administraciones (landing.tablero), por SSE.
+# Servir con ASGI para que un solo lector por proceso atienda a todos: uvicorn sifa_site.asgi:application
+SIFA_TABLERO_INTERVALO = 1.0       # segundos entre lecturas de CambioAdministracion
+SIFA_TABLERO_DURACION = 300        # segundos por conexión; el navegador se reconecta solo
+SIFA_TABLERO_RETENCION = 24 * 3600 # se purgan los cambios más viejos
+SIFA_TABLERO_ESPERA = 120          # segundos que se espera un id saltado; debe superar la transacción de escritura más larga
+SIFA_TABLERO_SONDEO = 5            # WSGI: segundos entre consultas del navegador (no se deja la conexión abierta)
+
+# API de sincronización para la app Android (landing.sincronizacion): /api/v1/tablero/
+SIFA_SYNC_RETENCION = 7 * 24 * 3600  # un cursor más viejo recibe el tablero completo
+SIFA_SYNC_MARGEN = 60                # segundos; debe superar la transacción de escritura más larga (agenda en bloque)
+
+# Agenda de administraciones (landing.agenda)
+# Programar cada noche / cada hora: python manage.py materializar_agenda
+SIFA_AGENDA_HORIZONTE_DIAS = int(os.getenv("SIFA_AGENDA_HORIZONTE_DIAS", "2"))  # hoy + N días
+SIFA_AGENDA_BACKFILL_DIAS = int(os.getenv("SIFA_AGENDA_BACKFILL_DIAS", "7"))    # huecos hacia atrás
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "8455400576:AAFsXnUvLKSNbe4sHKVj7JllDIEQaVoVeqQ")
 TELEGRAM_CHAT_ID   = os.getenv("TELEGRAM_CHAT_ID", "-5084611174") 
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")  # o landing.telegram_fake
+TELEGRAM_TIMEOUT = 8
+TELEGRAM_RATE_POR_CHAT = 1.0       # mensajes/seg por chat (token bucket)
+TELEGRAM_RAFAGA_POR_CHAT = 3
+
+# Outbox de notificaciones (landing.notifications)
+# Worker aparte: python manage.py enviar_notificaciones --loop
+SIFA_OUTBOX_HILO = os.getenv("SIFA_OUTBOX_HILO", "1") == "1"   # además, hilo de entrega en el proceso web
+SIFA_OUTBOX_MAX_INTENTOS = 6       # luego queda DESCARTADO
+SIFA_OUTBOX_BACKOFF_BASE = 30      # segundos, se duplica por intento
+SIFA_OUTBOX_BACKOFF_MAX = 3600
+
+# Alertas de stock crítico: 0 = un mensaje por orden al momento.
+# > 0 = resumen cada N segundos; o por turnos, p.ej. ["08:00", "20:00"].
+SIFA_ALERTAS_VENTANA = int(os.getenv("SIFA_ALERTAS_VENTANA", "300"))
+SIFA_ALERTAS_TURNOS = []
+SIFA_ALERTAS_AGRUPAR = "RESIDENTE"   # "RESIDENTE" | "PRODUCTO"
+
+# PDFs del registro mensual (landing.pdfs): cola + cache en disco por hash de contenido
+# Worker aparte: python manage.py generar_pdfs --loop
+SIFA_PDF_DIR = Path(os.getenv("SIFA_PDF_DIR", BASE_DIR / "pdf_cache"))
+SIFA_PDF_HILO = os.getenv("SIFA_PDF_HILO", "1") == "1"   # además, hilo de render en el proceso web
+SIFA_PDF_MAX_INTENTOS = 3
+SIFA_PDF_PROCESOS = int(os.getenv("SIFA_PDF_PROCESOS", "0"))   # exportación ZIP; 0 = núcleos disponibles
+SIFA_EXPORTACION_LEASE = 600      # segundos sin avance para dar por muerta una exportación y retomarla
 
 # DEBUG = False
 # ALLOWED_HOSTS = ["Vixoo.pythonanywhere.com"]